@@ -0,0 +1,107 @@
+"""Geohash cells and aggregate increments for incident hotspot analytics.
+
+Two aggregate tables are kept next to Request and updated in the same transaction as
+each insert or delete (see the after_flush listener in app.py), so analytics queries
+read a few aggregate rows and never scan Request:
+
+- cell counts per (period, precision, species, cell), where period is 'all' or a month
+  ('YYYY-MM') and cell is the request's geohash at each configured precision
+- daily counts per (species, region, day), where region is the geohash at the region
+  precision, or NO_LOCATION for requests without coordinates
+
+Every request is also counted under species ALL, and in the daily table under region
+ALL, so totals are read from one row per cell or day instead of summed over species
+and regions. The key order matches the tables' primary keys, so each query is a range
+scan of its index.
+
+Geohash cells at precision 3/4/5/6 are about 156x156 / 39x20 / 4.9x4.9 / 1.2x0.6 km.
+"""
+from collections import Counter
+from functools import lru_cache
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+MAX_PRECISION = 12
+ALL = ''  # species or region of the totals rows; a missing species is counted as 'Unknown'
+NO_LOCATION = '-'
+
+
+def geohash(lat, lon, precision):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value *= 2
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+@lru_cache(maxsize=1 << 17)
+def cell_bounds(cell):
+    """(south, west, north, east) of a geohash cell; raises ValueError for an invalid one."""
+    value = 0
+    for char in cell:
+        if char not in _DECODE:
+            raise ValueError(f'Invalid geohash cell: {cell}')
+        value = value << 5 | _DECODE[char]
+    # Bits alternate longitude, latitude, ... from the most significant one
+    bits = 5 * len(cell)
+    lat = lon = 0
+    for position in range(bits - 1, -1, -1):
+        if (bits - 1 - position) % 2:
+            lat = lat << 1 | value >> position & 1
+        else:
+            lon = lon << 1 | value >> position & 1
+    lat_size = 180.0 / (1 << bits // 2)
+    lon_size = 360.0 / (1 << (bits + 1) // 2)
+    south, west = -90.0 + lat * lat_size, -180.0 + lon * lon_size
+    return south, west, south + lat_size, west + lon_size
+
+
+def cell_center(bounds):
+    south, west, north, east = bounds
+    return (south + north) / 2, (west + east) / 2
+
+
+def aggregate_increments(rows, precisions, region_precision):
+    """Increments for the cell and daily tables from ``(timestamp, lat, lon, species, delta)`` rows.
+
+    Returns two Counters keyed like the tables' primary keys; ``delta`` is 1 for an
+    inserted request and -1 for a deleted one.
+    """
+    cells, days = Counter(), Counter()
+    depth = max(max(precisions, default=0), region_precision)
+    for timestamp, lat, lon, species, delta in rows:
+        species = species or 'Unknown'
+        if lat is not None and lon is not None:
+            code = geohash(lat, lon, depth)
+            region = code[:region_precision]
+            month = timestamp.strftime('%Y-%m')
+            for precision in precisions:
+                for period in ('all', month):
+                    cells[(period, precision, species, code[:precision])] += delta
+                    cells[(period, precision, ALL, code[:precision])] += delta
+        else:
+            region = NO_LOCATION
+        day = timestamp.date()
+        for key in ((species, region), (species, ALL), (ALL, region), (ALL, ALL)):
+            days[(*key, day)] += delta
+    return cells, days
+
+
+def parse_precisions(value):
+    # '3,4,5,6' -> [3, 4, 5, 6]
+    precisions = sorted({int(p) for p in value.split(',') if p.strip()})
+    if any(not 1 <= p <= MAX_PRECISION for p in precisions):
+        raise ValueError(f'Geohash precisions must be between 1 and {MAX_PRECISION}')
+    return precisions
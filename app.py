@@ -1,33 +1,180 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from sqlalchemy import event, func, and_, or_, update, select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
 from werkzeug.security import generate_password_hash, check_password_hash
-import torch
-import torch.nn as nn
-from efficientnet_pytorch import EfficientNet
-from torchvision import transforms
-from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
 import io
+import os
+import sys
+import sqlite3
+import json
 import math
-from datetime import datetime, timezone, timedelta
+import base64
+import itertools
+import functools
+import threading
+import time
+import zipfile
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime, date, timezone, timedelta
+from collections import Counter
 import logging
-import timm
+from ml import ModelRuntime, EngineOverloaded, IMAGE_EXTENSIONS, load_stack
+from geo import haversine, FacilityIndex
+from prediction_cache import PredictionCache, content_key, perceptual_key
+import prediction_modes
+from uploads import UploadRequest, ImageRejected, parse_formats, reopen
+from incident_feed import IncidentFeed, format_sse
+from ingest import RequestIngestor, IngestOverloaded, parse_submission
+from storage import normalize_database_url, engine_options, add_counts
+from analytics import aggregate_increments, parse_precisions, cell_bounds, cell_center, ALL
+from directory_cache import VersionWatcher, snap_to_cell, make_etag
+from routing import RoadGraph, RoadRouter
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # Configurations
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///snakesafe.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.environ.get('DATABASE_URL', 'sqlite:///snakesafe.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool for server databases (PostgreSQL); SQLite only uses DB_POOL_PRE_PING
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# Server-side limit per SQL statement on PostgreSQL, 0 to disable
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 10000))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 app.config['SECRET_KEY'] = 'a-very-long-random-string-1234567890'  # Replace with secure key in production
+# Micro-batching for /predict: dispatch a batch at this many images or after this many ms
+app.config['INFERENCE_MAX_BATCH_SIZE'] = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 16))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10))
+app.config['INFERENCE_QUEUE_SIZE'] = int(os.environ.get('INFERENCE_QUEUE_SIZE', 256))
+app.config['INFERENCE_TIMEOUT'] = float(os.environ.get('INFERENCE_TIMEOUT', 30))
+app.config['MODEL_PATH'] = os.environ.get('MODEL_PATH', 'models/efficientv2sv2.pth')
+# Inference backend: eager, int8_dynamic, int8_static, torchscript, compile or onnx
+app.config['MODEL_BACKEND'] = os.environ.get('MODEL_BACKEND', 'eager')
+app.config['MODEL_CALIBRATION_DIR'] = os.environ.get('MODEL_CALIBRATION_DIR', '')
+app.config['MODEL_ONNX_PATH'] = os.environ.get('MODEL_ONNX_PATH', 'models/efficientv2sv2.onnx')
+# Run the model in this many worker processes instead of in-process (0); each gets its share of the cores
+app.config['MODEL_WORKERS'] = int(os.environ.get('MODEL_WORKERS', 0))
+app.config['MODEL_WORKER_THREADS'] = int(os.environ.get('MODEL_WORKER_THREADS', 0))  # 0 = one per core in the worker's group
+app.config['MODEL_WORKER_PIN_CORES'] = os.environ.get('MODEL_WORKER_PIN_CORES', '1') == '1'
+# Distilled student for PREDICT_MODE=tiered (see distill_model.py); empty disables it
+app.config['MODEL_STUDENT_PATH'] = os.environ.get('MODEL_STUDENT_PATH', '')
+app.config['MODEL_STUDENT_ARCH'] = os.environ.get('MODEL_STUDENT_ARCH', 'mobilenetv3_large_100')
+app.config['MODEL_STUDENT_IMAGE_SIZE'] = int(os.environ.get('MODEL_STUDENT_IMAGE_SIZE', 224))
+# Prediction cache keyed on upload bytes; tied to the weights file so retraining invalidates it
+app.config['PREDICTION_CACHE_ENABLED'] = os.environ.get('PREDICTION_CACHE_ENABLED', '1') == '1'
+app.config['PREDICTION_CACHE_MAX_ENTRIES'] = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 4096))
+app.config['PREDICTION_CACHE_MAX_MB'] = float(os.environ.get('PREDICTION_CACHE_MAX_MB', 16))
+app.config['PREDICTION_CACHE_TTL'] = int(os.environ.get('PREDICTION_CACHE_TTL', 7 * 24 * 3600))
+app.config['PREDICTION_CACHE_DISK_PATH'] = os.environ.get('PREDICTION_CACHE_DISK_PATH', '')  # empty disables the disk tier
+app.config['PREDICTION_CACHE_PERCEPTUAL'] = os.environ.get('PREDICTION_CACHE_PERCEPTUAL', '0') == '1'
+# /predict mode: fast (one pass), tta (always 8 views), adaptive (8 views only when uncertain)
+# or tiered (student first, full model when it is unsure or sees a venomous species); ?mode= overrides
+app.config['PREDICT_MODE'] = os.environ.get('PREDICT_MODE', 'fast')
+# adaptive: escalate below this top-1 confidence (0-1), or below the danger threshold when the top 2 differ in danger level
+app.config['PREDICT_ADAPTIVE_THRESHOLD'] = float(os.environ.get('PREDICT_ADAPTIVE_THRESHOLD', 0.9))
+app.config['PREDICT_ADAPTIVE_DANGER_THRESHOLD'] = float(os.environ.get('PREDICT_ADAPTIVE_DANGER_THRESHOLD', 0.99))
+# tiered: the student answers alone only at or above this confidence (0-1)
+app.config['PREDICT_TIERED_THRESHOLD'] = float(os.environ.get('PREDICT_TIERED_THRESHOLD', 0.9))
+# Multi-image classification limits for /api/predict_batch
+app.config['PREDICT_BATCH_MAX_IMAGES'] = int(os.environ.get('PREDICT_BATCH_MAX_IMAGES', 64))
+app.config['PREDICT_BATCH_MAX_IMAGE_BYTES'] = int(os.environ.get('PREDICT_BATCH_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+# Total for one /api/predict_batch request (0 = no cap): the request body, and the images unpacked from a zip
+app.config['PREDICT_BATCH_MAX_UPLOAD_BYTES'] = int(os.environ.get('PREDICT_BATCH_MAX_UPLOAD_BYTES', 100 * 1024 * 1024))
+# /predict request body cap in bytes, refused with 413 before it is read (0 = no cap)
+app.config['PREDICT_MAX_UPLOAD_BYTES'] = int(os.environ.get('PREDICT_MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+# Decode guards for /predict and /api/predict_batch: pixel budget after JPEG draft scaling (0 = none)
+# and accepted Pillow formats (empty = any; JPEG covers MPO); checked from the image header
+app.config['PREDICT_MAX_PIXELS'] = int(os.environ.get('PREDICT_MAX_PIXELS', 24_000_000))
+app.config['PREDICT_IMAGE_FORMATS'] = parse_formats(os.environ.get('PREDICT_IMAGE_FORMATS', 'JPEG,PNG,WEBP,BMP,GIF'))
+# Uploaded files larger than this are spooled to a temporary file instead of kept in memory
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_BYTES', 512 * 1024))
+# Threads used to decode and normalize images for batched preprocessing
+app.config['PREPROCESS_WORKERS'] = int(os.environ.get('PREPROCESS_WORKERS', 4))
+# Page size for the dashboard and /api/requests
+app.config['REQUESTS_PAGE_SIZE'] = int(os.environ.get('REQUESTS_PAGE_SIZE', 50))
+app.config['REQUESTS_MAX_PAGE_SIZE'] = int(os.environ.get('REQUESTS_MAX_PAGE_SIZE', 500))
+# Live dashboard feed: events kept for resuming, long-poll wait and SSE heartbeat in seconds
+app.config['FEED_MAX_EVENTS'] = int(os.environ.get('FEED_MAX_EVENTS', 1000))
+app.config['FEED_POLL_TIMEOUT'] = float(os.environ.get('FEED_POLL_TIMEOUT', 25))
+app.config['FEED_HEARTBEAT'] = float(os.environ.get('FEED_HEARTBEAT', 15))
+# Seconds between reads of new feed events in each app process; a process's own commits are read at once
+app.config['FEED_POLL_INTERVAL'] = float(os.environ.get('FEED_POLL_INTERVAL', 1.0))
+# Server-Sent Events for the live dashboard (otherwise it long-polls). An open stream waits inside its request,
+# so it is only served under a gevent worker (gunicorn -k gevent), where a waiting client costs a greenlet
+app.config['FEED_SSE_ENABLED'] = os.environ.get('FEED_SSE_ENABLED', '0') == '1'
+# Hotspot analytics: geohash precisions kept for heatmaps and the precision of the regions used for
+# daily series; changing either needs `python rebuild_analytics.py`
+app.config['ANALYTICS_PRECISIONS'] = parse_precisions(os.environ.get('ANALYTICS_PRECISIONS', '3,4,5,6'))
+app.config['ANALYTICS_REGION_PRECISION'] = int(os.environ.get('ANALYTICS_REGION_PRECISION', 4))
+app.config['ANALYTICS_MAX_DAYS'] = int(os.environ.get('ANALYTICS_MAX_DAYS', 3 * 366))
+# Most heatmap cells returned per response (the busiest ones; totals still cover every cell)
+app.config['ANALYTICS_MAX_CELLS'] = int(os.environ.get('ANALYTICS_MAX_CELLS', 5000))
+# SQLite tuning: WAL lets readers run alongside the writer; synchronous=FULL makes each commit durable
+app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'FULL').upper()
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# /submit_request group commit: rows queued within the window are inserted in one transaction
+app.config['INGEST_BATCHING'] = os.environ.get('INGEST_BATCHING', '1') == '1'
+app.config['INGEST_MAX_BATCH_SIZE'] = int(os.environ.get('INGEST_MAX_BATCH_SIZE', 64))
+app.config['INGEST_MAX_WAIT_MS'] = float(os.environ.get('INGEST_MAX_WAIT_MS', 5))
+app.config['INGEST_QUEUE_SIZE'] = int(os.environ.get('INGEST_QUEUE_SIZE', 1024))
+app.config['INGEST_TIMEOUT'] = float(os.environ.get('INGEST_TIMEOUT', 10))
+# /api/hospitals and /api/rescuers: responses are computed for the centre of a lat/lon grid cell
+# (FACILITY_CACHE_CELL_DEG=0 uses exact coordinates) and cached until the table changes
+app.config['FACILITY_CACHE_CELL_DEG'] = float(os.environ.get('FACILITY_CACHE_CELL_DEG', 0.01))
+app.config['FACILITY_CACHE_ENTRIES'] = int(os.environ.get('FACILITY_CACHE_ENTRIES', 4096))
+app.config['FACILITY_CACHE_MAX_AGE'] = int(os.environ.get('FACILITY_CACHE_MAX_AGE', 300))
+# How often each process checks the database for facility changes made by other processes
+app.config['FACILITY_VERSION_CHECK_SECONDS'] = float(os.environ.get('FACILITY_VERSION_CHECK_SECONDS', 5))
+# Travel-time ranking (rank=time) over an offline road graph built by build_road_graph.py
+app.config['ROAD_GRAPH_PATH'] = os.environ.get('ROAD_GRAPH_PATH', '')
+app.config['ROUTING_MAX_MINUTES'] = float(os.environ.get('ROUTING_MAX_MINUTES', 240))
+app.config['ROUTING_ACCESS_SPEED_KMH'] = float(os.environ.get('ROUTING_ACCESS_SPEED_KMH', 15))
+app.config['ROUTING_TREE_CACHE'] = int(os.environ.get('ROUTING_TREE_CACHE', 1024))
+# Upper bound on incident points accepted by /api/distance_matrix in one call
+app.config['DISTANCE_MATRIX_MAX_POINTS'] = int(os.environ.get('DISTANCE_MATRIX_MAX_POINTS', 10000))
+# Prometheus text-format metrics at /metrics
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Requests slower than this are written to PROFILE_DIR as collapsed stacks; 0 disables the profiler
+app.config['PROFILE_SLOW_REQUESTS_MS'] = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILE_SAMPLE_INTERVAL_MS'] = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    if app.config['SQLITE_SYNCHRONOUS'] not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {app.config['SQLITE_SYNCHRONOUS']}")
+    cursor = dbapi_connection.cursor()
+    if app.config['SQLITE_WAL']:
+        cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+    cursor.close()
+
 # Define Nepal Time Zone (UTC+5:45)
 npt_tz = timezone(timedelta(hours=5, minutes=45))
 
+def npt_now():
+    # Timestamps are stored as naive Nepal time; an aware value would be shifted by PostgreSQL
+    return datetime.now(npt_tz).replace(tzinfo=None)
+
 # Flask-Login Setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -37,7 +184,8 @@ login_manager.login_view = 'login'
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    # Werkzeug's scrypt hashes are longer than 128 characters; PostgreSQL enforces the length
+    password_hash = db.Column(db.String(256), nullable=False)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -68,7 +216,44 @@ class Request(db.Model):
     request_type = db.Column(db.String(20), default='hospital')
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
-    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(npt_tz), nullable=False)
+    timestamp = db.Column(db.DateTime, default=npt_now, nullable=False)
+
+    # Keyset pagination walks (timestamp, id); the filtered variants keep the same order
+    __table_args__ = (
+        db.Index('ix_request_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_request_type_timestamp_id', 'request_type', 'timestamp', 'id'),
+        db.Index('ix_request_species_timestamp_id', 'snake_species', 'timestamp', 'id'),
+        db.Index('ix_request_lat_lon', 'latitude', 'longitude'),
+    )
+
+# Hotspot aggregates over Request (see analytics.py), kept current by _update_request_stats
+class RequestCellStat(db.Model):
+    period = db.Column(db.String(7), primary_key=True)  # 'all' or 'YYYY-MM'
+    precision = db.Column(db.Integer, primary_key=True)
+    species = db.Column(db.String(100), primary_key=True)  # '' (analytics.ALL) for all species
+    cell = db.Column(db.String(12), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class RequestDailyStat(db.Model):
+    species = db.Column(db.String(100), primary_key=True)
+    region = db.Column(db.String(12), primary_key=True)  # also analytics.ALL and NO_LOCATION
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class DirectoryVersion(db.Model):
+    # Change counter per facility table, bumped in the same transaction as the change itself
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RequestEvent(db.Model):
+    # Live feed events, written with the change they describe; every app process reads them (see incident_feed)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'created' or 'deleted'
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Ids are never reused, so a cursor cannot point at a different event after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
 
 # Snake Information
 SNAKE_INFO = {
@@ -231,36 +416,409 @@ SNAKE_INFO = {
 }
 
 snake_classes = list(SNAKE_INFO.keys())
+danger_levels = [SNAKE_INFO[species]['danger'] for species in snake_classes]
+
+def describe_prediction(species, confidence):
+    snake_info = SNAKE_INFO.get(species, {
+        'common_name': 'Unknown',
+        'nepali_name': 'Unknown',
+        'danger': 'Unknown',
+        'habitat': 'Unknown'
+    })
+    return {
+        'species': species,
+        'confidence': confidence * 100,
+        'common_name': snake_info['common_name'],
+        'nepali_name': snake_info['nepali_name'],
+        'danger': snake_info['danger'],
+        'habitat': snake_info['habitat']
+    }
+
+def top_k_predictions(probabilities, k):
+    confidences, indices = probabilities.topk(min(k, len(snake_classes)))
+    return [describe_prediction(snake_classes[i], c) for c, i in zip(confidences.tolist(), indices.tolist())]
+
+# The ML stack (torch, timm, model weights) loads in a background thread on the first request,
+# so non-ML routes and the DB scripts never wait for it
+def _load_ml_stack():
+    stack = load_stack(app.config, len(snake_classes))
+    if prediction_cache is not None:
+        # Keyed by the weights that were loaded, not whatever file is on disk now
+        prediction_cache.set_model_version(stack.version)
+    return stack
+
+ml_runtime = ModelRuntime(_load_ml_stack)
+
+@app.before_request
+def _start_model_warmup():
+    ml_runtime.start()
+
+def _model_unavailable():
+    if ml_runtime.state == 'failed':
+        return jsonify({'error': 'Model failed to load', 'status': 'failed'}), 503
+    return jsonify({'error': 'Model is warming up, please try again shortly', 'status': 'warming_up'}), 503, {'Retry-After': '5'}
+
+prediction_cache = None
+if app.config['PREDICTION_CACHE_ENABLED']:
+    prediction_cache = PredictionCache(
+        max_entries=app.config['PREDICTION_CACHE_MAX_ENTRIES'],
+        max_bytes=int(app.config['PREDICTION_CACHE_MAX_MB'] * 1024 * 1024),
+        ttl_seconds=app.config['PREDICTION_CACHE_TTL'],
+        disk_path=app.config['PREDICTION_CACHE_DISK_PATH'] or None
+    )
+
+# In-memory spatial indexes over the facility tables
+def _load_facilities(model_cls):
+    return [
+        {
+            'id': f.id,
+            'name': f.name,
+            'phone': f.phone,
+            'latitude': f.latitude,
+            'longitude': f.longitude
+        }
+        for f in model_cls.query.all()
+    ]
+
+facility_indexes = {
+    Hospital.__tablename__: FacilityIndex(lambda: _load_facilities(Hospital)),
+    Rescuer.__tablename__: FacilityIndex(lambda: _load_facilities(Rescuer))
+}
+
+# Rebuild the indexes once changes to Hospital or Rescuer rows are committed
+@event.listens_for(OrmSession, 'after_flush')
+def _track_facility_changes(session, flush_context):
+    changed = {
+        obj.__tablename__ for obj in itertools.chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, (Hospital, Rescuer))
+    }
+    if changed:
+        session.info.setdefault('changed_facility_tables', set()).update(changed)
+        # Lets other processes (workers, populate_db.py) see the change through DirectoryVersion
+        session.connection().execute(
+            update(DirectoryVersion)
+            .where(DirectoryVersion.table_name.in_(changed))
+            .values(version=DirectoryVersion.version + 1, updated_at=datetime.utcnow())
+        )
+
+@event.listens_for(OrmSession, 'after_commit')
+def _invalidate_facility_indexes(session):
+    changed = session.info.pop('changed_facility_tables', ())
+    for table in changed:
+        facility_indexes[table].invalidate()
+    if changed:
+        directory_versions.expire()
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_facility_changes(session):
+    session.info.pop('changed_facility_tables', None)
+
+def _load_directory_versions():
+    return {row.table_name: (row.version, row.updated_at) for row in DirectoryVersion.query.all()}
+
+def _facility_table_changed(table):
+    facility_indexes[table].invalidate()
+    _facility_payload.cache_clear()
+
+directory_versions = VersionWatcher(
+    _load_directory_versions,
+    _facility_table_changed,
+    interval=app.config['FACILITY_VERSION_CHECK_SECONDS']
+)
+
+def _facilities(table):
+    # Picks up changes committed by other processes before the in-memory index is used
+    directory_versions.get(table)
+    return facility_indexes[table]
+
+_road_router = None
+_road_router_lock = threading.Lock()
+
+def road_router():
+    # Loaded on first use so startup stays fast; None when no graph is configured
+    global _road_router
+    if not app.config['ROAD_GRAPH_PATH']:
+        return None
+    if _road_router is None:
+        with _road_router_lock:
+            if _road_router is None:
+                _road_router = RoadRouter(
+                    RoadGraph.load(app.config['ROAD_GRAPH_PATH']),
+                    max_minutes=app.config['ROUTING_MAX_MINUTES'],
+                    access_speed_kmh=app.config['ROUTING_ACCESS_SPEED_KMH'],
+                    cache_size=app.config['ROUTING_TREE_CACHE']
+                )
+    return _road_router
+
+def ranked_facilities(table, lat, lon, k=None, radius_km=None, rank='distance'):
+    facilities = _facilities(table)
+    if rank == 'distance':
+        return facilities.nearest(lat, lon, k=k, radius_km=radius_km)
+    router = road_router()
+    if router is None:
+        raise ValueError('rank=time needs a road graph (ROAD_GRAPH_PATH)')
+    # Travel times are computed for every facility so the cached search serves any k or radius
+    ranked = router.rank((table, facilities.version), facilities.nearest(lat, lon), lat, lon)
+    if radius_km is not None:
+        ranked = [r for r in ranked if r['distance'] <= radius_km]
+    return ranked[:k] if k else ranked
+
+@functools.lru_cache(maxsize=app.config['FACILITY_CACHE_ENTRIES'])
+def _facility_payload(table, version, lat, lon, k, radius_km, rank):
+    # version is only part of the cache key, so entries for an older table state are never reused
+    with timed_stage('rank'):
+        results = ranked_facilities(table, lat, lon, k=k, radius_km=radius_km, rank=rank)
+    with timed_stage('serialize'):
+        return app.json.dumps({f'{table}s': results})
+
+def _facility_response(table):
+    # Shared by /api/hospitals and /api/rescuers: cached body, ETag and Last-Modified
+    user_lat, user_lon, k, radius_km, rank = _nearest_query_args()
+    lat, lon = snap_to_cell(user_lat, user_lon, app.config['FACILITY_CACHE_CELL_DEG'])
+    version, updated_at = directory_versions.get(table)
+    etag = make_etag(table, version, updated_at, lat, lon, k, radius_km, rank)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(_facility_payload(table, version, lat, lon, k, radius_km, rank),
+                                      mimetype='application/json')
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = updated_at.replace(tzinfo=timezone.utc)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['FACILITY_CACHE_MAX_AGE']
+    return response.make_conditional(request)
+
+# Request inserts and deletions reach live dashboards through RequestEvent rows written in the same
+# transaction, so dashboards connected to any worker or host see every change once it commits
+def _load_feed_events(after, limit):
+    with app.app_context():
+        query = db.session.query(RequestEvent.id, RequestEvent.kind, RequestEvent.payload)
+        if after is None:
+            rows = query.order_by(RequestEvent.id.desc()).limit(limit).all()[::-1]
+        else:
+            rows = query.filter(RequestEvent.id > after).order_by(RequestEvent.id).limit(limit).all()
+        return [(row.id, row.kind, json.loads(row.payload)) for row in rows]
+
+def _prune_feed_events():
+    # Every process keeps the newest FEED_MAX_EVENTS in memory; older rows are never read again
+    with app.app_context():
+        newest = db.session.query(func.max(RequestEvent.id)).scalar()
+        if newest is not None:
+            db.session.execute(delete(RequestEvent).where(RequestEvent.id <= newest - app.config['FEED_MAX_EVENTS']))
+            db.session.commit()
+
+incident_feed = IncidentFeed(_load_feed_events, max_events=app.config['FEED_MAX_EVENTS'],
+                             poll_interval=app.config['FEED_POLL_INTERVAL'], prune=_prune_feed_events)
+
+@event.listens_for(OrmSession, 'after_flush')
+def _write_request_events(session, flush_context):
+    # Serialized here, while the rows are still loaded; after commit they are expired
+    events = [{'kind': 'created', 'payload': json.dumps(serialize_request(obj))}
+              for obj in session.new if isinstance(obj, Request)]
+    events += [{'kind': 'deleted', 'payload': json.dumps({'id': obj.id})}
+               for obj in session.deleted if isinstance(obj, Request)]
+    if events:
+        session.connection().execute(RequestEvent.__table__.insert(), events)
+        session.info['request_events_written'] = True
 
-# Load model models/efficientv2sv2.pth
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-# Load Model
-try:
-    model = timm.create_model('efficientnetv2_s', pretrained=False, num_classes=len(snake_classes))
-    state_dict = torch.load('models/efficientv2sv2.pth', map_location=device)
-    model.load_state_dict(state_dict, strict=True)
-    model.to(device)
-    model.eval()
-    logger.info("EfficientNetV2-S model loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading model: {str(e)}")
-    raise
-
-# Transform for inference
-transform = transforms.Compose([
-    transforms.Resize((384, 384)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
-
-# Haversine Formula
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth's radius in kilometers
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+@event.listens_for(OrmSession, 'after_commit')
+def _notify_request_events(session):
+    if session.info.pop('request_events_written', False):
+        incident_feed.notify()
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_request_events(session):
+    session.info.pop('request_events_written', None)
+
+# Aggregates change in the same transaction as the Request rows they count
+@event.listens_for(OrmSession, 'after_flush')
+def _update_request_stats(session, flush_context):
+    rows = [
+        (obj.timestamp, obj.latitude, obj.longitude, obj.snake_species, delta)
+        for objs, delta in ((session.new, 1), (session.deleted, -1))
+        for obj in objs if isinstance(obj, Request)
+    ]
+    if not rows:
+        return
+    cells, days = aggregate_increments(rows, app.config['ANALYTICS_PRECISIONS'], app.config['ANALYTICS_REGION_PRECISION'])
+    connection = session.connection()
+    add_counts(connection, RequestCellStat.__table__, ('period', 'precision', 'species', 'cell'), cells)
+    add_counts(connection, RequestDailyStat.__table__, ('species', 'region', 'day'), days)
+
+def compute_request_stats(batch_size=10000):
+    """The aggregates recomputed from Request in one streamed pass: (cell counts, daily counts, rows read)."""
+    cells, days = Counter(), Counter()
+    total = 0
+    result = db.session.execute(
+        select(Request.timestamp, Request.latitude, Request.longitude, Request.snake_species)
+        .execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        row_cells, row_days = aggregate_increments(
+            [(*row, 1) for row in rows], app.config['ANALYTICS_PRECISIONS'], app.config['ANALYTICS_REGION_PRECISION'])
+        cells.update(row_cells)
+        days.update(row_days)
+        total += len(rows)
+    return cells, days, total
+
+def rebuild_request_stats(batch_size=10000):
+    """Replace the aggregates with ones recomputed from Request, in one transaction; returns the rows counted."""
+    cells, days, total = compute_request_stats(batch_size)
+    try:
+        db.session.execute(delete(RequestCellStat))
+        db.session.execute(delete(RequestDailyStat))
+        # Plain inserts, so a concurrent rebuild fails with IntegrityError instead of double counting
+        for model, keys, counts in ((RequestCellStat, ('period', 'precision', 'species', 'cell'), cells),
+                                    (RequestDailyStat, ('species', 'region', 'day'), days)):
+            rows = [dict(zip(keys, key), count=count) for key, count in counts.items() if count]
+            for start in range(0, len(rows), batch_size):
+                db.session.execute(model.__table__.insert(), rows[start:start + batch_size])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return total
+
+def write_requests(rows):
+    # Inserts rows in one transaction and returns their ids once it has committed
+    with app.app_context():
+        new_requests = [Request(**row) for row in rows]
+        db.session.add_all(new_requests)
+        try:
+            db.session.flush()
+            ids = [r.id for r in new_requests]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return ids
+
+request_ingestor = RequestIngestor(
+    write_requests,
+    max_batch_size=app.config['INGEST_MAX_BATCH_SIZE'],
+    max_wait_ms=app.config['INGEST_MAX_WAIT_MS'],
+    max_queue_size=app.config['INGEST_QUEUE_SIZE']
+)
+
+def _valid_coordinates(lat, lon):
+    return math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180
+
+def _nearest_query_args():
+    user_lat = request.args.get('lat', type=float, default=27.7172)
+    user_lon = request.args.get('lon', type=float, default=85.3240)
+    k = request.args.get('k', type=int)
+    radius_km = request.args.get('radius_km', type=float)
+    if not _valid_coordinates(user_lat, user_lon):
+        raise ValueError('lat must be between -90 and 90 and lon between -180 and 180')
+    if k is not None and k <= 0:
+        raise ValueError('k must be a positive integer')
+    if radius_km is not None and radius_km <= 0:
+        raise ValueError('radius_km must be positive')
+    rank = request.args.get('rank', 'distance')
+    if rank not in ('distance', 'time'):
+        raise ValueError('rank must be distance or time')
+    return user_lat, user_lon, k, radius_km, rank
+
+# Request counters, per-stage latency histograms and gauges read at scrape time
+metrics_registry = metrics.Registry()
+http_requests = metrics_registry.register(metrics.Counter(
+    'viperaid_http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status')))
+http_request_seconds = metrics_registry.register(metrics.Histogram(
+    'viperaid_http_request_duration_seconds', 'Time to build the response, by endpoint', ('endpoint',)))
+stage_seconds = metrics_registry.register(metrics.Histogram(
+    'viperaid_stage_duration_seconds', 'Time spent in each stage of a request', ('endpoint', 'stage')))
+predict_paths = metrics_registry.register(metrics.Counter(
+    'viperaid_predict_paths_total', '/predict classifications by mode and path taken', ('mode', 'path')))
+upload_rejections = metrics_registry.register(metrics.Counter(
+    'viperaid_upload_rejections_total', 'Uploads refused before decoding, by reason', ('endpoint', 'reason')))
+
+def timed_stage(name):
+    return stage_seconds.time(request.endpoint or 'unmatched', name)
+
+def _inference_gauge(read):
+    stack = ml_runtime.get()
+    return {(): read(stack)} if stack is not None else {}
+
+def _model_worker_totals(field):
+    stack = ml_runtime.get()
+    workers = stack.engine.pool_status() if stack is not None else None
+    return {(): sum(w[field] for w in workers)} if workers is not None else {}
+
+def _prediction_cache_counts():
+    if prediction_cache is None:
+        return {}
+    stats = prediction_cache.stats()
+    return {(result,): stats[counter] for result, counter in
+            (('hit', 'hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses'))}
+
+def _facility_cache_info():
+    info = _facility_payload.cache_info()
+    return {('hits',): info.hits, ('misses',): info.misses, ('entries',): info.currsize}
+
+def _routing_counts():
+    router = _road_router
+    if router is None:
+        return {}
+    stats = router.stats()
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+for metric in (
+    metrics.Gauge('viperaid_model_state', 'Model runtime state (1 for the current state)',
+                  lambda: {(state,): int(ml_runtime.state == state) for state in ('cold', 'warming', 'ready', 'failed')},
+                  ('state',)),
+    metrics.Gauge('viperaid_inference_queue_depth', 'Tensors waiting for the batch inference engine',
+                  lambda: _inference_gauge(lambda stack: stack.engine.queue_depth())),
+    metrics.CounterFunc('viperaid_inference_batches_total', 'Batches run by the inference engine',
+                        lambda: _inference_gauge(lambda stack: stack.engine.stats.total_batches)),
+    metrics.CounterFunc('viperaid_inference_items_total', 'Images classified by the inference engine',
+                        lambda: _inference_gauge(lambda stack: stack.engine.stats.total_items)),
+    metrics.CounterFunc('viperaid_inference_errors_total', 'Failed inference batches',
+                        lambda: _inference_gauge(lambda stack: stack.engine.stats.total_errors)),
+    metrics.Gauge('viperaid_model_workers_alive', 'Model worker processes currently running',
+                  lambda: _model_worker_totals('alive')),
+    metrics.CounterFunc('viperaid_model_worker_restarts_total', 'Model worker processes restarted after a crash',
+                        lambda: _model_worker_totals('restarts')),
+    metrics.CounterFunc('viperaid_prediction_cache_lookups_total', 'Prediction cache lookups by result',
+                        _prediction_cache_counts, ('result',)),
+    metrics.Gauge('viperaid_ingest_queue_depth', 'Submissions waiting for the request writer',
+                  lambda: {(): request_ingestor.stats()['queue_depth']}),
+    metrics.CounterFunc('viperaid_ingest_batches_total', 'Transactions committed by the request writer',
+                        lambda: {(): request_ingestor.stats()['total_batches']}),
+    metrics.Gauge('viperaid_facility_cache', 'Facility response cache counters', _facility_cache_info, ('field',)),
+    metrics.CounterFunc('viperaid_routing_searches_total', 'Travel-time searches by cache result',
+                        _routing_counts, ('result',))
+):
+    metrics_registry.register(metric)
+
+slow_request_profiler = None
+if app.config['PROFILE_SLOW_REQUESTS_MS'] > 0:
+    slow_request_profiler = metrics.SlowRequestProfiler(
+        app.config['PROFILE_DIR'],
+        threshold_ms=app.config['PROFILE_SLOW_REQUESTS_MS'],
+        interval_ms=app.config['PROFILE_SAMPLE_INTERVAL_MS']
+    )
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if slow_request_profiler is not None:
+        slow_request_profiler.start()
+
+@app.after_request
+def _record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    # Streaming responses are timed up to the first byte, not for the life of the stream
+    http_request_seconds.observe(time.perf_counter() - g.request_started, endpoint)
+    http_requests.inc(endpoint, request.method, response.status_code)
+    return response
+
+@app.teardown_request
+def _stop_request_profiler(exc):
+    if slow_request_profiler is not None:
+        path = slow_request_profiler.stop(request.endpoint or 'unmatched')
+        if path:
+            logger.info(f"Slow request profile written to {path}")
 
 # Flask-Login User Loader
 @login_manager.user_loader
@@ -275,22 +833,11 @@ def index():
 @app.route('/snakebite', methods=['GET'])
 def snakebite():
     try:
-        user_lat = request.args.get('lat', type=float, default=27.7172)
-        user_lon = request.args.get('lon', type=float, default=85.3240)
-        hospitals = Hospital.query.all()
-        hospitals_with_distance = [
-            {
-                'id': h.id,
-                'name': h.name,
-                'phone': h.phone,
-                'latitude': h.latitude,
-                'longitude': h.longitude,
-                'distance': haversine(user_lat, user_lon, h.latitude, h.longitude)
-            }
-            for h in hospitals
-        ]
-        hospitals_with_distance.sort(key=lambda x: x['distance'])
-        return render_template('snakebite.html', hospitals=hospitals_with_distance, user_lat=user_lat, user_lon=user_lon)
+        user_lat, user_lon, k, radius_km, rank = _nearest_query_args()
+        with timed_stage('rank'):
+            hospitals_with_distance = ranked_facilities('hospital', user_lat, user_lon, k=k, radius_km=radius_km, rank=rank)
+        with timed_stage('render'):
+            return render_template('snakebite.html', hospitals=hospitals_with_distance, user_lat=user_lat, user_lon=user_lon)
     except Exception as e:
         logger.error(f"Error in snakebite route: {str(e)}")
         flash('An error occurred while loading hospitals.', 'danger')
@@ -299,22 +846,9 @@ def snakebite():
 @app.route('/api/hospitals', methods=['GET'])
 def get_hospitals():
     try:
-        user_lat = request.args.get('lat', type=float, default=27.7172)
-        user_lon = request.args.get('lon', type=float, default=85.3240)
-        hospitals = Hospital.query.all()
-        hospital_list = [
-            {
-                'id': h.id,
-                'name': h.name,
-                'phone': h.phone,
-                'latitude': h.latitude,
-                'longitude': h.longitude,
-                'distance': haversine(user_lat, user_lon, h.latitude, h.longitude)
-            }
-            for h in hospitals
-        ]
-        hospital_list.sort(key=lambda x: x['distance'])
-        return jsonify({'hospitals': hospital_list})
+        return _facility_response('hospital')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_hospitals: {str(e)}")
         return jsonify({'error': 'Failed to fetch hospitals'}), 500
@@ -322,22 +856,11 @@ def get_hospitals():
 @app.route('/rescue', methods=['GET'])
 def rescue():
     try:
-        user_lat = request.args.get('lat', type=float, default=27.7172)
-        user_lon = request.args.get('lon', type=float, default=85.3240)
-        rescuers = Rescuer.query.all()
-        rescuers_with_distance = [
-            {
-                'id': r.id,
-                'name': r.name,
-                'phone': r.phone,
-                'latitude': r.latitude,
-                'longitude': r.longitude,
-                'distance': haversine(user_lat, user_lon, r.latitude, r.longitude)
-            }
-            for r in rescuers
-        ]
-        rescuers_with_distance.sort(key=lambda x: x['distance'])
-        return render_template('rescue.html', rescuers=rescuers_with_distance, user_lat=user_lat, user_lon=user_lon)
+        user_lat, user_lon, k, radius_km, rank = _nearest_query_args()
+        with timed_stage('rank'):
+            rescuers_with_distance = ranked_facilities('rescuer', user_lat, user_lon, k=k, radius_km=radius_km, rank=rank)
+        with timed_stage('render'):
+            return render_template('rescue.html', rescuers=rescuers_with_distance, user_lat=user_lat, user_lon=user_lon)
     except Exception as e:
         logger.error(f"Error in rescue route: {str(e)}")
         flash('An error occurred while loading rescuers.', 'danger')
@@ -346,112 +869,688 @@ def rescue():
 @app.route('/api/rescuers', methods=['GET'])
 def get_rescuers():
     try:
-        user_lat = request.args.get('lat', type=float, default=27.7172)
-        user_lon = request.args.get('lon', type=float, default=85.3240)
-        rescuers = Rescuer.query.all()
-        rescuer_list = [
-            {
-                'id': r.id,
-                'name': r.name,
-                'phone': r.phone,
-                'latitude': r.latitude,
-                'longitude': r.longitude,
-                'distance': haversine(user_lat, user_lon, r.latitude, r.longitude)
-            }
-            for r in rescuers
-        ]
-        rescuer_list.sort(key=lambda x: x['distance'])
-        return jsonify({'rescuers': rescuer_list})
+        return _facility_response('rescuer')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_rescuers: {str(e)}")
         return jsonify({'error': 'Failed to fetch rescuers'}), 500
 
+@app.route('/api/distance_matrix', methods=['GET', 'POST'])
+def distance_matrix():
+    # Nearest hospital and rescuer for a batch of incidents: either posted points or stored requests
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        points = data.get('points')
+        if not isinstance(points, list) or not points:
+            return jsonify({'error': 'points must be a non-empty list'}), 400
+        next_cursor = None
+        if len(points) > app.config['DISTANCE_MATRIX_MAX_POINTS']:
+            return jsonify({'error': f"At most {app.config['DISTANCE_MATRIX_MAX_POINTS']} points are allowed"}), 400
+        try:
+            incidents = [
+                {'id': p.get('id', i), 'latitude': float(p['lat']), 'longitude': float(p['lon'])}
+                for i, p in enumerate(points)
+            ]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Each point needs numeric lat and lon'}), 400
+        if not all(_valid_coordinates(p['latitude'], p['longitude']) for p in incidents):
+            return jsonify({'error': 'Each point needs numeric lat and lon'}), 400
+    elif request.args.get('source') == 'requests':
+        if not current_user.is_authenticated:
+            return jsonify({'error': 'Login required'}), 401
+        # Pages of DISTANCE_MATRIX_MAX_POINTS requests in id order; next_cursor is the last id returned
+        cursor = request.args.get('cursor', '0')
+        if not cursor.isdigit():
+            return jsonify({'error': 'Invalid cursor'}), 400
+        max_points = app.config['DISTANCE_MATRIX_MAX_POINTS']
+        rows = db.session.query(Request.id, Request.latitude, Request.longitude).filter(
+            Request.latitude.isnot(None), Request.longitude.isnot(None), Request.id > int(cursor)
+        ).order_by(Request.id).limit(max_points).all()
+        incidents = [{'id': r.id, 'latitude': r.latitude, 'longitude': r.longitude} for r in rows]
+        next_cursor = str(rows[-1].id) if len(rows) == max_points else None
+    else:
+        return jsonify({'error': 'POST a list of points or use ?source=requests'}), 400
+
+    try:
+        lats = [p['latitude'] for p in incidents]
+        lons = [p['longitude'] for p in incidents]
+        nearest_hospitals = _facilities('hospital').nearest_many(lats, lons)
+        nearest_rescuers = _facilities('rescuer').nearest_many(lats, lons)
+        results = [
+            dict(p, nearest_hospital=h, nearest_rescuer=r)
+            for p, h, r in zip(incidents, nearest_hospitals, nearest_rescuers)
+        ]
+        return jsonify({'results': results, 'next_cursor': next_cursor})
+    except Exception as e:
+        logger.error(f"Error in distance_matrix: {str(e)}")
+        return jsonify({'error': 'Failed to compute distances'}), 500
+
+# Request listing: keyset pagination over (timestamp, id) with server-side filters
+def _parse_npt_datetime(value):
+    # Stored timestamps are naive Nepal time; aware inputs are converted to match
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('since/until must be an ISO 8601 datetime')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(npt_tz).replace(tzinfo=None)
+    return parsed
+
+def _encode_cursor(row):
+    raw = f"{row.timestamp.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def _request_filters_from_args(args):
+    filters = {
+        'request_type': args.get('request_type') or None,
+        'species': args.get('species') or None,
+        'since': _parse_npt_datetime(args['since']) if args.get('since') else None,
+        'until': _parse_npt_datetime(args['until']) if args.get('until') else None,
+        'lat': args.get('lat', type=float),
+        'lon': args.get('lon', type=float),
+        'radius_km': args.get('radius_km', type=float),
+        'order': args.get('order', 'desc')
+    }
+    if filters['order'] not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    if filters['radius_km'] is not None:
+        if filters['lat'] is None or filters['lon'] is None:
+            raise ValueError('radius_km needs lat and lon')
+        if filters['radius_km'] <= 0:
+            raise ValueError('radius_km must be positive')
+    return filters
+
+def _filtered_request_query(filters, *columns):
+    query = db.session.query(*columns) if columns else Request.query
+    if filters['request_type']:
+        query = query.filter(Request.request_type == filters['request_type'])
+    if filters['species']:
+        query = query.filter(Request.snake_species == filters['species'])
+    if filters['since']:
+        query = query.filter(Request.timestamp >= filters['since'])
+    if filters['until']:
+        query = query.filter(Request.timestamp < filters['until'])
+    if filters['radius_km'] is not None:
+        # Bounding box on the lat/lon index; callers apply the exact haversine test
+        dlat = filters['radius_km'] / 111.195
+        dlon = min(180.0, dlat / max(math.cos(math.radians(filters['lat'])), 0.01))
+        query = query.filter(
+            Request.latitude.between(filters['lat'] - dlat, filters['lat'] + dlat),
+            Request.longitude.between(filters['lon'] - dlon, filters['lon'] + dlon)
+        )
+    return query
+
+def _request_distance(filters, row):
+    if filters['radius_km'] is None:
+        return None
+    return haversine(filters['lat'], filters['lon'], row.latitude, row.longitude)
+
+def list_requests(filters, cursor=None, limit=50):
+    """One page of requests as (row, distance) pairs plus the cursor for the next page."""
+    descending = filters['order'] == 'desc'
+    query = _filtered_request_query(filters).order_by(
+        *((Request.timestamp.desc(), Request.id.desc()) if descending else (Request.timestamp.asc(), Request.id.asc()))
+    )
+    after = _decode_cursor(cursor) if cursor else None
+    results, last = [], None
+    while len(results) < limit:
+        page = query
+        if after is not None:
+            ts, row_id = after
+            if descending:
+                page = page.filter(or_(Request.timestamp < ts, and_(Request.timestamp == ts, Request.id < row_id)))
+            else:
+                page = page.filter(or_(Request.timestamp > ts, and_(Request.timestamp == ts, Request.id > row_id)))
+        # Over-fetch when the exact distance test may drop rows from the bounding box
+        fetch = (limit - len(results)) * (4 if filters['radius_km'] is not None else 1)
+        rows = page.limit(fetch).all()
+        for row in rows:
+            last = row
+            distance = _request_distance(filters, row)
+            if distance is not None and distance > filters['radius_km']:
+                continue
+            results.append((row, distance))
+            if len(results) == limit:
+                break
+        if len(rows) < fetch and (not rows or last is rows[-1]):
+            return results, None
+        after = (last.timestamp, last.id)
+    return results, _encode_cursor(last) if last is not None else None
+
+def summarize_requests(filters, top_species=20):
+    if filters['radius_km'] is None:
+        by_type = _filtered_request_query(filters, Request.request_type, func.count(Request.id)) \
+            .group_by(Request.request_type).all()
+        by_species = _filtered_request_query(filters, Request.snake_species, func.count(Request.id)) \
+            .group_by(Request.snake_species).order_by(func.count(Request.id).desc()).limit(top_species).all()
+        first, last = _filtered_request_query(filters, func.min(Request.timestamp), func.max(Request.timestamp)).one()
+        type_counts = dict(by_type)
+        species_counts = dict(by_species)
+    else:
+        # Only the few columns needed for the exact distance test are loaded, never whole rows
+        rows = [
+            r for r in _filtered_request_query(
+                filters, Request.request_type, Request.snake_species, Request.timestamp,
+                Request.latitude, Request.longitude
+            ).all()
+            if _request_distance(filters, r) <= filters['radius_km']
+        ]
+        type_counts = Counter(r.request_type for r in rows)
+        species_counts = dict(Counter(r.snake_species for r in rows).most_common(top_species))
+        first = min((r.timestamp for r in rows), default=None)
+        last = max((r.timestamp for r in rows), default=None)
+    return {
+        'total': sum(type_counts.values()),
+        'by_request_type': type_counts,
+        'by_species': species_counts,
+        'first_timestamp': first.isoformat() if first else None,
+        'last_timestamp': last.isoformat() if last else None
+    }
+
+def _analytics_precision(args, default):
+    precision = args.get('precision', type=int, default=default)
+    if precision not in app.config['ANALYTICS_PRECISIONS']:
+        raise ValueError(f"precision must be one of {', '.join(map(str, app.config['ANALYTICS_PRECISIONS']))}")
+    return precision
+
+def _analytics_months(args):
+    # since/until are inclusive months (YYYY-MM); without them the all-time counts are used
+    months = []
+    for key in ('since', 'until'):
+        value = args.get(key)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m')
+            except ValueError:
+                raise ValueError(f'{key} must be a month (YYYY-MM)')
+        months.append(value or None)
+    return months
+
+def _cell_stat_query(precision, since, until, species, *columns):
+    # species=ALL reads the all-species totals; None reads every species' own rows
+    query = db.session.query(*columns).filter(RequestCellStat.precision == precision)
+    if since or until:
+        query = query.filter(RequestCellStat.period != 'all')
+        if since:
+            query = query.filter(RequestCellStat.period >= since)
+        if until:
+            query = query.filter(RequestCellStat.period <= until)
+    else:
+        query = query.filter(RequestCellStat.period == 'all')
+    if species is not None:
+        query = query.filter(RequestCellStat.species == species)
+    else:
+        query = query.filter(RequestCellStat.species != ALL)
+    return query
+
+def request_heatmap(precision, since=None, until=None, species=None, bbox=None, limit=None):
+    """Request counts per geohash cell, busiest first, from the aggregates; bbox is (south, west, north, east)."""
+    total = func.sum(RequestCellStat.count)
+    rows = _cell_stat_query(precision, since, until, species or ALL, RequestCellStat.cell, total) \
+        .group_by(RequestCellStat.cell).having(total > 0).all()
+    if bbox:
+        rows = [row for row in rows if _in_bbox(cell_center(cell_bounds(row[0])), bbox)]
+    rows.sort(key=lambda row: row[1], reverse=True)
+    cells = []
+    for cell, count in rows[:limit]:
+        bounds = cell_bounds(cell)
+        lat, lon = cell_center(bounds)
+        cells.append({'cell': cell, 'lat': lat, 'lon': lon, 'bounds': bounds, 'count': int(count)})
+    return {
+        'precision': precision,
+        'total': int(sum(count for _, count in rows)),
+        'max': cells[0]['count'] if cells else 0,
+        'truncated': len(rows) > len(cells),
+        'cells': cells
+    }
+
+def _in_bbox(point, bbox):
+    return bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3]
+
+def species_by_region(precision, since=None, until=None):
+    total = func.sum(RequestCellStat.count)
+    rows = _cell_stat_query(precision, since, until, None, RequestCellStat.cell, RequestCellStat.species, total) \
+        .group_by(RequestCellStat.cell, RequestCellStat.species).having(total > 0).all()
+    regions = {}
+    for cell, species, count in rows:
+        if cell not in regions:
+            bounds = cell_bounds(cell)
+            lat, lon = cell_center(bounds)
+            regions[cell] = {'region': cell, 'lat': lat, 'lon': lon, 'bounds': bounds, 'total': 0,
+                             'species': {}}
+        regions[cell]['species'][species] = int(count)
+        regions[cell]['total'] += int(count)
+    for region in regions.values():
+        region['species'] = dict(sorted(region['species'].items(), key=lambda item: item[1], reverse=True))
+    return {'precision': precision, 'regions': sorted(regions.values(), key=lambda r: r['total'], reverse=True)}
+
+def daily_request_counts(since, until, species=None, region=None):
+    """Requests per day from since to until (dates, inclusive), with days without requests as 0."""
+    query = db.session.query(RequestDailyStat.day, func.sum(RequestDailyStat.count)).filter(
+        RequestDailyStat.species == (species or ALL),
+        RequestDailyStat.region.startswith(region) if region else RequestDailyStat.region == ALL,
+        RequestDailyStat.day >= since,
+        RequestDailyStat.day <= until
+    )
+    counts = {day: int(count) for day, count in query.group_by(RequestDailyStat.day).all()}
+    days = [since + timedelta(days=i) for i in range((until - since).days + 1)]
+    series = [{'date': day.isoformat(), 'count': counts.get(day, 0)} for day in days]
+    return {'since': since.isoformat(), 'until': until.isoformat(), 'total': sum(counts.values()), 'days': series}
+
+def serialize_request(row, distance=None):
+    data = {
+        'id': row.id,
+        'name': row.name,
+        'phone': row.phone,
+        'snake_species': row.snake_species,
+        'location': row.location,
+        'request_type': row.request_type,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'timestamp': row.timestamp.isoformat()
+    }
+    if distance is not None:
+        data['distance'] = distance
+    return data
+
+def _page_size():
+    limit = request.args.get('limit', type=int, default=app.config['REQUESTS_PAGE_SIZE'])
+    return max(1, min(limit, app.config['REQUESTS_MAX_PAGE_SIZE']))
+
 @app.route('/dashboard', methods=['GET'])
 @login_required
 def dashboard():
+    # Taken before the query so nothing committed in between is missed by the live feed
+    incident_feed.start()
+    feed_cursor = incident_feed.cursor()
     try:
-        requests = Request.query.all()
-        return render_template('dashboard.html', requests=requests)
+        filters = _request_filters_from_args(request.args)
+        page, next_cursor = list_requests(filters, request.args.get('cursor'), _page_size())
+        args = request.args.to_dict()
+        args.pop('cursor', None)
+        next_url = url_for('dashboard', **args, cursor=next_cursor) if next_cursor else None
+        first_url = url_for('dashboard', **args) if request.args.get('cursor') else None
+        # New requests are only inserted live on the newest, unfiltered page
+        live_insert = not request.args.get('cursor') and filters['order'] == 'desc' and not any(
+            filters[key] for key in ('request_type', 'species', 'since', 'until', 'radius_km'))
+        return render_template('dashboard.html', requests=[row for row, _ in page], filters=request.args,
+                               next_url=next_url, first_url=first_url, feed_cursor=feed_cursor,
+                               live_insert=live_insert, feed_sse=_feed_sse_available())
+    except ValueError as e:
+        flash(f'Invalid filter: {str(e)}', 'danger')
     except Exception as e:
         logger.error(f"Error in dashboard route: {str(e)}")
         flash('An error occurred while loading requests.', 'danger')
-        return render_template('dashboard.html', requests=[])
+    return render_template('dashboard.html', requests=[], filters=request.args, next_url=None, first_url=None,
+                           feed_cursor=feed_cursor, live_insert=False, feed_sse=_feed_sse_available())
+
+@app.route('/api/requests', methods=['GET'])
+@login_required
+def api_requests():
+    try:
+        filters = _request_filters_from_args(request.args)
+        page, next_cursor = list_requests(filters, request.args.get('cursor'), _page_size())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_requests: {str(e)}")
+        return jsonify({'error': 'Failed to fetch requests'}), 500
+    return jsonify({'requests': [serialize_request(row, d) for row, d in page], 'next_cursor': next_cursor})
+
+@app.route('/api/requests/summary', methods=['GET'])
+@login_required
+def api_requests_summary():
+    try:
+        filters = _request_filters_from_args(request.args)
+        return jsonify(summarize_requests(filters))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_requests_summary: {str(e)}")
+        return jsonify({'error': 'Failed to summarize requests'}), 500
+
+@app.route('/api/analytics/heatmap', methods=['GET'])
+@login_required
+def api_analytics_heatmap():
+    try:
+        precision = _analytics_precision(request.args, app.config['ANALYTICS_PRECISIONS'][-1])
+        since, until = _analytics_months(request.args)
+        bbox = None
+        if request.args.get('bbox'):
+            try:
+                bbox = tuple(float(v) for v in request.args['bbox'].split(','))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4:
+                raise ValueError('bbox must be south,west,north,east')
+        limit = request.args.get('limit', type=int, default=app.config['ANALYTICS_MAX_CELLS'])
+        limit = max(1, min(limit, app.config['ANALYTICS_MAX_CELLS']))
+        return jsonify(request_heatmap(precision, since, until, request.args.get('species') or None, bbox, limit))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_analytics_heatmap: {str(e)}")
+        return jsonify({'error': 'Failed to build heatmap'}), 500
+
+@app.route('/api/analytics/species_by_region', methods=['GET'])
+@login_required
+def api_analytics_species_by_region():
+    try:
+        precision = _analytics_precision(request.args, app.config['ANALYTICS_REGION_PRECISION'])
+        since, until = _analytics_months(request.args)
+        return jsonify(species_by_region(precision, since, until))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_analytics_species_by_region: {str(e)}")
+        return jsonify({'error': 'Failed to count species by region'}), 500
+
+@app.route('/api/analytics/daily', methods=['GET'])
+@login_required
+def api_analytics_daily():
+    try:
+        until = date.fromisoformat(request.args['until']) if request.args.get('until') else npt_now().date()
+        since = date.fromisoformat(request.args['since']) if request.args.get('since') else until - timedelta(days=89)
+        if since > until:
+            raise ValueError('since must not be after until')
+        if (until - since).days >= app.config['ANALYTICS_MAX_DAYS']:
+            raise ValueError(f"At most {app.config['ANALYTICS_MAX_DAYS']} days per request")
+        region = request.args.get('region') or None
+        if region:
+            cell_bounds(region)
+            if len(region) > app.config['ANALYTICS_REGION_PRECISION']:
+                raise ValueError(f"region must be a geohash of at most {app.config['ANALYTICS_REGION_PRECISION']} characters")
+        return jsonify(daily_request_counts(since, until, request.args.get('species') or None, region))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_analytics_daily: {str(e)}")
+        return jsonify({'error': 'Failed to count requests per day'}), 500
+
+@app.route('/api/requests/feed', methods=['GET'])
+@login_required
+def api_requests_feed():
+    # Long-poll: returns as soon as there are events after ?cursor=, or empty after ?timeout= seconds
+    timeout = min(request.args.get('timeout', type=float, default=app.config['FEED_POLL_TIMEOUT']),
+                  app.config['FEED_POLL_TIMEOUT'])
+    incident_feed.start()
+    seq = incident_feed.parse_cursor(request.args.get('cursor'))
+    # Release the connection used to load the user; waiting must not hold one
+    db.session.remove()
+    events = incident_feed.wait(seq, max(timeout, 0))
+    if events is None:
+        return jsonify({'reset': True, 'events': [], 'cursor': incident_feed.cursor()})
+    cursor = incident_feed.cursor(events[-1]['seq']) if events else incident_feed.cursor(seq)
+    return jsonify({'reset': False, 'events': events, 'cursor': cursor})
+
+def _feed_sse_available():
+    # Never a thread per open stream: only with cooperative (gevent-patched) threading
+    monkey = sys.modules.get('gevent.monkey')
+    return app.config['FEED_SSE_ENABLED'] and monkey is not None and monkey.is_module_patched('threading')
+
+@app.route('/api/requests/stream', methods=['GET'])
+@login_required
+def api_requests_stream():
+    # Server-Sent Events; browsers resume with Last-Event-ID after a dropped connection
+    if not _feed_sse_available():
+        return jsonify({'error': 'Streaming needs FEED_SSE_ENABLED=1 and a gevent worker; '
+                                 'long-poll /api/requests/feed instead'}), 503
+    incident_feed.start()
+    seq = incident_feed.parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('cursor'))
+    heartbeat = app.config['FEED_HEARTBEAT']
+    db.session.remove()
+
+    def generate(seq):
+        yield 'retry: 3000\n\n'
+        while True:
+            events = incident_feed.wait(seq, heartbeat)
+            if events is None:
+                yield f"id: {incident_feed.cursor()}\nevent: reset\ndata: {{}}\n\n"
+                return
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                yield format_sse(event)
+            seq = events[-1]['seq']
+
+    return Response(generate(seq), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.errorhandler(RequestEntityTooLarge)
+def _upload_too_large(e):
+    upload_rejections.inc(request.endpoint or 'unmatched', 'body_size')
+    return jsonify({'error': 'Upload is too large'}), 413
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    if 'snakeImage' not in request.files:
+    # Parsing reads the body, refusing it past PREDICT_MAX_UPLOAD_BYTES and spooling a large image to disk
+    with timed_stage('upload'):
+        file = request.files.get('snakeImage')
+    if file is None:
         return jsonify({'error': 'No image uploaded'}), 400
-    file = request.files['snakeImage']
+    mode = request.values.get('mode', app.config['PREDICT_MODE'])
+    if mode not in prediction_modes.MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(prediction_modes.MODES)}"}), 400
+    if mode == 'tiered' and not app.config['MODEL_STUDENT_PATH']:
+        return jsonify({'error': 'tiered mode needs a student model (MODEL_STUDENT_PATH)'}), 400
+    # The upload is used in place: hashed, decoded and (for extra views) decoded again from the same file
+    data = file.stream
     try:
-        img = Image.open(file).convert('RGB')
-        img = transform(img).unsqueeze(0)
-        with torch.no_grad():
-            output = model(img)
-            probabilities = torch.softmax(output, dim=1)
-            confidence, predicted = torch.max(probabilities, 1)
-            species = snake_classes[predicted.item()]
-            snake_info = SNAKE_INFO.get(species, {
-                'common_name': 'Unknown',
-                'nepali_name': 'Unknown',
-                'danger': 'Unknown',
-                'habitat': 'Unknown'
-            })
-        return jsonify({
-            'species': species,
-            'confidence': confidence.item() * 100,
-            'common_name': snake_info['common_name'],
-            'nepali_name': snake_info['nepali_name'],
-            'danger': snake_info['danger'],
-            'habitat': snake_info['habitat']
-        })
+        stack = ml_runtime.get()
+        if mode == 'tiered' and stack is not None and stack.student is None:
+            mode = 'fast'
+        # Modes can disagree on the same image, so each caches its own answer
+        key_suffix = '' if mode == 'fast' else f':{mode}'
+        if mode == 'tiered' and stack is not None:
+            key_suffix += f':{stack.student.version}'
+        cache_keys = []
+        # Results are cached per loaded model version, so the cache is only used once the model is ready
+        if prediction_cache is not None and stack is not None:
+            with timed_stage('cache_lookup'):
+                cache_keys.append(content_key(data) + key_suffix)
+                cached = prediction_cache.get(cache_keys[0])
+            if cached is not None:
+                return jsonify(cached), 200, {'X-Prediction-Cache': 'hit'}
+        if stack is None:
+            return _model_unavailable()
+        # Tiered mode starts with the student's smaller view
+        preprocessor = stack.student.preprocessor if mode == 'tiered' else stack.preprocessor
+        with timed_stage('decode'):
+            img = preprocessor.decode(reopen(data))
+        if prediction_cache is not None and app.config['PREDICTION_CACHE_PERCEPTUAL']:
+            with timed_stage('cache_lookup'):
+                cache_keys.append(perceptual_key(img) + key_suffix)
+                cached = prediction_cache.get(cache_keys[1])
+            if cached is not None:
+                prediction_cache.put(cache_keys[0], cached)
+                return jsonify(cached), 200, {'X-Prediction-Cache': 'hit'}
+        with timed_stage('preprocess'):
+            img = preprocessor.to_tensor(img, out=preprocessor.buffer())
+        threshold = app.config['PREDICT_TIERED_THRESHOLD' if mode == 'tiered' else 'PREDICT_ADAPTIVE_THRESHOLD']
+        # Includes the wait for a batch slot, the extra views in tta/adaptive mode and the teacher in tiered mode
+        with timed_stage('inference'):
+            probabilities, path = prediction_modes.classify(
+                stack.engine, stack.preprocessor, data, img, mode,
+                threshold, app.config['PREDICT_ADAPTIVE_DANGER_THRESHOLD'], danger_levels,
+                timeout=app.config['INFERENCE_TIMEOUT'], student=stack.student
+            )
+        predict_paths.inc(mode, path)
+        with timed_stage('serialize'):
+            confidence, predicted = probabilities.max(0)
+            result = describe_prediction(snake_classes[predicted.item()], confidence.item())
+            result['mode'] = mode
+            result['views'] = prediction_modes.views_used(path)
+            if mode == 'tiered':
+                result['model'] = path
+            for key in cache_keys:
+                prediction_cache.put(key, result)
+            return jsonify(result)
+    except ImageRejected as e:
+        upload_rejections.inc(request.endpoint, 'image_format' if e.status == 415 else 'image_pixels')
+        return jsonify({'error': str(e)}), e.status
+    except (EngineOverloaded, TimeoutError) as e:
+        logger.error(f"Inference unavailable in predict route: {str(e)}")
+        return jsonify({'error': 'Server is busy, please try again'}), 503
     except Exception as e:
         logger.error(f"Error in predict route: {str(e)}")
         return jsonify({'error': 'Failed to process image'}), 500
 
+def _collect_batch_uploads():
+    # (filename, bytes) pairs from multipart 'images'/'snakeImage' fields and an optional 'archive' zip
+    max_images = app.config['PREDICT_BATCH_MAX_IMAGES']
+    max_bytes = app.config['PREDICT_BATCH_MAX_IMAGE_BYTES']
+    max_total = app.config['PREDICT_BATCH_MAX_UPLOAD_BYTES']
+    uploads = []
+    total = 0
+
+    def count(size):
+        nonlocal total
+        total += size
+        if max_total and total > max_total:
+            raise RequestEntityTooLarge(f'At most {max_total} bytes of images are allowed per request')
+
+    # The body itself was capped at PREDICT_BATCH_MAX_UPLOAD_BYTES while it was parsed
+    for file in request.files.getlist('images') + request.files.getlist('snakeImage'):
+        data = file.read(max_bytes + 1)
+        count(len(data))
+        uploads.append((file.filename, data))
+    if 'archive' in request.files:
+        with zipfile.ZipFile(request.files['archive']) as archive:
+            for entry in archive.infolist():
+                if entry.is_dir() or not entry.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if len(uploads) >= max_images:
+                    raise ValueError(f'At most {max_images} images are allowed per request')
+                if entry.file_size > max_bytes:
+                    uploads.append((entry.filename, b''))
+                    continue
+                # Counted from the size the archive declares, before the entry is unpacked (reads stop there)
+                count(entry.file_size)
+                uploads.append((entry.filename, archive.read(entry)))
+    if len(uploads) > max_images:
+        raise ValueError(f'At most {max_images} images are allowed per request')
+    return uploads
+
+def _classify_uploads(stack, uploads, top_k):
+    # Yields (position, result) as each image finishes; decoding runs in the preprocessor pool
+    # and the decoded tensors are batched together by the inference engine
+    timeout = app.config['INFERENCE_TIMEOUT']
+    pending = {}
+    for position, (filename, data) in enumerate(uploads):
+        if not data or len(data) > app.config['PREDICT_BATCH_MAX_IMAGE_BYTES']:
+            yield position, {'filename': filename, 'error': 'Empty or oversized image'}
+            continue
+        pending[stack.preprocessor.submit(io.BytesIO(data))] = ('decode', position)
+    while pending:
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            for stage, position in pending.values():
+                yield position, {'filename': uploads[position][0], 'error': 'Timed out'}
+            return
+        for future in done:
+            stage, position = pending.pop(future)
+            filename = uploads[position][0]
+            try:
+                if stage == 'decode':
+                    pending[stack.engine.submit(future.result())] = ('infer', position)
+                else:
+                    yield position, {'filename': filename, 'predictions': top_k_predictions(future.result(), top_k)}
+            except EngineOverloaded:
+                yield position, {'filename': filename, 'error': 'Server is busy, please try again'}
+            except ImageRejected as e:
+                yield position, {'filename': filename, 'error': str(e)}
+            except Exception as e:
+                logger.error(f"Error classifying {filename} in predict_batch: {str(e)}")
+                yield position, {'filename': filename, 'error': 'Failed to process image'}
+
+@app.route('/api/predict_batch', methods=['POST'])
+def predict_batch():
+    top_k = request.args.get('top_k', type=int, default=3)
+    stream = request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+    if top_k <= 0:
+        return jsonify({'error': 'top_k must be a positive integer'}), 400
+    try:
+        uploads = _collect_batch_uploads()
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e)}), 400
+    if not uploads:
+        return jsonify({'error': 'No images uploaded'}), 400
+    stack = ml_runtime.get()
+    if stack is None:
+        return _model_unavailable()
+
+    if stream:
+        def generate():
+            for position, result in _classify_uploads(stack, uploads, top_k):
+                yield json.dumps(dict(result, index=position)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    results = [None] * len(uploads)
+    for position, result in _classify_uploads(stack, uploads, top_k):
+        results[position] = result
+    return jsonify({'results': results})
+
+@app.route('/api/model_status', methods=['GET'])
+def model_status():
+    status = ml_runtime.status()
+    return jsonify(status), 200 if status['state'] == 'ready' else 503
+
+@app.route('/api/inference_stats', methods=['GET'])
+def inference_stats():
+    stats = {'model': ml_runtime.status()}
+    stack = ml_runtime.get()
+    if stack is not None:
+        stats.update(stack.engine.stats.snapshot())
+        stats['queue_depth'] = stack.engine.queue_depth()
+        stats['max_batch_size'] = stack.engine.max_batch_size
+        stats['max_wait_ms'] = stack.engine.max_wait * 1000
+        stats['workers'] = stack.engine.pool_status()
+        if stack.student is not None:
+            stats['student'] = stack.student.engine.stats.snapshot()
+            stats['student']['queue_depth'] = stack.student.engine.queue_depth()
+    stats['cache'] = prediction_cache.stats() if prediction_cache is not None else None
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/submit_request', methods=['POST'])
 def submit_request():
     try:
-        data = request.form
-        request_type = data.get('request_type', 'hospital')
-        name = data.get('name')
-        phone = data.get('phone')
-        snake_species = data.get('snakeSpecies')
-        location = data.get('location')
-        lat = data.get('latitude')
-        lon = data.get('longitude')
-
-        if not name or not phone:
-            return jsonify({'error': 'Name and phone are required'}), 400
-
-        if lat and lon:
-            try:
-                lat = float(lat)
-                lon = float(lon)
-            except ValueError:
-                lat, lon = None, None
-        elif location and ',' in location:
-            try:
-                lat_str, lon_str = location.split(',')
-                lat = float(lat_str.strip())
-                lon = float(lon_str.strip())
-            except ValueError:
-                lat, lon = None, None
-
-        new_request = Request(
-            name=name,
-            phone=phone,
-            snake_species=snake_species if snake_species else 'Unknown',
-            location=location if location else 'Not specified',
-            request_type=request_type,
-            latitude=lat,
-            longitude=lon,
-            timestamp=datetime.now(npt_tz)
-        )
-        db.session.add(new_request)
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Request submitted successfully'})
+        with timed_stage('parse'):
+            values = parse_submission(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    values['timestamp'] = npt_now()
+    try:
+        with timed_stage('commit'):
+            if app.config['INGEST_BATCHING']:
+                future = request_ingestor.submit(values)
+                try:
+                    request_id = future.result(app.config['INGEST_TIMEOUT'])
+                except TimeoutError:
+                    # A submission that was never picked up is safe to retry; one being written is awaited
+                    if future.cancel():
+                        return jsonify({'error': 'Too many submissions, please retry'}), 503, {'Retry-After': '1'}
+                    request_id = future.result()
+            else:
+                request_id = write_requests([values])[0]
+        return jsonify({'success': True, 'message': 'Request submitted successfully', 'id': request_id})
+    except IngestOverloaded:
+        return jsonify({'error': 'Too many submissions, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
-        db.session.rollback()
         logger.error(f"Error in submit_request: {str(e)}")
         return jsonify({'error': 'Failed to submit request'}), 500
 
@@ -501,10 +1600,32 @@ def logout():
 with app.app_context():
     try:
         db.create_all()
+        # create_all() skips indexes on tables that already exist, so add any that are missing
+        for index in Request.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+        for table in facility_indexes:
+            if db.session.get(DirectoryVersion, table) is None:
+                db.session.add(DirectoryVersion(table_name=table))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker starting at the same time added them first
+            db.session.rollback()
+        # One-time backfill for databases created before the hotspot aggregates existed
+        if db.session.query(RequestDailyStat.day).first() is None and db.session.query(Request.id).first() is not None:
+            try:
+                logger.info(f"Built hotspot aggregates from {rebuild_request_stats()} requests")
+            except IntegrityError:
+                logger.info("Hotspot aggregates were built by another worker")
+        # Workers forked after import (gunicorn --preload) must not share these pooled connections
+        db.engine.dispose()
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating database tables: {str(e)}")
         raise
 
 if __name__ == '__main__':
+    # Under the debug reloader only the serving child process should load the model
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ml_runtime.start()
     app.run(debug=True)
\ No newline at end of file
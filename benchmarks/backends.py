@@ -0,0 +1,94 @@
+"""Benchmark and accuracy-parity check of the model backends against eager FP32.
+
+    python -m benchmarks.backends --images path/to/sample/images --output bench/backends.json
+"""
+import argparse
+import logging
+import time
+
+import torch
+
+from app import app, snake_classes
+from ml import build_transform, load_model
+from model_backends import BACKENDS, build_backend, load_calibration_batches
+from benchmarks.common import summarize, write_results
+
+logger = logging.getLogger(__name__)
+
+
+def parity(forward, reference_batches, reference_probs):
+    agree, total, max_diff = 0, 0, 0.0
+    with torch.inference_mode():
+        for batch, ref in zip(reference_batches, reference_probs):
+            probs = torch.softmax(forward(batch).float(), dim=1)
+            agree += (probs.argmax(dim=1) == ref.argmax(dim=1)).sum().item()
+            total += len(batch)
+            max_diff = max(max_diff, (probs - ref).abs().max().item())
+    return {'top1_agreement': agree / total if total else 0.0, 'max_prob_diff': max_diff, 'images': total}
+
+
+def latency(forward, sample, batch_size, iterations, warmup=3):
+    batch = sample.repeat((batch_size + len(sample) - 1) // len(sample), 1, 1, 1)[:batch_size]
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            forward(batch)
+            if i >= warmup:
+                timings.append(time.perf_counter() - start)
+    stats = summarize(timings)
+    stats['images_per_sec'] = batch_size * len(timings) / sum(timings) if timings else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', help='Directory of sample images for calibration and parity')
+    parser.add_argument('--limit', type=int, default=64, help='Maximum number of sample images')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--batch-sizes', default='1,8')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--onnx-path', default='models/efficientv2sv2.bench.onnx')
+    parser.add_argument('--output', default='bench/backends.json')
+    args = parser.parse_args()
+
+    model, _ = load_model(app.config['MODEL_PATH'], len(snake_classes), torch.device('cpu'))
+    transform = build_transform()
+    if args.images:
+        batches = load_calibration_batches(args.images, transform, limit=args.limit)
+    else:
+        logger.warning("No --images given; using random tensors, so parity numbers are only a smoke test")
+        batches = [torch.randn(8, 3, 384, 384) for _ in range(2)]
+    with torch.inference_mode():
+        reference = [torch.softmax(model(b), dim=1) for b in batches]
+
+    results = {}
+    for name in args.backends.split(','):
+        try:
+            forward, build_seconds = time_build(name, model, batches, args.onnx_path)
+        except Exception as e:
+            print(f"{name:>13}: failed to build ({e})")
+            results[name] = {'error': str(e)}
+            continue
+        entry = {'build_seconds': build_seconds, 'parity': parity(forward, batches, reference), 'latency': {}}
+        for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+            entry['latency'][str(batch_size)] = latency(forward, batches[0], batch_size, args.iterations)
+        results[name] = entry
+        first = entry['latency'][args.batch_sizes.split(',')[0]]
+        print(f"{name:>13}: top-1 agreement {entry['parity']['top1_agreement'] * 100:6.2f}%  "
+              f"p50 {first['p50_ms']:8.1f} ms  {first['images_per_sec']:7.1f} img/s")
+    write_results(args.output, results)
+
+
+def time_build(name, model, batches, onnx_path):
+    start = time.perf_counter()
+    forward = build_backend(name, model, calibration=batches, onnx_path=onnx_path)
+    if name == 'compile':
+        # torch.compile compiles lazily on the first call
+        with torch.inference_mode():
+            forward(batches[0])
+    return forward, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies):
+    # latencies in seconds -> summary in milliseconds
+    ms = [l * 1000 for l in latencies]
+    return {
+        'count': len(ms),
+        'mean_ms': sum(ms) / len(ms) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': max(ms) if ms else 0.0
+    }
+
+
+def synthetic_jpeg(width, height, seed=0):
+    # Smooth gradients plus sensor-like noise, roughly how phone photos compress
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x / width * 255, y / height * 255, (x + y) % 256], axis=-1)
+    pixels = pixels + rng.normal(0, 20, pixels.shape)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def write_results(path, results):
+    payload = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {path}")
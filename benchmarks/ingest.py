@@ -0,0 +1,97 @@
+"""Load test for /submit_request: sustained inserts/sec and latency percentiles.
+
+    python -m benchmarks.ingest --requests 2000 --concurrency 32
+
+Each scenario runs in a fresh interpreter against its own empty SQLite database:
+``before`` commits every request on its own with the default rollback journal,
+``after`` uses WAL and group commit (the app defaults). Both use synchronous=FULL,
+so every acknowledged submission is durable.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import write_results
+
+SCENARIOS = {
+    'before': {'INGEST_BATCHING': '0', 'SQLITE_WAL': '0'},
+    'after': {'INGEST_BATCHING': '1', 'SQLITE_WAL': '1'}
+}
+
+PROBE = """
+import json, os, sys, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import summarize
+import app
+
+local = threading.local()
+
+def submit(i):
+    client = getattr(local, 'client', None)
+    if client is None:
+        client = local.client = app.app.test_client()
+    started = time.perf_counter()
+    response = client.post('/submit_request', data={
+        'name': f'load-{i}', 'phone': '9800000000', 'snakeSpecies': 'Naja_naja',
+        'location': f'{27 + (i %% 100) / 100}, {85 + (i %% 37) / 100}', 'request_type': 'rescue'
+    })
+    return time.perf_counter() - started, response.status_code
+
+client = app.app.test_client()
+client.get('/info')
+app.ml_runtime.wait()  # keep the background model warm-up out of the measurement
+started = time.perf_counter()
+with ThreadPoolExecutor(max_workers=%(concurrency)d) as pool:
+    outcomes = list(pool.map(submit, range(%(requests)d)))
+elapsed = time.perf_counter() - started
+latencies = [l for l, status in outcomes if status == 200]
+with app.app.app_context():
+    stored = app.Request.query.count()
+result = {
+    'elapsed_seconds': elapsed,
+    'inserts_per_second': len(latencies) / elapsed,
+    'errors': sum(1 for _, status in outcomes if status != 200),
+    'rows_stored': stored,
+    'latency': summarize(latencies),
+    'ingest': app.request_ingestor.stats() if app.app.config['INGEST_BATCHING'] else None
+}
+print(json.dumps(result))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def run_scenario(name, requests, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **SCENARIOS[name])
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'ingest.db')
+        env['SQLITE_SYNCHRONOUS'] = 'FULL'
+        completed = subprocess.run(
+            [sys.executable, '-c', PROBE % {'requests': requests, 'concurrency': concurrency}],
+            capture_output=True, text=True, env=env, check=True
+        )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['before', 'after'])
+    parser.add_argument('--output', default='bench/ingest.json')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args.requests, args.concurrency)
+        r = results[name]
+        print(f"{name:>6}: {r['inserts_per_second']:8.1f} inserts/s  p50 {r['latency']['p50_ms']:7.1f} ms  "
+              f"p99 {r['latency']['p99_ms']:7.1f} ms  errors {r['errors']}  stored {r['rows_stored']}")
+    write_results(args.output, {'requests': args.requests, 'concurrency': args.concurrency, 'scenarios': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Throughput of the location endpoints under gunicorn at several worker counts.
+
+    python -m benchmarks.locations --workers 1 2 4 --requests 2000 --concurrency 16
+    python -m benchmarks.locations --database-url postgresql://postgres@localhost/viperaid_bench
+
+Needs gunicorn. Without --database-url each run uses a fresh SQLite file. The target is
+seeded with --facilities synthetic hospitals and rescuers if it has none. Workers are
+started, their model warm-up is allowed to finish, and then /api/hospitals and
+/api/rescuers are requested with random coordinates across Nepal.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import summarize, write_results
+
+SEED = """
+import random
+from app import app, db, Hospital, Rescuer
+random.seed(0)
+with app.app_context():
+    for model in (Hospital, Rescuer):
+        if model.query.count() == 0:
+            db.session.add_all(
+                model(name=f'{model.__name__} {i}', phone='+977-1-0000000',
+                      latitude=random.uniform(26.4, 30.4), longitude=random.uniform(80.1, 88.2))
+                for i in range(%(facilities)d)
+            )
+    db.session.commit()
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def wait_until_warm(base, workers, timeout=300):
+    # Requests are spread across workers, so wait for several consecutive settled answers
+    deadline = time.monotonic() + timeout
+    settled = 0
+    while settled < 4 * workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError('Workers did not finish warming up')
+        try:
+            with urllib.request.urlopen(base + '/api/model_status', timeout=5) as response:
+                state = json.loads(response.read())['state']
+        except urllib.error.HTTPError as e:
+            # 503 while warming up or after a failed load
+            state = json.loads(e.read())['state']
+        except OSError:
+            state = 'starting'
+        settled = settled + 1 if state in ('ready', 'failed') else 0
+        if not settled:
+            time.sleep(0.5)
+
+
+def run(workers, env, args):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        env=env
+    )
+    try:
+        wait_until_warm(base, workers)
+        rng = random.Random(1)
+        urls = [
+            f"{base}/api/{rng.choice(('hospitals', 'rescuers'))}?lat={rng.uniform(26.4, 30.4):.4f}"
+            f"&lon={rng.uniform(80.1, 88.2):.4f}&k={args.k}"
+            for _ in range(args.requests)
+        ]
+
+        def timed_get(url):
+            started = time.perf_counter()
+            try:
+                status = get(url)
+            except OSError:
+                status = None
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(timed_get, urls))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(30)
+    latencies = [l for l, status in outcomes if status == 200]
+    return {
+        'workers': workers,
+        'requests_per_second': len(latencies) / elapsed,
+        'errors': len(outcomes) - len(latencies),
+        'latency': summarize(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--facilities', type=int, default=1000, help='Synthetic rows per table when seeding')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file')
+    parser.add_argument('--output', default='bench/locations.json')
+    args = parser.parse_args()
+
+    if shutil.which('gunicorn') is None:
+        parser.error('gunicorn is required: pip install gunicorn')
+    tmp = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, DATABASE_URL=args.database_url or 'sqlite:///' + os.path.join(tmp, 'locations.db'))
+        subprocess.run([sys.executable, '-c', SEED % {'facilities': args.facilities}], env=env, check=True)
+        results = []
+        for workers in args.workers:
+            r = run(workers, env, args)
+            results.append(r)
+            print(f"{workers} worker(s): {r['requests_per_second']:8.1f} req/s  p50 {r['latency']['p50_ms']:6.1f} ms  "
+                  f"p99 {r['latency']['p99_ms']:6.1f} ms  errors {r['errors']}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    backend = env['DATABASE_URL'].split(':', 1)[0]
+    write_results(args.output, {'backend': backend, 'concurrency': args.concurrency, 'runs': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Latency cost and path frequencies of the /predict modes (fast, tta, adaptive, tiered).
+
+    python -m benchmarks.predict_modes --images path/to/photos --output bench/predict_modes.json
+    python -m benchmarks.predict_modes --thresholds 0.8 0.9 0.95 --danger-threshold 0.99
+    MODEL_STUDENT_PATH=models/student_mobilenetv3.pth python -m benchmarks.predict_modes --tiered-thresholds 0.8 0.9
+
+With a student model configured, the student on its own and tiered serving are measured
+too, which makes this the latency/accuracy comparison for distillation (distill_model.py
+reports the same accuracy figures on its validation split).
+
+Each image goes through decode, preprocessing and prediction_modes.classify in every mode,
+one image at a time. Reported per mode: latency percentiles, how often each path was
+taken (single pass, full TTA, escalated, student, teacher), mean views per image, and top-1 agreement
+with tta. Images in folders named after a species (as in the training set) also count
+towards accuracy, and towards "dangerous as harmless": a venomous species predicted as
+a non-venomous one.
+"""
+import argparse
+import io
+import os
+import time
+from collections import Counter
+
+from app import app, snake_classes, danger_levels, SNAKE_INFO
+from ml import list_images, load_stack
+from prediction_modes import classify, views_used
+from benchmarks.common import summarize, synthetic_jpeg, write_results
+
+
+def load_images(args):
+    if args.images:
+        images = []
+        for path in list_images(args.images, args.limit):
+            with open(path, 'rb') as f:
+                label = os.path.basename(os.path.dirname(path))
+                images.append((f.read(), label if label in SNAKE_INFO else None))
+        return images
+    return [(synthetic_jpeg(640, 480, seed=i), None) for i in range(args.limit or 16)]
+
+
+def run_mode(stack, images, mode, threshold, danger_threshold, reference=None):
+    latencies, paths, predictions = [], Counter(), []
+    correct = labelled = dangerous_as_harmless = 0
+    for data, label in images:
+        started = time.perf_counter()
+        if mode in ('student', 'tiered'):
+            view = stack.student.preprocessor(io.BytesIO(data))
+        else:
+            view = stack.preprocessor(io.BytesIO(data))
+        if mode == 'student':
+            probabilities, path = stack.student.engine.predict(view, timeout=app.config['INFERENCE_TIMEOUT']), 'student'
+        else:
+            probabilities, path = classify(stack.engine, stack.preprocessor, data, view, mode, threshold, danger_threshold,
+                                           danger_levels, timeout=app.config['INFERENCE_TIMEOUT'], student=stack.student)
+        predicted = snake_classes[probabilities.argmax().item()]
+        latencies.append(time.perf_counter() - started)
+        paths[path] += 1
+        predictions.append(predicted)
+        if label is not None:
+            labelled += 1
+            correct += predicted == label
+            if SNAKE_INFO[label]['danger'] != 'Non-venomous' and SNAKE_INFO[predicted]['danger'] == 'Non-venomous':
+                dangerous_as_harmless += 1
+    views = sum(count * views_used(path) for path, count in paths.items())
+    result = {
+        'latency': summarize(latencies),
+        'paths': {path: count / len(images) for path, count in paths.items()},
+        'mean_views': views / len(images),
+        'accuracy': correct / labelled if labelled else None,
+        'dangerous_as_harmless': dangerous_as_harmless if labelled else None
+    }
+    if reference is not None:
+        result['agreement_with_tta'] = sum(a == b for a, b in zip(predictions, reference)) / len(images)
+    return result, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='Folder of photos; synthetic images are used if omitted')
+    parser.add_argument('--limit', type=int, help='At most this many images')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[app.config['PREDICT_ADAPTIVE_THRESHOLD']],
+                        help='Adaptive-mode confidence thresholds to compare')
+    parser.add_argument('--danger-threshold', type=float, default=app.config['PREDICT_ADAPTIVE_DANGER_THRESHOLD'])
+    parser.add_argument('--tiered-thresholds', type=float, nargs='+', default=[app.config['PREDICT_TIERED_THRESHOLD']],
+                        help='Tiered-mode student confidence thresholds to compare (needs MODEL_STUDENT_PATH)')
+    parser.add_argument('--output', default='bench/predict_modes.json')
+    args = parser.parse_args()
+
+    stack = load_stack(app.config, len(snake_classes))
+    images = load_images(args)
+    # Warm up allocator and kernels so the first mode measured is not penalized
+    for data, _ in images[:2]:
+        classify(stack.engine, stack.preprocessor, data, stack.preprocessor(io.BytesIO(data)), 'tta', 1.0, 1.0, danger_levels)
+
+    results = {}
+    results['tta'], reference = run_mode(stack, images, 'tta', 1.0, 1.0)
+    results['fast'], _ = run_mode(stack, images, 'fast', 1.0, 1.0, reference)
+    for threshold in args.thresholds:
+        results[f'adaptive@{threshold}'], _ = run_mode(stack, images, 'adaptive', threshold, args.danger_threshold, reference)
+    if stack.student is not None:
+        results['student'], _ = run_mode(stack, images, 'student', 1.0, 1.0, reference)
+        for threshold in args.tiered_thresholds:
+            results[f'tiered@{threshold}'], _ = run_mode(stack, images, 'tiered', threshold, 1.0, reference)
+    for name, r in results.items():
+        print(f"{name:>16}: p50 {r['latency']['p50_ms']:7.1f} ms  p95 {r['latency']['p95_ms']:7.1f} ms  "
+              f"views/image {r['mean_views']:4.2f}  paths {r['paths']}  "
+              f"agreement {r.get('agreement_with_tta', 1.0):.3f}  accuracy {r['accuracy']}")
+    stack.engine.stop()
+    if stack.student is not None:
+        stack.student.engine.stop()
+    write_results(args.output, {'images': len(images), 'source': args.images or 'synthetic', 'modes': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Micro-benchmark of the fast Preprocessor against the torchvision ``transform`` in app.py.
+
+    python -m benchmarks.preprocess --sizes 640x480,1600x1200,4000x3000 --output bench/preprocess.json
+
+Also reports the numerical difference between the two pipelines; the run fails if the
+mean absolute difference exceeds --tolerance.
+"""
+import argparse
+import io
+import sys
+import time
+
+from PIL import Image
+from torchvision import transforms
+
+from preprocess import Preprocessor
+from benchmarks.common import summarize, synthetic_jpeg, write_results
+
+# Same pipeline as app.transform, rebuilt here so the benchmark does not load the model
+reference_transform = transforms.Compose([
+    transforms.Resize((384, 384)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+
+def run(fn, payloads, iterations):
+    timings = []
+    for _ in range(iterations):
+        for data in payloads:
+            start = time.perf_counter()
+            fn(io.BytesIO(data))
+            timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='640x480,1600x1200,4000x3000')
+    parser.add_argument('--images', nargs='*', default=[], help='Real images to include instead of synthetic ones')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--tolerance', type=float, default=0.02)
+    parser.add_argument('--output', default='bench/preprocess.json')
+    args = parser.parse_args()
+
+    preprocessor = Preprocessor()
+    cases = {}
+    for path in args.images:
+        with open(path, 'rb') as f:
+            cases[path] = f.read()
+    if not cases:
+        for size in args.sizes.split(','):
+            width, height = (int(v) for v in size.split('x'))
+            cases[size] = synthetic_jpeg(width, height)
+
+    results, failed = {}, False
+    for name, data in cases.items():
+        expected = reference_transform(Image.open(io.BytesIO(data)).convert('RGB'))
+        actual = preprocessor(io.BytesIO(data))
+        diff = (expected - actual).abs()
+        baseline = run(lambda fp: reference_transform(Image.open(fp).convert('RGB')), [data], args.iterations)
+        fast = run(lambda fp: preprocessor(fp, out=preprocessor.buffer()), [data], args.iterations)
+
+        sources = [io.BytesIO(data) for _ in range(args.batch_size)]
+        start = time.perf_counter()
+        preprocessor.preprocess_batch(sources)
+        batch_seconds = time.perf_counter() - start
+
+        results[name] = {
+            'bytes': len(data),
+            'transform': baseline,
+            'preprocessor': fast,
+            'speedup_p50': baseline['p50_ms'] / fast['p50_ms'] if fast['p50_ms'] else 0.0,
+            'batch_images_per_sec': args.batch_size / batch_seconds,
+            'mean_abs_diff': diff.mean().item(),
+            'max_abs_diff': diff.max().item()
+        }
+        failed = failed or results[name]['mean_abs_diff'] > args.tolerance
+        print(f"{name:>12}: transform p50 {baseline['p50_ms']:7.1f} ms  preprocessor p50 {fast['p50_ms']:7.1f} ms  "
+              f"x{results[name]['speedup_p50']:.1f}  batch {results[name]['batch_images_per_sec']:6.1f} img/s  "
+              f"mean diff {results[name]['mean_abs_diff']:.4f}")
+    write_results(args.output, results)
+    if failed:
+        print(f"Mean absolute difference exceeded tolerance {args.tolerance}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Startup-time measurement for app.py, to catch regressions in import cost.
+
+    python -m benchmarks.startup --runs 5 --max-seconds 3
+    python -m benchmarks.startup --with-model
+
+Each run imports the app in a fresh interpreter. The run fails when the median import
+time exceeds --max-seconds, or when torch gets imported before any request is made.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import write_results
+
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import app
+result = {'import_seconds': time.perf_counter() - started, 'torch_imported_at_startup': 'torch' in sys.modules}
+client = app.app.test_client()
+started = time.perf_counter()
+client.get('/info')
+result['first_request_seconds'] = time.perf_counter() - started
+if %(with_model)r:
+    started = time.perf_counter()
+    app.ml_runtime.wait()
+    result['model_ready_seconds'] = time.perf_counter() - started
+    result['model_state'] = app.ml_runtime.state
+print(json.dumps(result))
+sys.stdout.flush()
+os._exit(0)  # do not wait on the warm-up thread at interpreter shutdown
+"""
+
+
+def probe(with_model):
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE % {'with_model': with_model}],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--with-model', action='store_true', help='Also time the background model warm-up')
+    parser.add_argument('--max-seconds', type=float, default=3.0)
+    parser.add_argument('--output', default='bench/startup.json')
+    args = parser.parse_args()
+
+    runs = [probe(args.with_model) for _ in range(args.runs)]
+    summary = {
+        'runs': runs,
+        'median_import_seconds': statistics.median(r['import_seconds'] for r in runs),
+        'median_first_request_seconds': statistics.median(r['first_request_seconds'] for r in runs)
+    }
+    if args.with_model:
+        summary['median_model_ready_seconds'] = statistics.median(r['model_ready_seconds'] for r in runs)
+    for key, value in summary.items():
+        if key != 'runs':
+            print(f"{key}: {value:.3f}")
+    write_results(args.output, summary)
+
+    if any(r['torch_imported_at_startup'] for r in runs):
+        print("Regression: torch is imported when the app starts")
+        sys.exit(1)
+    if summary['median_import_seconds'] > args.max_seconds:
+        print(f"Regression: import took longer than {args.max_seconds:.1f}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
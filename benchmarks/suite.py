@@ -0,0 +1,371 @@
+"""Reproducible endpoint benchmark suite with baseline comparison.
+
+    python -m benchmarks.suite --output bench/suite.json
+    python -m benchmarks.suite --quick --baseline bench/baseline.json
+    python -m benchmarks.suite --transport http --scenarios locations --facility-rows 10 1000 100000
+
+Scenarios:
+  predict    /predict for each --image-sizes at each --predict-concurrency (prediction cache off)
+  locations  /api/hospitals and /api/rescuers against --facility-rows synthetic rows per table
+  submit     /submit_request write bursts at each --submit-concurrency
+
+The app runs against a fresh SQLite file unless --database-url is given; that database is
+overwritten, so only point it at a scratch database. --transport client drives the app
+in-process through the Flask test client. --transport http serves it from a forked
+process with werkzeug's threaded server and sends real HTTP requests over loopback.
+Requests and coordinates come from --seed, so runs are comparable. Each measurement
+starts after the model warm-up has finished and a few unmeasured requests.
+
+Each run records its settings: the options above, the serving configuration the app read
+from the environment (MODEL_WORKERS, MODEL_BACKEND, batching, ...) and the CPU count.
+With --baseline, every scenario present in both files is compared. The run exits
+non-zero when throughput drops, or p95 latency grows, by more than --tolerance, or when
+errors appear. A baseline recorded with other settings is not compared at all; the run
+lists the differences and exits with status 2. --update-baseline then overwrites the
+baseline with this run.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import summarize, synthetic_jpeg, write_results
+from benchmarks.locations import free_port, wait_until_warm
+
+Call = namedtuple('Call', 'method path form files')
+
+# Bounding box of Nepal, as used by populate_db.py's facilities
+LAT_RANGE = (26.4, 30.4)
+LON_RANGE = (80.1, 88.2)
+# A few of app.snake_classes, fixed so submit runs stay comparable
+SPECIES = ['Naja_naja', 'Bungarus_caeruleus', 'Daboia_russelii', 'Ptyas_mucosa', 'Python_molurus']
+
+QUICK = {
+    'image_sizes': '320x240,1280x960',
+    'predict_concurrency': [1, 4],
+    'predict_requests': 16,
+    'facility_rows': [10, 1000],
+    'location_requests': 200,
+    'submit_concurrency': [1, 16],
+    'submit_requests': 200
+}
+
+# App configuration that changes the numbers, recorded with each run
+SERVING_CONFIG_KEYS = ('MODEL_PATH', 'MODEL_BACKEND', 'MODEL_WORKERS', 'MODEL_WORKER_THREADS', 'MODEL_WORKER_PIN_CORES',
+                       'MODEL_STUDENT_PATH', 'INFERENCE_MAX_BATCH_SIZE', 'INFERENCE_MAX_WAIT_MS', 'INFERENCE_QUEUE_SIZE',
+                       'PREPROCESS_WORKERS', 'PREDICT_MODE', 'PREDICTION_CACHE_ENABLED')
+
+
+def encode_multipart(form, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in form.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, payload) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(payload)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class ClientTransport:
+    # One Flask test client per load-generator thread
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def send(self, call):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        data = dict(call.form or {})
+        for name, (filename, payload) in (call.files or {}).items():
+            data[name] = (io.BytesIO(payload), filename)
+        response = client.open(call.path, method=call.method, data=data or None)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+def _serve(port):
+    from werkzeug.serving import make_server
+    import app
+    make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+class HttpTransport:
+    """Serves the app from a forked child and talks to it over loopback HTTP."""
+
+    def __init__(self):
+        self.port = free_port()
+        self.base = f'http://127.0.0.1:{self.port}'
+        self._server = multiprocessing.get_context('fork').Process(target=_serve, args=(self.port,), daemon=True)
+        self._server.start()
+        wait_until_warm(self.base, 1)
+
+    def send(self, call):
+        headers = {}
+        body = None
+        if call.files:
+            body, headers['Content-Type'] = encode_multipart(call.form or {}, call.files)
+        elif call.form:
+            body = urllib.parse.urlencode(call.form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base + call.path, data=body, headers=headers, method=call.method)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def close(self):
+        self._server.terminate()
+        self._server.join(30)
+
+
+def run_load(transport, calls, concurrency, warmup=None):
+    """Sends ``calls`` from ``concurrency`` threads; only 200 responses count towards latency.
+
+    The first ``warmup`` calls (default: a tenth, at least two rounds) are sent unmeasured.
+    """
+    if warmup is None:
+        warmup = max(2 * concurrency, len(calls) // 10)
+    def send(call):
+        started = time.perf_counter()
+        try:
+            status = transport.send(call)
+        except OSError:
+            status = None
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, calls[:warmup]))
+        started = time.perf_counter()
+        outcomes = list(pool.map(send, calls))
+        elapsed = time.perf_counter() - started
+    latencies = [l for l, status in outcomes if status == 200]
+    return {
+        'requests': len(calls),
+        'concurrency': concurrency,
+        'requests_per_second': len(latencies) / elapsed,
+        'errors': len(outcomes) - len(latencies),
+        'latency': summarize(latencies)
+    }
+
+
+def reseed_facilities(viperaid, rows, rng):
+    # Synthetic hospitals and rescuers shaped like populate_db.py's rows, spread across Nepal
+    with viperaid.app.app_context():
+        for model in (viperaid.Hospital, viperaid.Rescuer):
+            model.query.delete()
+            viperaid.db.session.add_all(
+                model(name=f'{model.__name__} {i}', phone=f'+977-98{rng.randrange(10 ** 8):08d}',
+                      latitude=round(rng.uniform(*LAT_RANGE), 4), longitude=round(rng.uniform(*LON_RANGE), 4))
+                for i in range(rows)
+            )
+        viperaid.db.session.commit()
+        # Forked servers must not inherit these connections
+        viperaid.db.engine.dispose()
+
+
+def predict_calls(size, count, seed):
+    width, height = size
+    # A few distinct images per size; the prediction cache is off, so repeats are still classified
+    images = [synthetic_jpeg(width, height, seed=seed + i) for i in range(min(count, 8))]
+    return [Call('POST', '/predict', None, {'snakeImage': ('bench.jpg', images[i % len(images)])}) for i in range(count)]
+
+
+def location_calls(endpoint, count, rng):
+    return [
+        Call('GET', f'/api/{endpoint}?lat={rng.uniform(*LAT_RANGE):.4f}&lon={rng.uniform(*LON_RANGE):.4f}&k=10', None, None)
+        for _ in range(count)
+    ]
+
+
+def submit_calls(count, rng):
+    return [
+        Call('POST', '/submit_request', {
+            'name': f'bench-{i}', 'phone': '9800000000', 'snakeSpecies': rng.choice(SPECIES),
+            'location': f'{rng.uniform(*LAT_RANGE):.5f}, {rng.uniform(*LON_RANGE):.5f}',
+            'request_type': rng.choice(('rescue', 'snakebite'))
+        }, None)
+        for i in range(count)
+    ]
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def run_suite(viperaid, args):
+    make_transport = (lambda: ClientTransport(viperaid.app)) if args.transport == 'client' else HttpTransport
+    rng = random.Random(args.seed)
+    results = {}
+    if args.transport == 'client':
+        # HttpTransport waits in the server process instead; the parent never loads the model
+        viperaid.ml_runtime.wait()
+
+    def measure(name, calls, concurrency):
+        results[name] = run_load(transport, calls, concurrency)
+        r = results[name]
+        print(f"{name:<32} {r['requests_per_second']:9.1f} req/s  p50 {r['latency']['p50_ms']:8.1f} ms  "
+              f"p95 {r['latency']['p95_ms']:8.1f} ms  p99 {r['latency']['p99_ms']:8.1f} ms  errors {r['errors']}")
+
+    if 'locations' in args.scenarios:
+        for rows in args.facility_rows:
+            reseed_facilities(viperaid, rows, rng)
+            transport = make_transport()
+            try:
+                for endpoint in ('hospitals', 'rescuers'):
+                    measure(f'{endpoint}/rows={rows}', location_calls(endpoint, args.location_requests, rng),
+                            args.location_concurrency)
+            finally:
+                transport.close()
+
+    if 'predict' in args.scenarios or 'submit' in args.scenarios:
+        transport = make_transport()
+        try:
+            if 'predict' in args.scenarios:
+                for size in args.image_sizes.split(','):
+                    calls = predict_calls(parse_size(size), args.predict_requests, args.seed)
+                    for concurrency in args.predict_concurrency:
+                        measure(f'predict/{size}/c={concurrency}', calls, concurrency)
+            if 'submit' in args.scenarios:
+                for concurrency in args.submit_concurrency:
+                    measure(f'submit/c={concurrency}', submit_calls(args.submit_requests, rng), concurrency)
+        finally:
+            transport.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Rows of (name, throughput change, p95 change, regressed) for scenarios in both runs."""
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        throughput = (current['requests_per_second'] / previous['requests_per_second'] - 1
+                      if previous['requests_per_second'] else 0.0)
+        p95 = current['latency']['p95_ms'] / previous['latency']['p95_ms'] - 1 if previous['latency']['p95_ms'] else 0.0
+        regressed = throughput < -tolerance or p95 > tolerance or current['errors'] > previous['errors']
+        rows.append((name, throughput, p95, regressed))
+    return rows
+
+
+def run_settings(viperaid, args):
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ('output', 'baseline', 'update_baseline', 'database_url', 'tolerance')}
+    settings['config'] = {key: viperaid.app.config[key] for key in SERVING_CONFIG_KEYS}
+    settings['cpu_count'] = os.cpu_count()
+    return settings
+
+
+def settings_mismatch(settings, baseline):
+    """(name, baseline value, current value) for settings that make the runs incomparable.
+
+    --scenarios may differ: only the scenarios in both runs are compared.
+    """
+    current = dict(settings, **{f'config.{key}': value for key, value in settings['config'].items()})
+    previous = dict(baseline, **{f'config.{key}': value for key, value in baseline.get('config', {}).items()})
+    return [(key, previous.get(key), value) for key, value in sorted(current.items())
+            if key not in ('scenarios', 'config') and previous.get(key) != value]
+
+
+def load_app(args, tmp):
+    # The app reads its configuration at import, so the environment is set up first
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tmp, 'suite.db')
+    if not args.prediction_cache:
+        os.environ['PREDICTION_CACHE_ENABLED'] = '0'
+    import app
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=['predict', 'locations', 'submit'],
+                        default=['predict', 'locations', 'submit'])
+    parser.add_argument('--transport', choices=['client', 'http'], default='client')
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes and request counts, for CI')
+    parser.add_argument('--image-sizes', default='320x240,1280x960,4000x3000')
+    parser.add_argument('--predict-concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--predict-requests', type=int, default=64)
+    parser.add_argument('--prediction-cache', action='store_true', help='Keep the prediction cache enabled')
+    parser.add_argument('--facility-rows', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--location-requests', type=int, default=1000)
+    parser.add_argument('--location-concurrency', type=int, default=16)
+    parser.add_argument('--submit-concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--submit-requests', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', help='Scratch database to use instead of a fresh SQLite file')
+    parser.add_argument('--output', default='bench/suite.json')
+    parser.add_argument('--baseline', help='Earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative change before flagging')
+    parser.add_argument('--update-baseline', action='store_true', help='Overwrite --baseline with this run')
+    args = parser.parse_args()
+    if args.quick:
+        for key, value in QUICK.items():
+            if getattr(args, key) == parser.get_default(key):
+                setattr(args, key, value)
+    if args.update_baseline and not args.baseline:
+        parser.error('--update-baseline needs --baseline')
+
+    tmp = tempfile.mkdtemp()
+    try:
+        viperaid = load_app(args, tmp)
+        results = run_suite(viperaid, args)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    settings = run_settings(viperaid, args)
+    write_results(args.output, {'settings': settings, 'scenarios': results})
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        mismatched = settings_mismatch(settings, baseline.get('settings', {}))
+        if mismatched:
+            print(f"\nNot compared with {args.baseline}, which was recorded with other settings:")
+            for key, previous, current in mismatched:
+                print(f"  {key}: {previous!r} in the baseline, {current!r} in this run")
+            status = 2
+        else:
+            print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for name, throughput, p95, regressed in compare(results, baseline['scenarios'], args.tolerance):
+                print(f"{name:<32} throughput {throughput:+7.1%}  p95 {p95:+7.1%}  "
+                      f"{'REGRESSION' if regressed else 'ok'}")
+                if regressed:
+                    status = 1
+    elif args.baseline:
+        print(f"No baseline at {args.baseline} yet")
+    if args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        status = 0 if status == 2 else status
+    # Skip interpreter shutdown, which would wait on the app's background threads
+    sys.stdout.flush()
+    os._exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Per-request peak memory and latency of /predict for ordinary and hostile uploads.
+
+    python -m benchmarks.uploads --output bench/uploads.json
+    python -m benchmarks.uploads --bomb-side 20000 --repeat 5
+
+Every payload is sent with the upload limits off ("unbounded": no body cap, no pixel
+budget or format list, the whole body in memory) and with the app's configured limits
+("bounded"). Peak memory is the process's peak RSS during the request above its RSS just
+before it; the request body is built beforehand and not counted. The peak is reset
+through /proc/self/clear_refs, so this runs on Linux only.
+
+Payloads: a 12 MP phone-style JPEG, a large JPEG that reduced-scale decoding brings
+within budget, a large PNG over the pixel budget, a PNG "pixel bomb" (a small file that
+decodes to hundreds of MB) and a body over the byte cap.
+"""
+import argparse
+import ctypes
+import gc
+import io
+import os
+import re
+import tempfile
+import time
+
+from PIL import Image
+from werkzeug.test import EnvironBuilder
+
+from benchmarks.common import synthetic_jpeg, write_results
+
+
+def _rss_kb(field):
+    with open('/proc/self/status') as f:
+        return int(re.search(rf'{field}:\s+(\d+)', f.read()).group(1))
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        # Hand freed heap back to the OS so the next baseline is not inflated
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def gradient_image(fmt, width, height):
+    # Smooth, highly compressible content: the file stays small whatever the pixel count
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buf, fmt, quality=85)
+    else:
+        img.save(buf, fmt, compress_level=9)
+    return buf.getvalue()
+
+
+def payloads(args):
+    return [
+        ('photo_12mp_jpeg', 'photo.jpg', synthetic_jpeg(4000, 3000)),
+        ('large_jpeg', 'large.jpg', gradient_image('JPEG', args.large_side * 4 // 3, args.large_side)),
+        ('large_png', 'large.png', gradient_image('PNG', args.large_side * 4 // 3, args.large_side)),
+        ('png_pixel_bomb', 'bomb.png', gradient_image('PNG', args.bomb_side, args.bomb_side)),
+        ('oversized_body', 'big.jpg', os.urandom(args.oversized_mb * 1024 * 1024))
+    ]
+
+
+def measure(app_module, filename, data):
+    environ = EnvironBuilder(path='/predict', method='POST',
+                             data={'snakeImage': (io.BytesIO(data), filename)}).get_environ()
+    statuses = []
+    _release_memory()
+    baseline = _rss_kb('VmRSS')
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    started = time.perf_counter()
+    body = b''.join(app_module.app.wsgi_app(environ, lambda status, headers: statuses.append(status)))
+    elapsed = time.perf_counter() - started
+    peak = _rss_kb('VmHWM')
+    return {
+        'status': int(statuses[0].split()[0]),
+        'latency_ms': elapsed * 1000,
+        'peak_mb': max(0, peak - baseline) / 1024,
+        'response': body[:120].decode('utf-8', 'replace')
+    }
+
+
+def configure(app_module, stack, bounded, limits):
+    config = app_module.app.config
+    for key, value in limits.items():
+        config[key] = value if bounded else {'UPLOAD_SPOOL_BYTES': 1 << 40}.get(key, 0)
+    for preprocessor in (stack.preprocessor, stack.student.preprocessor if stack.student else None):
+        if preprocessor is not None:
+            preprocessor.max_pixels = limits['PREDICT_MAX_PIXELS'] if bounded else 0
+            preprocessor.formats = limits['PREDICT_IMAGE_FORMATS'] if bounded else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--large-side', type=int, default=6000, help='Height of the large JPEG/PNG (4:3)')
+    parser.add_argument('--bomb-side', type=int, default=12000, help='Side of the square PNG pixel bomb')
+    parser.add_argument('--oversized-mb', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench/uploads.json')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='viperaid-uploads-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'uploads.db')
+    os.environ['PREDICTION_CACHE_ENABLED'] = '0'
+    # Measured here, not refused by Pillow's own (much higher) decompression-bomb limit
+    Image.MAX_IMAGE_PIXELS = None
+    import app as app_module
+
+    stack = app_module.ml_runtime.wait()
+    if stack is None:
+        raise SystemExit(f"Model failed to load: {app_module.ml_runtime.error}")
+    limits = {key: app_module.app.config[key] for key in
+              ('PREDICT_MAX_UPLOAD_BYTES', 'PREDICT_MAX_PIXELS', 'PREDICT_IMAGE_FORMATS', 'UPLOAD_SPOOL_BYTES')}
+    cases = payloads(args)
+    # Warm up the model and allocator so the first payload measured is not penalized
+    configure(app_module, stack, True, limits)
+    measure(app_module, *cases[0][1:])
+
+    results = {'limits': limits, 'payloads': {}}
+    for name, filename, data in cases:
+        results['payloads'][name] = {'bytes': len(data)}
+        for bounded in (False, True):
+            configure(app_module, stack, bounded, limits)
+            runs = [measure(app_module, filename, data) for _ in range(args.repeat)]
+            runs.sort(key=lambda r: r['latency_ms'])
+            summary = dict(runs[len(runs) // 2], peak_mb=max(r['peak_mb'] for r in runs))
+            results['payloads'][name]['bounded' if bounded else 'unbounded'] = summary
+            print(f"{name:>16} {'bounded' if bounded else 'unbounded':>9}: {summary['status']}  "
+                  f"{summary['latency_ms']:8.1f} ms  peak +{summary['peak_mb']:7.1f} MB", flush=True)
+    stack.engine.stop()
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
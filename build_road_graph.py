@@ -0,0 +1,118 @@
+"""Build the offline road graph used for travel-time ranking from an OpenStreetMap extract.
+
+    python build_road_graph.py nepal-latest.osm --output instance/road_graph.npz
+    osmium cat nepal-latest.osm.pbf -o nepal-latest.osm   # .pbf extracts need converting first
+
+Every way with a routable highway tag becomes directed edges between its consecutive
+nodes (both directions unless oneway). Edge travel time uses the way's maxspeed when it
+is a plain km/h number, else a default speed per highway class. Only nodes used by
+roads are kept, numbered densely.
+"""
+import argparse
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from geo import CoordinateArrays, _haversine_arrays
+
+# km/h; paths and tracks are kept because in the hills they are often the only way out
+HIGHWAY_SPEEDS = {
+    'motorway': 80, 'motorway_link': 50,
+    'trunk': 60, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35,
+    'secondary': 40, 'secondary_link': 30,
+    'tertiary': 30, 'tertiary_link': 25,
+    'unclassified': 25, 'residential': 20, 'living_street': 10, 'service': 15,
+    'road': 20, 'track': 12, 'path': 4, 'footway': 4, 'steps': 2
+}
+
+
+def way_speed(tags):
+    maxspeed = tags.get('maxspeed', '')
+    if maxspeed.isdigit() and int(maxspeed) > 0:
+        return min(int(maxspeed), HIGHWAY_SPEEDS[tags['highway']] * 2)
+    return HIGHWAY_SPEEDS[tags['highway']]
+
+
+def way_direction(tags):
+    # 1 = forward only, -1 = backward only, 0 = both ways
+    oneway = tags.get('oneway', '')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == '' and (tags['highway'] in ('motorway', 'motorway_link') or tags.get('junction') == 'roundabout'):
+        return 1
+    return 0
+
+
+def parse_osm(path):
+    coords = {}
+    ways = []
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if elem.tag == 'node':
+            coords[int(elem.get('id'))] = (float(elem.get('lat')), float(elem.get('lon')))
+            elem.clear()
+        elif elem.tag == 'way':
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            if tags.get('highway') in HIGHWAY_SPEEDS and tags.get('access') not in ('no', 'private'):
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                ways.append((refs, way_speed(tags), way_direction(tags)))
+            elem.clear()
+    return coords, ways
+
+
+def build_graph(coords, ways):
+    node_ids = {}
+    edges = []  # (source, target, speed)
+    for refs, speed, direction in ways:
+        refs = [r for r in refs if r in coords]
+        for a, b in zip(refs, refs[1:]):
+            u = node_ids.setdefault(a, len(node_ids))
+            v = node_ids.setdefault(b, len(node_ids))
+            if direction >= 0:
+                edges.append((u, v, speed))
+            if direction <= 0:
+                edges.append((v, u, speed))
+
+    lat = np.empty(len(node_ids), dtype=np.float64)
+    lon = np.empty(len(node_ids), dtype=np.float64)
+    for osm_id, node in node_ids.items():
+        lat[node], lon[node] = coords[osm_id]
+    edges = np.asarray(edges, dtype=np.float64).reshape(-1, 3)
+    sources = edges[:, 0].astype(np.int64)
+    targets = edges[:, 1].astype(np.int64)
+    # Element-wise: both operands have one entry per edge
+    length_m = _haversine_arrays(
+        CoordinateArrays(lat[sources], lon[sources]),
+        CoordinateArrays(lat[targets], lon[targets])
+    ) * 1000
+    time_s = length_m / (edges[:, 2] / 3.6)
+
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=indptr[1:])
+    return {
+        'lat': lat,
+        'lon': lon,
+        'indptr': indptr,
+        'indices': targets[order].astype(np.int32),
+        'time_s': time_s[order].astype(np.float32),
+        'length_m': length_m[order].astype(np.float32)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('osm', help='OpenStreetMap XML extract (.osm)')
+    parser.add_argument('--output', default='instance/road_graph.npz')
+    args = parser.parse_args()
+
+    coords, ways = parse_osm(args.osm)
+    graph = build_graph(coords, ways)
+    np.savez(args.output, **graph)
+    print(f"Wrote {args.output}: {len(graph['lat'])} nodes, {len(graph['indices'])} edges")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Classify a directory tree of snake images offline, without going through HTTP.
+
+    python classify_images.py /data/camera_trap --output results.csv --top-k 3
+    python classify_images.py /data/intake --output results_parquet --format parquet
+
+Re-running with the same output resumes: images already present in the output are skipped.
+Results are written as they come, so a killed run loses little: an incomplete last CSV row
+is dropped on resume, and parquet part files are written every 4096 rows or 30 seconds.
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+
+from app import app, snake_classes, SNAKE_INFO
+from ml import build_transform, list_images, load_model
+
+transform = build_transform()
+
+
+class ImagePathDataset(Dataset):
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with Image.open(self.paths[index]) as img:
+                return transform(img.convert('RGB')), index, ''
+        except Exception as e:
+            # Keep the batch shape; the row is written with the error instead of a prediction
+            return torch.zeros(3, 384, 384), index, str(e) or type(e).__name__
+
+
+def result_columns(top_k):
+    columns = ['path', 'species', 'confidence', 'danger']
+    for i in range(1, top_k + 1):
+        columns += [f'top{i}_species', f'top{i}_prob']
+    return columns + ['error']
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def _drop_partial_row(self):
+        # A hard kill can leave half a row at the end; cut back to the end of the last full one.
+        # Rows end with the writer's \r\n, while newlines inside quoted fields are bare \n.
+        with open(self.path, 'rb+') as f:
+            size = pos = f.seek(0, os.SEEK_END)
+            keep = 0
+            while pos > 0:
+                start = max(0, pos - 65536)
+                f.seek(start)
+                # One byte of overlap catches a \r\n split across two chunks
+                end = f.read(min(size, pos + 1) - start).rfind(b'\r\n')
+                if end >= 0:
+                    keep = start + end + 2
+                    break
+                pos = start
+            if keep < size:
+                print(f"Dropping an incomplete last row from {self.path}", flush=True)
+                f.truncate(keep)
+
+    def completed(self):
+        if not os.path.exists(self.path):
+            return set()
+        self._drop_partial_row()
+        with open(self.path, newline='', encoding='utf-8') as f:
+            return {row['path'] for row in csv.DictReader(f)}
+
+    def open(self):
+        if os.path.exists(self.path):
+            self._drop_partial_row()
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns)
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    # Parquet files cannot be appended to, so each flush becomes a new part file in a directory.
+    # Buffered rows are lost if the process is killed, so they are flushed every flush_seconds too.
+    def __init__(self, path, columns, rows_per_part=4096, flush_seconds=30.0):
+        import pyarrow  # noqa: F401  (fail early if parquet support is missing)
+        self.path = path
+        self.columns = columns
+        self.rows_per_part = rows_per_part
+        self.flush_seconds = flush_seconds
+        self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def completed(self):
+        import pyarrow.parquet as pq
+        done = set()
+        for part in self._parts():
+            done.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+        return done
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._next_part = len(self._parts())
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.rows_per_part or time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+        # Explicit schema so parts where a column is all-null still read back as one dataset
+        schema = pa.schema([
+            (c, pa.float64() if c == 'confidence' or c.endswith('_prob') else pa.string()) for c in self.columns
+        ])
+        table = pa.Table.from_pylist(self._buffer, schema=schema)
+        target = os.path.join(self.path, f'part-{self._next_part:05d}.parquet')
+        # Write then rename so an interrupted run never leaves a truncated part behind
+        pq.write_table(table, target + '.tmp')
+        os.replace(target + '.tmp', target)
+        self._next_part += 1
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+
+
+def build_rows(paths, probabilities, indices, errors, top_k):
+    confidences, classes = torch.topk(probabilities, top_k, dim=1)
+    rows = []
+    for row, (index, error) in enumerate(zip(indices, errors)):
+        record = {column: None for column in result_columns(top_k)}
+        record['path'] = paths[index]
+        if error:
+            record['error'] = error
+        else:
+            species = snake_classes[classes[row, 0].item()]
+            record.update({
+                'species': species,
+                'confidence': confidences[row, 0].item(),
+                'danger': SNAKE_INFO[species]['danger']
+            })
+            for i in range(top_k):
+                record[f'top{i + 1}_species'] = snake_classes[classes[row, i].item()]
+                record[f'top{i + 1}_prob'] = confidences[row, i].item()
+        rows.append(record)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='Directory to scan recursively for images')
+    parser.add_argument('--output', required=True, help='CSV file, or directory of part files for parquet')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--log-every', type=float, default=10.0, help='Seconds between progress lines')
+    args = parser.parse_args()
+
+    model, device = load_model(app.config['MODEL_PATH'], len(snake_classes))
+    top_k = min(args.top_k, len(snake_classes))
+    columns = result_columns(top_k)
+    writer = CsvWriter(args.output, columns) if args.format == 'csv' else ParquetWriter(args.output, columns)
+
+    paths = list_images(args.root)
+    done = writer.completed()
+    paths = [p for p in paths if p not in done]
+    print(f"{len(paths)} images to classify ({len(done)} already in {args.output})", flush=True)
+    if not paths:
+        return
+
+    loader = DataLoader(
+        ImagePathDataset(paths),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        pin_memory=device.type == 'cuda',
+        persistent_workers=args.workers > 0,
+        prefetch_factor=4 if args.workers > 0 else None
+    )
+
+    writer.open()
+    processed = 0
+    started = last_log = time.perf_counter()
+    try:
+        with torch.inference_mode():
+            for images, indices, errors in loader:
+                probabilities = torch.softmax(model(images.to(device, non_blocking=True)).float(), dim=1).cpu()
+                writer.write(build_rows(paths, probabilities, indices.tolist(), errors, top_k))
+                processed += len(indices)
+                now = time.perf_counter()
+                if now - last_log >= args.log_every:
+                    print(f"{processed}/{len(paths)} images, {processed / (now - started):.1f} images/sec", flush=True)
+                    last_log = now
+    finally:
+        writer.close()
+        elapsed = time.perf_counter() - started
+        print(f"Classified {processed} images in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} images/sec)")
+
+
+if __name__ == '__main__':
+    main()
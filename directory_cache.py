@@ -0,0 +1,49 @@
+import hashlib
+import threading
+import time
+
+
+def snap_to_cell(lat, lon, cell_deg):
+    # Centre of the grid cell containing the point; cell_deg=0 leaves it unchanged
+    if not cell_deg:
+        return lat, lon
+    return round(round(lat / cell_deg) * cell_deg, 6), round(round(lon / cell_deg) * cell_deg, 6)
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+class VersionWatcher:
+    """Tracks per-table change counters that live in the database.
+
+    ``loader`` returns ``{table: (version, updated_at)}``. It is called at most once every
+    ``interval`` seconds, so changes committed by other processes (other workers,
+    populate_db.py) are noticed within that delay. ``on_change(table)`` runs for every
+    table whose version moved since the previous read, and for every table on the first
+    read, since anything cached before it cannot be matched to a version.
+    """
+
+    def __init__(self, loader, on_change, interval=5.0):
+        self._loader = loader
+        self._on_change = on_change
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._checked_at = None
+
+    def expire(self):
+        # Force a re-read on the next lookup, e.g. right after a local commit
+        self._checked_at = None
+
+    def get(self, table):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.interval:
+                versions = self._loader()
+                changed = [t for t, v in versions.items() if self._versions.get(t) != v]
+                self._versions = versions
+                self._checked_at = now
+                for t in changed:
+                    self._on_change(t)
+            return self._versions.get(table, (0, None))
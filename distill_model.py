@@ -0,0 +1,219 @@
+"""Distill the EfficientNetV2-S classifier into a small student model for tiered serving.
+
+    python distill_model.py /data/Snake_Dataset --output models/student_mobilenetv3.pth
+    python distill_model.py /data/Snake_Dataset --arch efficientnet_b0 --init efficientnet_b0.ra_in1k \\
+        --output models/student_b0.pth
+
+The teacher (--teacher, the app's MODEL_PATH checkpoint) labels every augmented training
+batch at its own 384 px resolution; the student sees the same batch resized to --img-size
+and learns from the teacher's softened probabilities (--temperature) mixed with the true
+labels (--alpha is the teacher's share). The split and decoded-image cache are the ones
+train_model.py uses, so a dataset already cached for training is not decoded again.
+
+After every epoch the student is scored on the validation split against the teacher:
+accuracy, agreement, venomous species predicted as non-venomous and, for tiered serving
+at --threshold, how often the teacher would be called and the accuracy of the combined
+answer. Only the student is guaranteed not to have trained on these images: a teacher from
+train_model.py with the same --seed and --val-ratio held them out too, but one trained
+elsewhere (such as the shipped weights) may have seen them, which inflates the teacher's
+accuracy, the agreement and the tiered accuracy. The best student so far is saved after
+each epoch, with these numbers in a JSON file next to it. Since that starts with the
+first epoch, an existing --output (such as the student tiered serving uses) is only
+overwritten with --force. Point
+MODEL_STUDENT_PATH / MODEL_STUDENT_ARCH / MODEL_STUDENT_IMAGE_SIZE at the result and use
+PREDICT_MODE=tiered; ``python -m benchmarks.predict_modes`` measures the latency side.
+"""
+import argparse
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+
+from app import app, snake_classes, danger_levels
+from ml import IMAGE_SIZE, load_model
+from prediction_modes import should_defer
+from preprocess import IMAGENET_MEAN, IMAGENET_STD
+from train_model import (amp_dtype, build_model, build_shard, build_split, make_loader, save_checkpoint,
+                         ShardDataset)
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    # Hinton et al.: KL on temperature-softened outputs, scaled by T^2 to keep gradient size independent of T
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1), F.softmax(teacher_logits / temperature, dim=1),
+                    reduction='batchmean') * temperature ** 2
+    return alpha * soft + (1 - alpha) * F.cross_entropy(student_logits, labels)
+
+
+def batches(loader, device, normalize, student_size, memory_format, limit):
+    """Normalized (teacher view, student view, labels) per batch, plus the time spent waiting for data."""
+    fetched = time.perf_counter()
+    for step, (images, labels) in enumerate(loader):
+        wait = time.perf_counter() - fetched
+        images = normalize(images.to(device, non_blocking=True).float())
+        small = F.interpolate(images, size=(student_size, student_size), mode='bilinear', antialias=True,
+                              align_corners=False)
+        yield (images.contiguous(memory_format=memory_format), small.contiguous(memory_format=memory_format),
+               labels.to(device, non_blocking=True), wait)
+        if limit and step + 1 >= limit:
+            return
+        fetched = time.perf_counter()
+
+
+def train_epoch(student, teacher, loader, device, normalize, args, dtype, optimizer, scheduler, scaler, epoch):
+    student.train()
+    memory_format = torch.channels_last if args.channels_last else torch.contiguous_format
+    total_loss = seen = 0
+    wait = 0.0
+    started = time.perf_counter()
+    steps = len(loader)
+    for step, (images, small, labels, waited) in enumerate(
+            batches(loader, device, normalize, args.img_size, memory_format, args.limit_batches)):
+        wait += waited
+        with torch.autocast(device.type, dtype=dtype, enabled=dtype is not None):
+            with torch.no_grad():
+                teacher_logits = teacher(images)
+            loss = distillation_loss(student(small).float(), teacher_logits.float(), labels, args.temperature,
+                                     args.alpha)
+        optimizer.zero_grad(set_to_none=True)
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        scheduler.step(epoch + (step + 1) / steps)
+        total_loss += loss.item() * len(labels)
+        seen += len(labels)
+    elapsed = time.perf_counter() - started
+    return {
+        'loss': total_loss / seen if seen else 0.0,
+        'images_per_second': seen / elapsed if elapsed else 0.0,
+        'data_wait': wait / elapsed if elapsed else 0.0
+    }
+
+
+@torch.inference_mode()
+def predict_split(model, loader, device, normalize, args, dtype, use_student_view):
+    model.eval()
+    memory_format = torch.channels_last if args.channels_last else torch.contiguous_format
+    probabilities, labels = [], []
+    for images, small, batch_labels, _ in batches(loader, device, normalize, args.img_size, memory_format,
+                                                   args.limit_batches):
+        with torch.autocast(device.type, dtype=dtype, enabled=dtype is not None):
+            logits = model(small if use_student_view else images)
+        probabilities.append(torch.softmax(logits.float(), dim=1).cpu())
+        labels.append(batch_labels.cpu())
+    return torch.cat(probabilities), torch.cat(labels)
+
+
+def compare(student_probs, teacher_probs, labels, threshold):
+    """Student, teacher and tiered (student, deferring to the teacher) scores on the same images."""
+    student_pred = student_probs.argmax(dim=1)
+    teacher_pred = teacher_probs.argmax(dim=1)
+    deferred = torch.tensor([should_defer(p, threshold, danger_levels) for p in student_probs], dtype=torch.bool)
+    tiered_pred = torch.where(deferred, teacher_pred, student_pred)
+    harmless = torch.tensor([level == 'Non-venomous' for level in danger_levels])
+
+    def dangerous_as_harmless(predictions):
+        return int((~harmless[labels] & harmless[predictions]).sum())
+
+    return {
+        'images': len(labels),
+        'student_accuracy': (student_pred == labels).float().mean().item(),
+        'teacher_accuracy': (teacher_pred == labels).float().mean().item(),
+        'agreement': (student_pred == teacher_pred).float().mean().item(),
+        'student_dangerous_as_harmless': dangerous_as_harmless(student_pred),
+        'teacher_dangerous_as_harmless': dangerous_as_harmless(teacher_pred),
+        'tiered_threshold': threshold,
+        'tiered_teacher_rate': deferred.float().mean().item(),
+        'tiered_accuracy': (tiered_pred == labels).float().mean().item(),
+        'tiered_dangerous_as_harmless': dangerous_as_harmless(tiered_pred)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_dir', help='One sub-folder of images per species')
+    parser.add_argument('--teacher', default=app.config['MODEL_PATH'])
+    parser.add_argument('--arch', default='mobilenetv3_large_100', help='timm architecture of the student')
+    parser.add_argument('--init', default='mobilenetv3_large_100.ra_in1k',
+                        help='Student checkpoint path or timm pretrained model name')
+    parser.add_argument('--output', default='models/student_mobilenetv3.pth')
+    parser.add_argument('--force', action='store_true', help='Overwrite --output if it already exists')
+    parser.add_argument('--cache-dir', default='instance/train_cache')
+    parser.add_argument('--img-size', type=int, default=224, help='Student input size')
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help="Weight of the teacher's soft targets")
+    parser.add_argument('--threshold', type=float, default=app.config['PREDICT_TIERED_THRESHOLD'],
+                        help='Student confidence below which tiered serving asks the teacher')
+    parser.add_argument('--val-ratio', type=float, default=0.15)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--weight-decay', type=float, default=1e-4)
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument('--prefetch', type=int, default=4)
+    parser.add_argument('--channels-last', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--amp', choices=['auto', 'on', 'off'], default='auto')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--limit-batches', type=int, default=0, help='Stop each pass after this many batches')
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        parser.error(f'{args.output} already exists (it may be the student the app serves); '
+                     'choose another --output or pass --force')
+
+    torch.manual_seed(args.seed)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    os.makedirs(args.cache_dir, exist_ok=True)
+    # Same split and teacher-resolution cache as train_model.py. The student never trains on the validation images,
+    # but a teacher trained elsewhere (e.g. the original notebook) may have, so its numbers can be optimistic
+    split = build_split(args.data_dir, args.val_ratio, args.seed)
+    train_loader = make_loader(ShardDataset(*build_shard(args.data_dir, split['train'], IMAGE_SIZE, args.cache_dir,
+                                                         'train', args.workers), augment=True), args, shuffle=True)
+    val_loader = make_loader(ShardDataset(*build_shard(args.data_dir, split['val'], IMAGE_SIZE, args.cache_dir,
+                                                       'val', args.workers), augment=False), args, shuffle=False)
+    if not len(val_loader.dataset):
+        parser.error('the validation split is empty; add images or raise --val-ratio')
+
+    memory_format = torch.channels_last if args.channels_last else torch.contiguous_format
+    teacher, _ = load_model(args.teacher, len(snake_classes), device=device)
+    teacher = teacher.to(memory_format=memory_format)
+    student = build_model(args.init, len(snake_classes), arch=args.arch).to(device, memory_format=memory_format)
+    print(f"Student {args.arch}: {sum(p.numel() for p in student.parameters()) / 1e6:.1f}M parameters, "
+          f"teacher: {sum(p.numel() for p in teacher.parameters()) / 1e6:.1f}M", flush=True)
+
+    dtype = amp_dtype(device, args.amp)
+    mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1) * 255
+    std = torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1) * 255
+    normalize = lambda images: images.sub_(mean).div_(std)  # noqa: E731
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingWarmRestarts(optimizer, T_0=5, T_mult=2)
+    scaler = torch.amp.GradScaler(device.type, enabled=dtype == torch.float16)
+
+    # The teacher's validation predictions do not change, so they are computed once
+    teacher_probs, labels = predict_split(teacher, val_loader, device, normalize, args, dtype, use_student_view=False)
+    print(f"Distilling on {device} (amp={dtype}, channels_last={args.channels_last}, workers={args.workers}); "
+          f"teacher val acc {(teacher_probs.argmax(dim=1) == labels).float().mean().item():.2%}", flush=True)
+
+    best = None
+    history = []
+    for epoch in range(args.epochs):
+        train = train_epoch(student, teacher, train_loader, device, normalize, args, dtype, optimizer, scheduler,
+                            scaler, epoch)
+        student_probs, _ = predict_split(student, val_loader, device, normalize, args, dtype, use_student_view=True)
+        val = compare(student_probs, teacher_probs, labels, args.threshold)
+        history.append({'epoch': epoch + 1, 'train': train, 'val': val})
+        print(f"Epoch {epoch + 1}/{args.epochs}: loss {train['loss']:.4f}, student acc {val['student_accuracy']:.2%}, "
+              f"agreement {val['agreement']:.2%}, tiered acc {val['tiered_accuracy']:.2%} "
+              f"(teacher on {val['tiered_teacher_rate']:.0%}), {train['images_per_second']:.1f} images/sec "
+              f"({train['data_wait']:.0%} waiting for data)", flush=True)
+        if best is None or val['student_accuracy'] > best:
+            best = val['student_accuracy']
+            save_checkpoint(student, args.output, {
+                'arch': args.arch, 'classes': snake_classes, 'img_size': args.img_size, 'teacher': args.teacher,
+                'epoch': epoch + 1, 'temperature': args.temperature, 'alpha': args.alpha, 'val': val,
+                'history': history
+            })
+            print(f"Saved {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import heapq
+import math
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
+
+
+# Haversine Formula
+def haversine(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
+
+
+class CoordinateArrays:
+    # Radian coordinates and cos(latitude) kept ready for vectorized distance passes
+    __slots__ = ('lat', 'lon', 'cos_lat')
+
+    def __init__(self, lats, lons):
+        self.lat = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lon = np.radians(np.asarray(lons, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+
+    def __len__(self):
+        return len(self.lat)
+
+
+def _haversine_arrays(src, dst):
+    # Broadcasting haversine between two CoordinateArrays-like operands
+    dlat = dst.lat - src.lat
+    dlon = dst.lon - src.lon
+    a = np.sin(dlat / 2) ** 2 + src.cos_lat * dst.cos_lat * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class _Column:
+    # A slice of CoordinateArrays shaped (n, 1) so it broadcasts against a row of destinations
+    __slots__ = ('lat', 'lon', 'cos_lat')
+
+    def __init__(self, coords, start=0, end=None):
+        self.lat = coords.lat[start:end, None]
+        self.lon = coords.lon[start:end, None]
+        self.cos_lat = coords.cos_lat[start:end, None]
+
+
+def haversine_np(lat, lon, lats, lons):
+    """Distances in km from one point to arrays of points, in a single NumPy pass."""
+    return _haversine_arrays(CoordinateArrays([lat], [lon]), CoordinateArrays(lats, lons))
+
+
+def distance_matrix(src_lats, src_lons, dst_lats, dst_lons):
+    """Distance in km from every source point (rows) to every destination point (columns)."""
+    src = CoordinateArrays(src_lats, src_lons)
+    dst = CoordinateArrays(dst_lats, dst_lons)
+    return _haversine_arrays(_Column(src), dst)
+
+
+def nearest_many(src, dst, chunk_size=1024):
+    """Index of and distance to the nearest ``dst`` point for every ``src`` point.
+
+    Rows are processed in chunks so memory stays bounded at chunk_size x len(dst).
+    """
+    indices = np.empty(len(src), dtype=np.int64)
+    distances = np.empty(len(src), dtype=np.float64)
+    for start in range(0, len(src), chunk_size):
+        end = min(start + chunk_size, len(src))
+        matrix = _haversine_arrays(_Column(src, start, end), dst)
+        best = matrix.argmin(axis=1)
+        indices[start:end] = best
+        distances[start:end] = matrix[np.arange(end - start), best]
+    return indices, distances
+
+
+def _unit_vector(lat, lon):
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def _chord_sq(distance_km):
+    # Squared straight-line distance through the unit sphere for a great-circle distance
+    theta = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return (2 * math.sin(theta / 2)) ** 2
+
+
+class SpatialIndex:
+    """kd-tree over lat/lon points mapped onto the unit sphere.
+
+    Chord length between unit vectors is monotonic in great-circle distance, so plain
+    Euclidean kd-tree pruning gives exact nearest-neighbour and radius results.
+    """
+
+    def __init__(self, coords, leaf_size=16):
+        self._points = [_unit_vector(lat, lon) for lat, lon in coords]
+        self._order = list(range(len(self._points)))
+        # Flat node arrays: leaves have left == -1 and cover _order[start:end]
+        self._start, self._end = [], []
+        self._axis, self._split = [], []
+        self._left, self._right = [], []
+        self._leaf_size = leaf_size
+        if self._points:
+            self._build(0, len(self._order))
+
+    def __len__(self):
+        return len(self._points)
+
+    def _build(self, start, end):
+        node = len(self._start)
+        self._start.append(start)
+        self._end.append(end)
+        self._axis.append(0)
+        self._split.append(0.0)
+        self._left.append(-1)
+        self._right.append(-1)
+        if end - start <= self._leaf_size:
+            return node
+
+        ids = self._order[start:end]
+        # Split along the axis with the widest spread
+        spreads = []
+        for axis in range(3):
+            values = [self._points[i][axis] for i in ids]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+        if spreads[axis] == 0:
+            return node
+        ids.sort(key=lambda i: self._points[i][axis])
+        self._order[start:end] = ids
+        mid = start + (end - start) // 2
+
+        self._axis[node] = axis
+        self._split[node] = self._points[self._order[mid]][axis]
+        self._left[node] = self._build(start, mid)
+        self._right[node] = self._build(mid, end)
+        return node
+
+    def query(self, lat, lon, k=None, radius_km=None):
+        """Return (position, chord_sq) pairs sorted by distance.
+
+        ``k`` limits the number of results and ``radius_km`` limits their distance;
+        with neither, every point is returned.
+        """
+        if not self._points or (k is not None and k <= 0):
+            return []
+        q = _unit_vector(lat, lon)
+        limit = _chord_sq(radius_km) if radius_km is not None else math.inf
+        bound = limit
+        found = []  # max-heap of (-chord_sq, position) when k is set
+        stack = [(0, 0.0)]
+        while stack:
+            node, min_d2 = stack.pop()
+            if min_d2 > bound:
+                continue
+            if self._left[node] == -1:
+                for pos in self._order[self._start[node]:self._end[node]]:
+                    p = self._points[pos]
+                    d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+                    if d2 > bound:
+                        continue
+                    if k is None:
+                        found.append((-d2, pos))
+                    elif len(found) < k:
+                        heapq.heappush(found, (-d2, pos))
+                        if len(found) == k:
+                            bound = min(limit, -found[0][0])
+                    else:
+                        heapq.heapreplace(found, (-d2, pos))
+                        bound = min(limit, -found[0][0])
+                continue
+            diff = q[self._axis[node]] - self._split[node]
+            near, far = (self._left[node], self._right[node]) if diff < 0 else (self._right[node], self._left[node])
+            # Push the far side first so the near side is searched first
+            stack.append((far, max(min_d2, diff * diff)))
+            stack.append((near, min_d2))
+        return sorted(((pos, -neg) for neg, pos in found), key=lambda item: item[1])
+
+
+class FacilityIndex:
+    """Cached spatial index over a facility table.
+
+    ``loader`` returns a list of dicts with at least ``latitude`` and ``longitude``.
+    The index is rebuilt lazily on the first query after ``invalidate()``.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self.version += 1
+
+    def _ensure(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                rows = self._loader()
+                coords = [(r['latitude'], r['longitude']) for r in rows]
+                arrays = CoordinateArrays([c[0] for c in coords], [c[1] for c in coords])
+                self._snapshot = (rows, SpatialIndex(coords), arrays)
+            return self._snapshot
+
+    def rows(self):
+        return self._ensure()[0]
+
+    def nearest(self, lat, lon, k=None, radius_km=None):
+        rows, index, arrays = self._ensure()
+        if k is None and radius_km is None:
+            # Full ranking: one vectorized pass is cheaper than walking the whole tree
+            distances = _haversine_arrays(CoordinateArrays([lat], [lon]), arrays)
+            order = np.argsort(distances, kind='stable')
+            return [dict(rows[pos], distance=float(distances[pos])) for pos in order]
+        hits = index.query(lat, lon, k=k, radius_km=radius_km)
+        return [
+            dict(rows[pos], distance=haversine(lat, lon, rows[pos]['latitude'], rows[pos]['longitude']))
+            for pos in (hit[0] for hit in hits)
+        ]
+
+    def nearest_many(self, lats, lons):
+        """Nearest facility for each of many points; None where the table is empty."""
+        rows, _, arrays = self._ensure()
+        if not rows:
+            return [None] * len(lats)
+        indices, distances = nearest_many(CoordinateArrays(lats, lons), arrays)
+        return [dict(rows[i], distance=float(d)) for i, d in zip(indices.tolist(), distances.tolist())]
@@ -0,0 +1,132 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class IncidentFeed:
+    """Fan-out of request inserts and deletions to connected dashboards, across app processes.
+
+    Events are rows of a database table, written in the same transaction as the change, so
+    every worker and host sees all of them. ``loader(after, limit)`` returns up to ``limit``
+    events ``(id, type, data)`` with an id above ``after``, in id order (``after=None``: the
+    newest ``limit`` events). One poller thread per process reads new events every
+    ``poll_interval`` seconds, or as soon as ``notify()`` reports a local commit, into a
+    bounded ring buffer. Waiting clients block on one shared condition variable and never
+    touch the database.
+
+    The cursor is the id of the last event a client saw, so it stays valid on any worker
+    and across restarts. A cursor older than the buffer is reported as a gap and the
+    client should reload from the database instead.
+
+    Ids are handed out at insert time, so on PostgreSQL a lower id can commit after a
+    higher one. Events are only published in id order: a missing id holds back the ones
+    after it for up to ``gap_timeout`` seconds (it is skipped after that, e.g. for a rolled
+    back insert).
+    """
+
+    def __init__(self, loader, max_events=1000, poll_interval=1.0, gap_timeout=5.0, prune=None,
+                 prune_interval=60.0):
+        self._loader = loader
+        self._prune = prune
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.prune_interval = prune_interval
+        self._events = deque(maxlen=max_events)
+        self._seq = 0
+        self._start = 0  # events after this id are all in the buffer
+        self._gap_since = None
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # Loads the recent events synchronously, so cursors handed out right after are exact
+        with self._start_lock:
+            if self._started:
+                return
+            events = self._loader(None, self._events.maxlen)
+            with self._cond:
+                self._seq = events[-1][0] if events else 0
+                self._start = events[0][0] - 1 if events else self._seq
+                for event in events:
+                    self._events.append({'seq': event[0], 'type': event[1], 'data': event[2]})
+            threading.Thread(target=self._run, name='incident-feed', daemon=True).start()
+            self._started = True
+
+    def notify(self):
+        # A local commit wrote events; read them now instead of at the next interval
+        self._wake.set()
+
+    def _run(self):
+        pruned_at = time.monotonic()
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                while self._poll():
+                    pass
+                if self._prune is not None and time.monotonic() - pruned_at >= self.prune_interval:
+                    self._prune()
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error polling incident feed: {str(e)}")
+
+    def _poll(self):
+        # Publishes the next batch of events; True if there may be more right away
+        limit = self._events.maxlen
+        events = self._loader(self._seq, limit)
+        with self._cond:
+            published = 0
+            for event_id, kind, data in events:
+                if event_id != self._seq + 1:
+                    if self._gap_since is None:
+                        self._gap_since = time.monotonic()
+                    if time.monotonic() - self._gap_since < self.gap_timeout:
+                        break
+                self._gap_since = None
+                if len(self._events) == limit:
+                    self._start = self._events[0]['seq']
+                self._events.append({'seq': event_id, 'type': kind, 'data': data})
+                self._seq = event_id
+                published += 1
+            if published:
+                self._cond.notify_all()
+        return published == limit
+
+    def cursor(self, seq=None):
+        return str(self._seq if seq is None else seq)
+
+    def parse_cursor(self, cursor):
+        # The event id to resume after, or None if the cursor cannot be resumed
+        if not cursor:
+            return self._seq
+        if not cursor.isdigit():
+            return None
+        return int(cursor)
+
+    def _since(self, seq):
+        if seq is None or seq < self._start:
+            return None
+        # A cursor ahead of this process comes from a worker that polled first; it catches up
+        if seq > self._seq + self._events.maxlen:
+            return None
+        return [e for e in self._events if e['seq'] > seq]
+
+    def wait(self, seq, timeout):
+        """Events after ``seq``, blocking up to ``timeout`` seconds for the first one.
+
+        Returns None when ``seq`` cannot be resumed (see class docstring).
+        """
+        with self._cond:
+            if seq is not None and seq >= self._start:
+                self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return self._since(seq)
+
+
+def format_sse(event):
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
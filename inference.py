@@ -0,0 +1,220 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+
+from ml import EngineOverloaded  # noqa: F401  (re-exported for callers of this module)
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    __slots__ = ('tensor', 'future', 'enqueued_at')
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class InferenceStats:
+    # Rolling window of recent batches, used to tune batch size and wait window
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=window)
+        self._queue_waits = deque(maxlen=window * 4)
+        self._latencies = deque(maxlen=window)
+        self.total_batches = 0
+        self.total_items = 0
+        self.total_errors = 0
+
+    def record(self, batch_size, queue_waits, latency):
+        with self._lock:
+            self.total_batches += 1
+            self.total_items += batch_size
+            self._batch_sizes.append(batch_size)
+            self._queue_waits.extend(queue_waits)
+            self._latencies.append(latency)
+
+    def record_error(self):
+        with self._lock:
+            self.total_errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            waits = [w * 1000 for w in self._queue_waits]
+            latencies = [l * 1000 for l in self._latencies]
+            totals = (self.total_batches, self.total_items, self.total_errors)
+        return {
+            'total_batches': totals[0],
+            'total_items': totals[1],
+            'total_errors': totals[2],
+            'batch_size': {
+                'mean': sum(sizes) / len(sizes) if sizes else 0.0,
+                'max': max(sizes) if sizes else 0,
+            },
+            'queue_wait_ms': {
+                'p50': _percentile(waits, 50),
+                'p95': _percentile(waits, 95),
+                'max': max(waits) if waits else 0.0,
+            },
+            'batch_latency_ms': {
+                'p50': _percentile(latencies, 50),
+                'p95': _percentile(latencies, 95),
+                'max': max(latencies) if latencies else 0.0,
+            },
+        }
+
+
+class BatchInferenceEngine:
+    """Collects single-image requests into batches and runs one forward pass per batch.
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` images or the oldest
+    image has waited ``max_wait_ms``, whichever comes first. Callers get a Future that
+    resolves to the softmax probabilities for their image.
+    """
+
+    def __init__(self, forward_fn, device=None, max_batch_size=16, max_wait_ms=10,
+                 max_queue_size=256, name='model'):
+        self.forward_fn = forward_fn
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.stats = InferenceStats()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f'inference-{self.name}', daemon=True)
+        self._thread.start()
+        logger.info(f"Inference engine '{self.name}' started "
+                    f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.0f})")
+
+    def stop(self, timeout=5):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def pool_status(self):
+        # Per-process details for engines that run the model in worker processes
+        return None
+
+    def submit(self, tensor):
+        # tensor is a single preprocessed image of shape (C, H, W)
+        item = _PendingItem(tensor)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            raise EngineOverloaded(f"Inference queue for '{self.name}' is full")
+        return item.future
+
+    def predict(self, tensor, timeout=None):
+        future = self.submit(tensor)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def predict_many(self, tensors, timeout=None):
+        # Submitted back to back so they normally land in the same batch; returns (N, classes)
+        futures = []
+        try:
+            for tensor in tensors:
+                futures.append(self.submit(tensor))
+            deadline = None if timeout is None else time.monotonic() + timeout
+            return torch.stack([
+                f.result(None if deadline is None else max(deadline - time.monotonic(), 0)) for f in futures
+            ])
+        except (EngineOverloaded, TimeoutError):
+            for f in futures:
+                f.cancel()
+            raise
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # Window already elapsed; only take what is queued right now
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            self._run_batch(self._collect(first))
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        try:
+            # Stack before checking for cancellations so callers can reuse their input buffers
+            inputs = torch.stack([item.tensor for item in batch])
+        except Exception as e:
+            self.stats.record_error()
+            for item in batch:
+                if item.future.set_running_or_notify_cancel():
+                    item.future.set_exception(e)
+            return
+
+        live = [i for i, item in enumerate(batch) if item.future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        if len(live) < len(batch):
+            inputs = inputs[live]
+            batch = [batch[i] for i in live]
+
+        try:
+            if self.device is not None:
+                inputs = inputs.to(self.device)
+            with torch.inference_mode():
+                logits = self.forward_fn(inputs)
+                probabilities = torch.softmax(logits.float(), dim=1).cpu()
+        except Exception as e:
+            self.stats.record_error()
+            logger.error(f"Error in inference batch for '{self.name}': {str(e)}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        for i, item in enumerate(batch):
+            item.future.set_result(probabilities[i])
+        self.stats.record(len(batch), [started - item.enqueued_at for item in batch], finished - started)
+        logger.debug(f"Inference batch '{self.name}': size={len(batch)}, "
+                     f"latency_ms={(finished - started) * 1000:.1f}")
@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class IngestOverloaded(Exception):
+    pass
+
+
+def parse_coordinates(lat, lon, location):
+    # Explicit latitude/longitude fields win; otherwise a "lat, lon" location string is used
+    if lat and lon:
+        parts = (lat, lon)
+    elif location and location.count(',') == 1:
+        parts = location.split(',')
+    else:
+        return None, None
+    try:
+        lat, lon = float(parts[0].strip()), float(parts[1].strip())
+    except ValueError:
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, None
+    return lat, lon
+
+
+def parse_submission(form):
+    """Validate a /submit_request form into Request column values; raises ValueError."""
+    name = form.get('name')
+    phone = form.get('phone')
+    if not name or not phone:
+        raise ValueError('Name and phone are required')
+    request_type = form.get('request_type') or 'hospital'
+    if len(request_type) > 20:
+        raise ValueError('Invalid request_type')
+    location = form.get('location')
+    lat, lon = parse_coordinates(form.get('latitude'), form.get('longitude'), location)
+    return {
+        'name': name,
+        'phone': phone,
+        'snake_species': form.get('snakeSpecies') or 'Unknown',
+        'location': location or 'Not specified',
+        'request_type': request_type,
+        'latitude': lat,
+        'longitude': lon
+    }
+
+
+class _PendingRow:
+    __slots__ = ('values', 'future')
+
+    def __init__(self, values):
+        self.values = values
+        self.future = Future()
+
+
+class RequestIngestor:
+    """Group commit for incoming rows: one writer thread inserts queued rows a batch at a time.
+
+    ``write_batch`` receives a list of column dicts, inserts them in one transaction and
+    returns their ids. A submission's Future resolves to its id only after that
+    transaction has committed. If a batch fails, its rows are retried one at a time so a
+    bad row only fails its own submission.
+    """
+
+    def __init__(self, write_batch, max_batch_size=64, max_wait_ms=5, max_queue_size=1024, name='requests'):
+        self.write_batch = write_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.total_batches = 0
+        self.total_rows = 0
+        self.total_errors = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=f'ingest-{self.name}', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, values):
+        self.start()
+        pending = _PendingRow(values)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            raise IngestOverloaded(f"Ingest queue for '{self.name}' is full")
+        return pending.future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            # Submissions whose callers gave up (cancelled) before this point are never written
+            batch = [item for item in self._collect(first) if item.future.set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            ids = self.write_batch([item.values for item in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                logger.error(f"Error in ingest batch for '{self.name}', retrying rows one by one: {str(e)}")
+                for item in batch:
+                    self._write([item])
+                return
+            self.total_errors += 1
+            logger.error(f"Error in ingest for '{self.name}': {str(e)}")
+            batch[0].future.set_exception(e)
+            return
+        self.total_batches += 1
+        self.total_rows += len(batch)
+        for item, row_id in zip(batch, ids):
+            item.future.set_result(row_id)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'total_batches': self.total_batches,
+            'total_rows': self.total_rows,
+            'total_errors': self.total_errors,
+            'mean_batch_size': self.total_rows / self.total_batches if self.total_batches else 0.0
+        }
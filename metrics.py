@@ -0,0 +1,206 @@
+"""Minimal Prometheus-style metrics: counters, histograms and scrape-time gauges.
+
+Values live in the process that records them: under several gunicorn workers each worker
+reports only the requests it served.
+"""
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = collections.defaultdict(int)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}' for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = self.header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, [("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {series[-1]}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Read at scrape time: ``collect()`` returns ``{label values tuple: value}``."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, collect, labels=()):
+        super().__init__(name, help_text, labels)
+        self._collect = collect
+
+    def render(self):
+        items = sorted(self._collect().items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}'
+            for labels, value in items if value is not None
+        ]
+
+
+class CounterFunc(Gauge):
+    """A counter kept elsewhere (e.g. engine totals), read at scrape time."""
+
+    kind = 'counter'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    """Sampling profiler for slow requests, written as collapsed stacks for flame graphs.
+
+    ``start()`` registers the calling thread. A single background thread samples the
+    stacks of all registered threads every ``interval_ms``. ``stop(name)`` unregisters
+    the thread; if the request took at least ``threshold_ms`` its samples are written to
+    ``output_dir`` in the folded format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, output_dir, threshold_ms=500, interval_ms=5):
+        self.output_dir = output_dir
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self._lock = threading.Lock()
+        self._active = {}  # thread ident -> (started, Counter of folded stacks)
+        self._thread = None
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._sample_loop, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+
+    def start(self):
+        with self._lock:
+            self._ensure_sampler()
+            self._active[threading.get_ident()] = (time.perf_counter(), collections.Counter())
+
+    def stop(self, name):
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        if entry is None:
+            return None
+        started, samples = entry
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold or not samples:
+            return None
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{int(elapsed * 1000)}ms.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, (_, samples) in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[_fold(frame)] += 1
+
+
+def _fold(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
@@ -0,0 +1,264 @@
+"""Lazily loaded ML stack for the Flask app.
+
+Importing this module is cheap: torch, torchvision and timm are only imported when the
+stack is built, either synchronously by scripts or by ModelRuntime's warm-up thread.
+"""
+import logging
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZE = 384
+ARCH = 'efficientnetv2_s'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+# Defined here rather than in inference.py so callers can catch it without importing torch
+class EngineOverloaded(Exception):
+    pass
+
+
+def list_images(image_dir, limit=None):
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def build_transform():
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+
+
+def load_model(model_path, num_classes, device=None, mmap=False, arch=ARCH):
+    import torch
+    import timm
+
+    if device is None:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = timm.create_model(arch, pretrained=False, num_classes=num_classes)
+    if mmap and device.type == 'cpu':
+        # Parameters stay backed by the file, so processes loading the same weights share its pages
+        try:
+            state_dict = torch.load(model_path, map_location='cpu', mmap=True, weights_only=True)
+            model.load_state_dict(state_dict, strict=True, assign=True)
+            model.eval()
+            return model, device
+        except RuntimeError as e:
+            # Checkpoints in the legacy (non-zip) format cannot be memory-mapped
+            logger.warning(f"Loading {model_path} without mmap: {str(e)}")
+    state_dict = torch.load(model_path, map_location=device)
+    model.load_state_dict(state_dict, strict=True)
+    model.to(device)
+    model.eval()
+    return model, device
+
+
+def _file_identity(path):
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def load_versioned(path, load):
+    """``load()`` together with the version (a hash prefix) of the weights file it read.
+
+    The file is hashed before loading and checked after; if it was replaced meanwhile, it
+    is hashed and loaded again, so the version always describes the weights in memory.
+    """
+    from prediction_cache import file_fingerprint
+
+    for _ in range(3):
+        before = _file_identity(path)
+        version = file_fingerprint(path)[:16]
+        loaded = load()
+        if _file_identity(path) == before:
+            return loaded, version
+        logger.warning(f"{path} changed while it was loaded, loading it again")
+    raise RuntimeError(f"{path} kept changing while it was loaded")
+
+
+def build_forward(config, model, transform):
+    """The optimized serving backend from MODEL_BACKEND; the FP32 eager model stays the reference."""
+    from model_backends import build_backend, load_calibration_batches
+
+    if config['MODEL_BACKEND'] == 'eager':
+        return model
+    try:
+        calibration = None
+        if config['MODEL_CALIBRATION_DIR']:
+            calibration = load_calibration_batches(config['MODEL_CALIBRATION_DIR'], transform)
+        forward_fn = build_backend(
+            config['MODEL_BACKEND'],
+            model,
+            calibration=calibration,
+            onnx_path=config['MODEL_ONNX_PATH'],
+            source_path=config['MODEL_PATH']
+        )
+        logger.info(f"Using '{config['MODEL_BACKEND']}' model backend")
+        return forward_fn
+    except Exception as e:
+        logger.error(f"Error building '{config['MODEL_BACKEND']}' backend, falling back to eager: {str(e)}")
+        return model
+
+
+def load_student(config, num_classes):
+    """The distilled student model for tiered serving, or None when MODEL_STUDENT_PATH is unset.
+
+    The student always runs in-process on the CPU with the eager model; it is small enough
+    that worker processes and quantized backends are not worth it. A student that fails to
+    load is logged and left out, so tiered requests fall back to the full model.
+    """
+    import torch
+    from inference import BatchInferenceEngine
+    from preprocess import Preprocessor
+
+    if not config['MODEL_STUDENT_PATH']:
+        return None
+    try:
+        # Tiered results are cached per student version as well as per full-model version
+        (model, device), version = load_versioned(config['MODEL_STUDENT_PATH'], lambda: load_model(
+            config['MODEL_STUDENT_PATH'], num_classes, device=torch.device('cpu'), mmap=True,
+            arch=config['MODEL_STUDENT_ARCH']))
+    except Exception as e:
+        logger.error(f"Error loading student model, tiered mode will use the full model: {str(e)}")
+        return None
+    logger.info(f"Student model {config['MODEL_STUDENT_ARCH']} loaded successfully")
+    engine = BatchInferenceEngine(
+        model,
+        device=device,
+        max_batch_size=config['INFERENCE_MAX_BATCH_SIZE'],
+        max_wait_ms=config['INFERENCE_MAX_WAIT_MS'],
+        max_queue_size=config['INFERENCE_QUEUE_SIZE'],
+        name='student'
+    )
+    engine.start()
+    return SimpleNamespace(
+        model=model,
+        preprocessor=Preprocessor(size=config['MODEL_STUDENT_IMAGE_SIZE'], workers=config['PREPROCESS_WORKERS'],
+                                  max_pixels=config['PREDICT_MAX_PIXELS'], formats=config['PREDICT_IMAGE_FORMATS']),
+        engine=engine,
+        version=version
+    )
+
+
+def load_stack(config, num_classes):
+    """Build everything /predict needs: model, serving backend, preprocessing, batching engine and student.
+
+    ``version`` identifies what actually serves predictions: the hash of the weights that
+    were loaded and the backend in use (a backend that fails to build falls back to eager).
+    """
+    import torch
+    from preprocess import Preprocessor
+
+    transform = build_transform()
+    # Fast request-path preprocessing; matches transform within a small tolerance on JPEGs
+    preprocessor = Preprocessor(size=IMAGE_SIZE, workers=config['PREPROCESS_WORKERS'],
+                                max_pixels=config['PREDICT_MAX_PIXELS'], formats=config['PREDICT_IMAGE_FORMATS'])
+
+    if config['MODEL_WORKERS'] > 0:
+        # The model lives only in the worker processes
+        from model_pool import ProcessPoolEngine
+
+        model, device = None, torch.device('cpu')
+        engine = ProcessPoolEngine(
+            config,
+            num_classes,
+            workers=config['MODEL_WORKERS'],
+            threads=config['MODEL_WORKER_THREADS'],
+            pin_cores=config['MODEL_WORKER_PIN_CORES'],
+            max_batch_size=config['INFERENCE_MAX_BATCH_SIZE'],
+            max_wait_ms=config['INFERENCE_MAX_WAIT_MS'],
+            max_queue_size=config['INFERENCE_QUEUE_SIZE']
+        )
+    else:
+        from inference import BatchInferenceEngine
+
+        (model, device), weights = load_versioned(config['MODEL_PATH'], lambda: load_model(config['MODEL_PATH'],
+                                                                                           num_classes))
+        logger.info("EfficientNetV2-S model loaded successfully")
+        forward_fn = build_forward(config, model, transform)
+        backend = config['MODEL_BACKEND'] if forward_fn is not model else 'eager'
+        # Batched inference engine shared by all /predict requests
+        engine = BatchInferenceEngine(
+            forward_fn,
+            device=device if forward_fn is model else torch.device('cpu'),
+            max_batch_size=config['INFERENCE_MAX_BATCH_SIZE'],
+            max_wait_ms=config['INFERENCE_MAX_WAIT_MS'],
+            max_queue_size=config['INFERENCE_QUEUE_SIZE']
+        )
+    engine.start()
+    if config['MODEL_WORKERS'] > 0:
+        # Pool workers load the weights themselves and report what they loaded
+        weights, backend = engine.version
+    return SimpleNamespace(
+        model=model,
+        device=device,
+        transform=transform,
+        preprocessor=preprocessor,
+        engine=engine,
+        version=f'{weights}:{backend}',
+        student=load_student(config, num_classes)
+    )
+
+
+class ModelRuntime:
+    """Builds the ML stack once, in a background thread, and reports its state.
+
+    state is 'cold' until start() is called, then 'warming', then 'ready' or 'failed'.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stack = None
+        self.state = 'cold'
+        self.error = None
+        self.load_seconds = None
+
+    def start(self):
+        if self.state != 'cold':
+            return
+        with self._lock:
+            if self.state != 'cold':
+                return
+            self.state = 'warming'
+        threading.Thread(target=self._load, name='model-warmup', daemon=True).start()
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self._stack = self._loader()
+            self.state = 'ready'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f"Error loading model: {str(e)}")
+        finally:
+            self.load_seconds = time.perf_counter() - started
+            self._ready.set()
+        if self.state == 'ready':
+            logger.info(f"Model warm-up finished in {self.load_seconds:.1f}s")
+
+    def get(self):
+        # The loaded stack, or None while cold, warming or failed
+        return self._stack if self.state == 'ready' else None
+
+    def wait(self, timeout=None):
+        self.start()
+        self._ready.wait(timeout)
+        return self.get()
+
+    def status(self):
+        return {'state': self.state, 'load_seconds': self.load_seconds, 'error': self.error}
@@ -0,0 +1,107 @@
+import copy
+import logging
+import os
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from ml import list_images
+
+logger = logging.getLogger(__name__)
+
+# eager: FP32 as trained; int8_dynamic: quantized Linear layers only (the classifier head);
+# int8_static: FX graph-mode INT8 for convs too, needs calibration images;
+# torchscript: traced and frozen graph; compile: torch.compile; onnx: ONNX Runtime on CPU
+BACKENDS = ('eager', 'int8_dynamic', 'int8_static', 'torchscript', 'compile', 'onnx')
+
+def load_calibration_batches(image_dir, transform, batch_size=8, limit=64):
+    # Preprocessed batches of sample images for static quantization and parity checks
+    batches, current = [], []
+    for path in list_images(image_dir, limit):
+        try:
+            current.append(transform(Image.open(path).convert('RGB')))
+        except Exception as e:
+            logger.warning(f"Skipping calibration image {path}: {str(e)}")
+            continue
+        if len(current) == batch_size:
+            batches.append(torch.stack(current))
+            current = []
+    if current:
+        batches.append(torch.stack(current))
+    return batches
+
+
+def _int8_dynamic(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _int8_static(model, example, calibration):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if not calibration:
+        raise ValueError('int8_static needs calibration images (MODEL_CALIBRATION_DIR)')
+    torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    prepared = prepare_fx(model,
+                          get_default_qconfig_mapping(torch.backends.quantized.engine),
+                          example_inputs=(example,))
+    with torch.inference_mode():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def _torchscript(model, example):
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+def _onnx(model, example, onnx_path, source_path=None):
+    import onnxruntime as ort
+
+    stale = source_path and os.path.exists(onnx_path) and os.path.getmtime(onnx_path) < os.path.getmtime(source_path)
+    if stale or not os.path.exists(onnx_path):
+        os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+        torch.onnx.export(
+            model, example, onnx_path,
+            input_names=['input'], output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=17,
+            dynamo=False
+        )
+        logger.info(f"Exported ONNX model to {onnx_path}")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def forward(batch):
+        outputs = session.run(None, {'input': batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    return forward
+
+
+def build_backend(name, model, image_size=384, calibration=None, onnx_path=None, source_path=None):
+    """Return a callable mapping a (N, 3, H, W) batch to logits for the chosen backend.
+
+    Every backend wraps the same model, so class indices still map onto snake_classes.
+    ``source_path`` is the weights file; an ONNX export older than it is regenerated.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}', expected one of {', '.join(BACKENDS)}")
+    if name == 'eager':
+        return model.eval()
+    # Optimized backends are CPU-only and must not modify the reference model
+    model = copy.deepcopy(model).cpu().eval()
+    example = calibration[0][:1] if calibration else torch.randn(1, 3, image_size, image_size)
+    if name == 'int8_dynamic':
+        return _int8_dynamic(model)
+    if name == 'int8_static':
+        return _int8_static(model, example, calibration)
+    if name == 'torchscript':
+        return _torchscript(model, example)
+    if name == 'compile':
+        return torch.compile(model, dynamic=True)
+    return _onnx(model, example, onnx_path or 'models/efficientv2sv2.onnx', source_path)
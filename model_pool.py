@@ -0,0 +1,326 @@
+"""Model serving from a pool of worker processes.
+
+Each worker pins itself to its share of the CPU cores, sets torch's thread count to
+match and loads the weights memory-mapped, so every worker reads the same pages of the
+weights file through the OS page cache. Batches are exchanged through tensors in shared
+memory, one input and one output block per worker: the parent stacks the request
+tensors into the input block, the worker writes probabilities into the output block,
+and only the batch size and a status cross the pipe.
+
+Requests are micro-batched exactly as in BatchInferenceEngine. One dispatcher thread per
+worker takes the next batch from the shared queue whenever its worker is idle, so the
+bounded queue fills up (EngineOverloaded) once every worker is busy.
+"""
+import logging
+import os
+import threading
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+from inference import BatchInferenceEngine
+from ml import IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Worker settings copied from the app config; the rest of the config is not sent to workers
+WORKER_CONFIG_KEYS = ('MODEL_PATH', 'MODEL_BACKEND', 'MODEL_CALIBRATION_DIR', 'MODEL_ONNX_PATH')
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def core_sets(workers, cores=None):
+    """Split the usable cores into ``workers`` contiguous groups; workers share cores if there are too few."""
+    cores = sorted(os.sched_getaffinity(0) if cores is None else cores)
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    size, extra = divmod(len(cores), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _worker_main(config, num_classes, cores, threads, inputs, outputs, conn):
+    # A gevent-patched parent (gunicorn -k gevent) hands over a non-blocking pipe
+    os.set_blocking(conn.fileno(), True)
+    try:
+        if cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        torch.set_num_threads(threads)
+        from ml import build_forward, build_transform, load_model, load_versioned
+
+        model, weights = load_versioned(config['MODEL_PATH'], lambda: load_model(
+            config['MODEL_PATH'], num_classes, device=torch.device('cpu'), mmap=True)[0])
+        forward_fn = build_forward(config, model, build_transform())
+        conn.send(('ready', (weights, config['MODEL_BACKEND'] if forward_fn is not model else 'eager')))
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    while True:
+        try:
+            size = conn.recv()
+        except EOFError:
+            return
+        if size is None:
+            return
+        try:
+            with torch.inference_mode():
+                logits = forward_fn(inputs[:size])
+                outputs[:size] = torch.softmax(logits.float(), dim=1)
+            conn.send(('ok', None))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+class _Worker:
+    def __init__(self, index, config, num_classes, cores, threads, max_batch_size):
+        self.index = index
+        self.config = config
+        self.num_classes = num_classes
+        self.cores = cores
+        self.threads = threads
+        self.inputs = torch.empty(max_batch_size, 3, IMAGE_SIZE, IMAGE_SIZE).share_memory_()
+        self.outputs = torch.empty(max_batch_size, num_classes).share_memory_()
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self.retired = False
+
+    def launch(self):
+        ctx = mp.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.config, self.num_classes, self.cores, self.threads, self.inputs, self.outputs, child_conn),
+            name=f'model-worker-{self.index}',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        # Returns the (weights version, backend) the worker loaded
+        status, detail = self._reply(timeout)
+        if status != 'ready':
+            raise RuntimeError(f"Model worker {self.index} failed to load: {detail}")
+        logger.info(f"Model worker {self.index} ready (pid={self.process.pid}, cores={self.cores}, threads={self.threads})")
+        return tuple(detail)
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def run(self, size, timeout):
+        try:
+            self.conn.send(size)
+        except OSError:
+            raise WorkerCrashed(f"Model worker {self.index} is not running")
+        status, error = self._reply(timeout)
+        if status != 'ok':
+            raise RuntimeError(f"Model worker {self.index}: {error}")
+
+    def _reply(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.conn.poll(0.1):
+            if not self.process.is_alive():
+                raise WorkerCrashed(f"Model worker {self.index} exited with code {self.process.exitcode}")
+            if time.monotonic() > deadline:
+                # A worker stuck past the deadline is treated like a crash and replaced
+                self.process.kill()
+                self.process.join()
+                raise WorkerCrashed(f"Model worker {self.index} did not answer within {timeout:.0f}s")
+        try:
+            return self.conn.recv()
+        except EOFError:
+            self.process.join(1)
+            raise WorkerCrashed(f"Model worker {self.index} exited with code {self.process.exitcode}")
+
+    def shutdown(self, timeout=5):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout)
+        self.conn.close()
+
+
+class ProcessPoolEngine(BatchInferenceEngine):
+    """BatchInferenceEngine whose batches run in ``workers`` model processes.
+
+    ``threads`` is the torch thread count per worker (0: the size of its core group).
+    A worker that crashes or hangs is restarted, with a growing delay if it keeps failing
+    to load, and the batch it was running is retried once on the new process. Only a batch
+    that takes down the restarted worker too fails its requests.
+
+    ``version`` is the (weights version, backend) every worker loaded at start. A restarted
+    worker that finds other weights on disk is retired instead, so one pool never mixes
+    models (and cached results stay tied to the weights that produced them): its batch
+    fails at once and the remaining workers take the queue. Once every worker is retired,
+    batches fail straight away until the app is restarted.
+    """
+
+    def __init__(self, config, num_classes, workers=2, threads=0, pin_cores=True, max_batch_size=16,
+                 max_wait_ms=10, max_queue_size=256, batch_timeout=60, start_timeout=300, name='model-pool'):
+        super().__init__(None, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                         max_queue_size=max_queue_size, name=name)
+        config = {key: config[key] for key in WORKER_CONFIG_KEYS}
+        groups = core_sets(workers)
+        self.workers = [
+            _Worker(i, config, num_classes, groups[i] if pin_cores else None, threads or len(groups[i]), max_batch_size)
+            for i in range(workers)
+        ]
+        self.batch_timeout = batch_timeout
+        self.start_timeout = start_timeout
+        self.version = None
+        self._threads = []
+
+    def start(self):
+        if self._running:
+            return
+        # Workers load in parallel; start() returns once all of them are ready
+        for worker in self.workers:
+            worker.launch()
+        try:
+            versions = {worker.wait_ready(self.start_timeout) for worker in self.workers}
+            if len(versions) > 1:
+                raise RuntimeError(f"Model workers loaded different weights or backends: {sorted(versions)}")
+            self.version = versions.pop()
+        except Exception:
+            for worker in self.workers:
+                worker.shutdown()
+            raise
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run_worker, args=(worker,), name=f'{self.name}-{worker.index}', daemon=True)
+            for worker in self.workers
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Inference engine '{self.name}' started with {len(self.workers)} worker processes "
+                    f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.0f})")
+
+    def stop(self, timeout=5):
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        for worker in self.workers:
+            worker.shutdown(timeout)
+
+    def pool_status(self):
+        return [
+            {
+                'worker': worker.index,
+                'pid': worker.process.pid if worker.process else None,
+                'alive': worker.alive(),
+                'cores': worker.cores,
+                'threads': worker.threads,
+                'restarts': worker.restarts,
+                'retired': worker.retired
+            }
+            for worker in self.workers
+        ]
+
+    def _run_worker(self, worker):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            if worker.retired:
+                # Only the last dispatcher stays once every worker is retired; it fails what is queued
+                self.stats.record_error()
+                for item in self._collect(first):
+                    if item.future.set_running_or_notify_cancel():
+                        item.future.set_exception(WorkerCrashed(
+                            "No model worker is running; restart the app to serve the new weights"))
+                continue
+            self._dispatch(worker, self._collect(first))
+            if self._running and not worker.alive() and not worker.retired:
+                try:
+                    self._restart(worker)
+                except WorkerCrashed as e:
+                    logger.error(str(e))
+            if worker.retired and any(not other.retired for other in self.workers):
+                return
+
+    def _restart(self, worker):
+        # Raises WorkerCrashed, and retires the worker, if it loads weights the pool does not serve
+        delay = 1.0
+        while self._running:
+            worker.restarts += 1
+            logger.error(f"Restarting model worker {worker.index} (restart #{worker.restarts})")
+            worker.shutdown(1)
+            worker.launch()
+            try:
+                version = worker.wait_ready(self.start_timeout)
+            except Exception as e:
+                logger.error(f"Error restarting model worker {worker.index}: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            if version != self.version:
+                # Retrying cannot help until the app restarts with the new weights
+                worker.shutdown(1)
+                worker.retired = True
+                raise WorkerCrashed(f"Model worker {worker.index} retired: it loaded {version}, the pool serves "
+                                    f"{self.version}; restart the app to serve the new weights")
+            return
+
+    def _run_on_worker(self, worker, size):
+        try:
+            worker.run(size, self.batch_timeout)
+        except WorkerCrashed as e:
+            # Workers only read the input block, so the batch is still staged for the new process
+            logger.error(f"Error in inference batch for '{self.name}', retrying on a restarted worker: {str(e)}")
+            self._restart(worker)
+            if not worker.alive():
+                raise
+            worker.run(size, self.batch_timeout)
+        return worker.outputs[:size].clone()
+
+    def _dispatch(self, worker, batch):
+        started = time.monotonic()
+        size = len(batch)
+        try:
+            # Copied before checking for cancellations so callers can reuse their input buffers
+            torch.stack([item.tensor for item in batch], out=worker.inputs[:size])
+        except Exception as e:
+            self.stats.record_error()
+            for item in batch:
+                if item.future.set_running_or_notify_cancel():
+                    item.future.set_exception(e)
+            return
+
+        live = [i for i, item in enumerate(batch) if item.future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        if len(live) < size:
+            worker.inputs[:len(live)] = worker.inputs[live]
+            batch = [batch[i] for i in live]
+
+        try:
+            probabilities = self._run_on_worker(worker, len(batch))
+        except Exception as e:
+            self.stats.record_error()
+            logger.error(f"Error in inference batch for '{self.name}': {str(e)}")
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        for i, item in enumerate(batch):
+            item.future.set_result(probabilities[i])
+        self.stats.record(len(batch), [started - item.enqueued_at for item in batch], finished - started)
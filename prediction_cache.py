@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_ENTRY_OVERHEAD = 200  # rough per-entry bookkeeping cost in bytes
+_PURGE_INTERVAL = 60  # seconds between deletes of expired disk entries; get() never returns them anyway
+
+
+def content_key(data):
+    # data is bytes or a seekable binary file, hashed from the start in chunks
+    if isinstance(data, (bytes, bytearray)):
+        return 'sha256:' + hashlib.sha256(data).hexdigest()
+    data.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: data.read(1 << 20), b''):
+        digest.update(chunk)
+    return 'sha256:' + digest.hexdigest()
+
+
+def perceptual_key(img):
+    # 64-bit difference hash: survives re-encoding and resizing, not crops or edits
+    small = img.convert('L').resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f'dhash:{bits:016x}'
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """LRU + TTL cache of prediction results, bounded by entry count and bytes.
+
+    Entries are tied to the version of the model that serves predictions (set with
+    ``set_model_version`` once it is loaded); a new version drops every cached result,
+    and nothing is cached or returned until a version is set. With ``disk_path`` set,
+    results are also kept in a SQLite file so they survive restarts.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=24 * 3600, disk_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._bytes = 0
+        self._next_purge = 0.0
+        self.model_version = None
+        self.counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'model_version TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL, '
+                'payload TEXT NOT NULL, PRIMARY KEY (model_version, key))'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS ix_predictions_expires_at ON predictions (expires_at)')
+            self._db.commit()
+
+    def set_model_version(self, version):
+        # Results of any other version, in memory or on disk, are dropped
+        with self._lock:
+            if version == self.model_version:
+                return
+            if self.model_version is not None:
+                logger.info("Model changed, invalidating prediction cache")
+                self.counters['invalidations'] += 1
+            self.model_version = version
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM predictions WHERE model_version != ?', (version,))
+                self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            if self.model_version is None:
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return entry[2]
+                self._drop(key)
+                self.counters['expirations'] += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT expires_at, payload FROM predictions WHERE model_version = ? AND key = ?',
+                    (self.model_version, key)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    result = json.loads(row[1])
+                    self._store(key, result, row[0], len(row[1]))
+                    self.counters['disk_hits'] += 1
+                    return result
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, result):
+        payload = json.dumps(result)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            if self.model_version is None:
+                return
+            self._store(key, result, expires_at, len(payload))
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO predictions (model_version, key, expires_at, payload) VALUES (?, ?, ?, ?)',
+                    (self.model_version, key, expires_at, payload)
+                )
+                now = time.time()
+                if now >= self._next_purge:
+                    self._db.execute('DELETE FROM predictions WHERE expires_at <= ?', (now,))
+                    self._next_purge = now + _PURGE_INTERVAL
+                self._db.commit()
+
+    def _store(self, key, result, expires_at, payload_size):
+        size = payload_size + len(key) + _ENTRY_OVERHEAD
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, size, result)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.counters['evictions'] += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM predictions')
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['disk_enabled'] = self._db is not None
+        return stats
@@ -0,0 +1,81 @@
+"""Prediction modes for /predict.
+
+fast      one forward pass on the standard view (the default)
+tta       the standard view plus TTA_EXTRA_VIEWS augmented views, averaged
+adaptive  one pass, then the augmented views only when the answer is uncertain: top-1
+          confidence below ``threshold``, or below ``danger_threshold`` while the top-1
+          and top-2 species differ in danger level (a near-zero runner-up does not count)
+tiered    the distilled student model (MODEL_STUDENT_PATH) first, on its own smaller view;
+          the full model only when the student's confidence is below ``threshold`` or it
+          predicts a species that is not known to be non-venomous
+
+Augmented views are a horizontal flip of the standard view, plus crops of a slightly
+larger decode: the centre crop, its flip and the four corners. All views of an image
+are submitted to the inference engine together, so they normally share one batch.
+"""
+from uploads import reopen
+
+MODES = ('fast', 'tta', 'adaptive', 'tiered')
+CROP_SCALE = 0.875  # crop side relative to the larger decode
+TTA_EXTRA_VIEWS = 7
+
+
+def extra_views(preprocessor, data, view):
+    """The augmented views of an image as one (TTA_EXTRA_VIEWS, 3, S, S) tensor.
+
+    ``view`` is the standard (already normalized) view; ``data`` the raw upload (bytes or
+    a seekable file), decoded again at size / CROP_SCALE for the crops.
+    """
+    import torch
+
+    size = preprocessor.size
+    large = preprocessor.to_tensor(preprocessor.decode(reopen(data), size=round(size / CROP_SCALE)))
+    margin = large.shape[-1] - size
+    centre = large[:, margin // 2:margin // 2 + size, margin // 2:margin // 2 + size]
+    corners = [large[:, top:top + size, left:left + size] for top in (0, margin) for left in (0, margin)]
+    return torch.stack([view.flip(-1), centre, centre.flip(-1)] + corners)
+
+
+def should_escalate(probabilities, threshold, danger_threshold, danger_levels):
+    """True when one view is not enough: low top-1 confidence or a danger-level disagreement in the top 2."""
+    confidences, indices = probabilities.topk(2)
+    top = confidences[0].item()
+    if top < threshold:
+        return True
+    return top < danger_threshold and danger_levels[indices[0].item()] != danger_levels[indices[1].item()]
+
+
+def should_defer(probabilities, threshold, danger_levels):
+    """True when the student's answer needs the full model: low confidence, or anything but non-venomous."""
+    confidence, index = probabilities.max(0)
+    return confidence.item() < threshold or danger_levels[index.item()] != 'Non-venomous'
+
+
+def views_used(path):
+    # Forward passes behind an answer; 'teacher' counts the student's pass as well
+    return {'single': 1, 'student': 1, 'teacher': 2}.get(path, 1 + TTA_EXTRA_VIEWS)
+
+
+def classify(engine, preprocessor, data, view, mode, threshold, danger_threshold, danger_levels, timeout=None,
+             student=None):
+    """Class probabilities for one image and the path taken: 'single', 'tta', 'escalated', 'student' or 'teacher'.
+
+    In tiered mode ``view`` is the student's view (from ``student.preprocessor``) and the
+    full model's view is only decoded if the teacher is needed.
+    """
+    # torch only once a prediction is made, so importing the app stays light
+    import torch
+
+    if mode == 'tiered':
+        probabilities = student.engine.predict(view, timeout=timeout)
+        if not should_defer(probabilities, threshold, danger_levels):
+            return probabilities, 'student'
+        return engine.predict(preprocessor(reopen(data)), timeout=timeout), 'teacher'
+    if mode == 'tta':
+        views = torch.cat([view.unsqueeze(0), extra_views(preprocessor, data, view)])
+        return engine.predict_many(views, timeout=timeout).mean(0), 'tta'
+    probabilities = engine.predict(view, timeout=timeout)
+    if mode == 'adaptive' and should_escalate(probabilities, threshold, danger_threshold, danger_levels):
+        extra = engine.predict_many(extra_views(preprocessor, data, view), timeout=timeout)
+        return torch.cat([probabilities.unsqueeze(0), extra]).mean(0), 'escalated'
+    return probabilities, 'single'
@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image, UnidentifiedImageError
+
+from uploads import ImageRejected, check_image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class Preprocessor:
+    """Decode-and-normalize pipeline equivalent to Resize((size, size)) + ToTensor + Normalize.
+
+    JPEGs are decoded in draft mode, so libjpeg scales the DCT by 1/2, 1/4 or 1/8 while
+    keeping both sides at least ``size``. The image is then resized once, straight to
+    ``size`` x ``size``. Normalization is a single fused multiply-subtract into a float
+    tensor, which can be caller-provided or a per-thread reusable buffer.
+
+    Output matches the torchvision ``transform`` exactly for non-JPEG input. For JPEG
+    input the reduced-size decode gives a mean absolute difference below 0.02 in
+    normalized units (checked by ``benchmarks/preprocess.py``).
+
+    ``max_pixels`` and ``formats`` guard the decode: images in other formats, or whose
+    (reduced) decode would exceed ``max_pixels``, raise ImageRejected before any pixel
+    data is read.
+    """
+
+    def __init__(self, size=384, mean=IMAGENET_MEAN, std=IMAGENET_STD, workers=4, draft=True, max_pixels=0,
+                 formats=None):
+        self.size = size
+        self.draft = draft
+        self.workers = workers
+        self.max_pixels = max_pixels
+        self.formats = formats
+        std = torch.tensor(std, dtype=torch.float32).view(3, 1, 1)
+        mean = torch.tensor(mean, dtype=torch.float32).view(3, 1, 1)
+        self._scale = 1.0 / (255.0 * std)
+        self._shift = mean / std
+        self._local = threading.local()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def decode(self, fp, size=None):
+        # size overrides self.size, e.g. for a larger decode to take crops from
+        size = size or self.size
+        try:
+            img = Image.open(fp, formats=self.formats)
+        except UnidentifiedImageError:
+            if self.formats:
+                raise ImageRejected(f"Unsupported image format, expected one of {', '.join(self.formats)}", 415)
+            raise
+        except Image.DecompressionBombError as e:
+            raise ImageRejected(str(e), 413)
+        # MPO is the multi-picture JPEG some phone cameras write
+        if self.draft and img.format in ('JPEG', 'MPO'):
+            img.draft('RGB', (size, size))
+        check_image(img, self.max_pixels)
+        img = img.convert('RGB')
+        if img.size != (size, size):
+            img = img.resize((size, size), Image.BILINEAR)
+        return img
+
+    def to_tensor(self, img, out=None):
+        if out is None:
+            out = torch.empty(3, img.height, img.width, dtype=torch.float32)
+        pixels = torch.from_numpy(np.array(img, dtype=np.uint8))
+        out.copy_(pixels.permute(2, 0, 1))
+        return out.mul_(self._scale).sub_(self._shift)
+
+    def buffer(self):
+        # Per-thread input tensor, reused across requests handled by the same thread
+        buf = getattr(self._local, 'buffer', None)
+        if buf is None:
+            buf = self._local.buffer = torch.empty(3, self.size, self.size, dtype=torch.float32)
+        return buf
+
+    def __call__(self, fp, out=None):
+        return self.to_tensor(self.decode(fp), out)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='preprocess')
+        return self._pool
+
+    def submit(self, fp):
+        # Decode and normalize one image in the pool; returns a Future of a fresh tensor
+        return self._executor().submit(self, fp)
+
+    def preprocess_batch(self, sources, out=None):
+        """Decode many images in the thread pool into one (N, 3, size, size) tensor.
+
+        Returns ``(batch, errors)`` where ``errors[i]`` is the exception raised for
+        ``sources[i]`` (its slot in ``batch`` is left unnormalized) or None.
+        """
+        if out is None:
+            out = torch.empty(len(sources), 3, self.size, self.size, dtype=torch.float32)
+        errors = [None] * len(sources)
+
+        def work(i):
+            try:
+                self(sources[i], out=out[i])
+            except Exception as e:
+                errors[i] = e
+
+        list(self._executor().map(work, range(len(sources))))
+        return out, errors
@@ -0,0 +1,48 @@
+"""Rebuild the hotspot aggregates (RequestCellStat, RequestDailyStat) from the Request table.
+
+    python rebuild_analytics.py
+    python rebuild_analytics.py --check
+    ANALYTICS_PRECISIONS=4,5,6,7 python rebuild_analytics.py
+
+The app keeps the aggregates current as requests are added or deleted, so this is only
+needed after changing ANALYTICS_PRECISIONS or ANALYTICS_REGION_PRECISION, or after rows
+were changed outside the app (bulk SQL, manual edits). The rebuild runs in one
+transaction, so readers see the old aggregates until it commits. --check only compares
+the stored aggregates with recomputed ones and exits with status 1 if they differ.
+"""
+import argparse
+import sys
+
+from app import app, db, compute_request_stats, rebuild_request_stats, RequestCellStat, RequestDailyStat
+
+
+def stored_counts(model, keys):
+    columns = [getattr(model, key) for key in keys]
+    return {tuple(row[:-1]): row[-1] for row in db.session.query(*columns, model.count).filter(model.count != 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='Compare only; do not write')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not args.check:
+            print(f"Rebuilt hotspot aggregates from {rebuild_request_stats(args.batch_size)} requests")
+            return
+        cells, days, total = compute_request_stats(args.batch_size)
+        differences = 0
+        for model, keys, expected in ((RequestCellStat, ('period', 'precision', 'species', 'cell'), cells),
+                                      (RequestDailyStat, ('species', 'region', 'day'), days)):
+            stored = stored_counts(model, keys)
+            expected = {key: count for key, count in expected.items() if count}
+            wrong = {key for key in stored.keys() | expected.keys() if stored.get(key, 0) != expected.get(key, 0)}
+            differences += len(wrong)
+            print(f"{model.__tablename__}: {len(expected)} rows expected, {len(wrong)} differ")
+        print(f"Checked against {total} requests")
+        sys.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Travel-time ranking over an offline road graph.
+
+The graph is a CSR adjacency structure saved by ``build_road_graph.py``: node
+coordinates, ``indptr``/``indices`` for the outgoing edges of each node, and per-edge
+travel time (seconds) and length (metres).
+"""
+import heapq
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, haversine_np
+
+logger = logging.getLogger(__name__)
+
+GRID_CELL_DEG = 0.01
+
+
+def _ring_min_km(lat, ring, edge_y, edge_x):
+    # Lower bound on the great-circle distance from the point to any cell of the ring
+    if ring == 0:
+        return 0.0
+    dlat = math.radians((ring - 1 + edge_y) * GRID_CELL_DEG)
+    dlon = math.radians((ring - 1 + edge_x) * GRID_CELL_DEG)
+    # Longitude degrees shrink towards the poles; use the ring's highest latitude
+    cos_max = math.cos(math.radians(min(abs(lat) + (ring + 1) * GRID_CELL_DEG, 90.0)))
+    return EARTH_RADIUS_KM * min(dlat, 2 * math.asin(min(1.0, cos_max * math.sin(dlon / 2))))
+
+
+class RoadGraph:
+    def __init__(self, lat, lon, indptr, indices, time_s, length_m):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        # Python lists: Dijkstra touches edges one at a time, where list indexing beats NumPy
+        self._indptr = np.asarray(indptr).tolist()
+        self._indices = np.asarray(indices).tolist()
+        self._time = np.asarray(time_s, dtype=np.float64).tolist()
+        self._length = np.asarray(length_m, dtype=np.float64).tolist()
+        self._build_grid()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            graph = cls(data['lat'], data['lon'], data['indptr'], data['indices'], data['time_s'], data['length_m'])
+        logger.info(f"Road graph loaded from {path}: {len(graph)} nodes, {len(graph._indices)} edges")
+        return graph
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _build_grid(self):
+        # Nodes bucketed by GRID_CELL_DEG cells, sorted by cell id for range lookups
+        self._lat0 = float(self.lat.min()) if len(self) else 0.0
+        self._lon0 = float(self.lon.min()) if len(self) else 0.0
+        rows = ((self.lat - self._lat0) // GRID_CELL_DEG).astype(np.int64)
+        cols = ((self.lon - self._lon0) // GRID_CELL_DEG).astype(np.int64)
+        self._cols = int(cols.max()) + 1 if len(self) else 1
+        self._rows = int(rows.max()) + 1 if len(self) else 1
+        cells = rows * self._cols + cols
+        self._grid_order = np.argsort(cells, kind='stable')
+        self._grid_cells = cells[self._grid_order]
+
+    def _cell_nodes(self, row, col_lo, col_hi):
+        lo = np.searchsorted(self._grid_cells, row * self._cols + col_lo, side='left')
+        hi = np.searchsorted(self._grid_cells, row * self._cols + col_hi, side='right')
+        return self._grid_order[lo:hi]
+
+    def nearest_node(self, lat, lon, max_rings=50):
+        """Closest graph node to a point as ``(node, distance_km)``, or None if none is near.
+
+        Rings of grid cells are searched outwards until the nearest possible point of the
+        next ring is farther than the best node found, so the result is exact (within
+        ``max_rings``) even where a cell is much narrower east-west than north-south.
+        """
+        if not len(self):
+            return None
+        y = (lat - self._lat0) / GRID_CELL_DEG
+        x = (lon - self._lon0) / GRID_CELL_DEG
+        row, col = math.floor(y), math.floor(x)
+        # Distance from the point to the nearest edge of its own cell, in cells
+        edge_y, edge_x = min(y - row, row + 1 - y), min(x - col, col + 1 - x)
+        best = None
+        for ring in range(max_rings + 1):
+            if best is not None and _ring_min_km(lat, ring, edge_y, edge_x) > best[1]:
+                break
+            candidates = []
+            for r in range(row - ring, row + ring + 1):
+                if r < 0 or r >= self._rows:
+                    continue
+                if abs(r - row) == ring:
+                    spans = [(col - ring, col + ring)]
+                else:
+                    spans = [(col - ring, col - ring), (col + ring, col + ring)]
+                for lo, hi in spans:
+                    lo, hi = max(lo, 0), min(hi, self._cols - 1)
+                    if lo <= hi:
+                        candidates.append(self._cell_nodes(r, lo, hi))
+            nodes = np.concatenate(candidates) if candidates else []
+            if len(nodes):
+                distances = haversine_np(lat, lon, self.lat[nodes], self.lon[nodes])
+                i = int(distances.argmin())
+                if best is None or distances[i] < best[1]:
+                    best = (int(nodes[i]), float(distances[i]))
+        return best
+
+    def shortest_paths(self, origin, targets, max_seconds=math.inf):
+        """Multi-target Dijkstra on travel time.
+
+        Returns ``{target: (seconds, metres)}`` for every target reachable within
+        ``max_seconds``; stops as soon as all targets are settled.
+        """
+        indptr, indices, times, lengths = self._indptr, self._indices, self._time, self._length
+        remaining = set(targets)
+        best = {origin: 0.0}
+        metres = {origin: 0.0}
+        found = {}
+        heap = [(0.0, origin)]
+        while heap and remaining:
+            t, node = heapq.heappop(heap)
+            if t > best[node]:
+                continue
+            if t > max_seconds:
+                break
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = (t, metres[node])
+            for e in range(indptr[node], indptr[node + 1]):
+                nxt = indices[e]
+                nt = t + times[e]
+                if nt < best.get(nxt, math.inf):
+                    best[nxt] = nt
+                    metres[nxt] = metres[node] + lengths[e]
+                    heapq.heappush(heap, (nt, nxt))
+        return found
+
+
+class RoadRouter:
+    """Ranks facilities by travel time from a point over a RoadGraph.
+
+    Facilities are snapped to their nearest graph node once and remembered. For each
+    origin node and facility set, the Dijkstra results for every facility are kept in an
+    LRU cache, so repeated queries from the same area skip the graph search. Getting
+    from a point to its snapped node (and from a node to the facility) is costed as a
+    straight line at ``access_speed_kmh``.
+    """
+
+    def __init__(self, graph, max_minutes=240, access_speed_kmh=15, cache_size=1024):
+        self.graph = graph
+        self.max_seconds = max_minutes * 60
+        self.access_speed = access_speed_kmh / 3.6  # metres per second
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._snapped = {}
+        self._trees = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _snap(self, lat, lon):
+        key = (lat, lon)
+        snapped = self._snapped.get(key)
+        if snapped is None:
+            snapped = self._snapped[key] = self.graph.nearest_node(lat, lon)
+        return snapped
+
+    def _targets(self, rows):
+        targets = {}
+        for row in rows:
+            snapped = self._snap(row['latitude'], row['longitude'])
+            if snapped is not None:
+                targets.setdefault(snapped[0], []).append(row['id'])
+        return targets
+
+    def travel_times(self, facility_key, rows, lat, lon):
+        """``{row id: (seconds, metres)}`` for the facilities in ``rows`` reachable from the point.
+
+        ``facility_key`` identifies this exact set of rows (e.g. table and version) for caching.
+        """
+        origin = self.graph.nearest_node(lat, lon)
+        if origin is None:
+            return {}
+        origin_node, origin_km = origin
+        key = (facility_key, origin_node)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None:
+                self._trees.move_to_end(key)
+                self.hits += 1
+        if tree is None:
+            targets = self._targets(rows)
+            found = self.graph.shortest_paths(origin_node, targets, self.max_seconds)
+            tree = {}
+            for node, (seconds, metres) in found.items():
+                for row_id in targets[node]:
+                    tree[row_id] = (seconds, metres)
+            with self._lock:
+                self.misses += 1
+                self._trees[key] = tree
+                while len(self._trees) > self.cache_size:
+                    self._trees.popitem(last=False)
+
+        access_m = origin_km * 1000
+        results = {}
+        for row in rows:
+            hit = tree.get(row['id'])
+            if hit is None:
+                continue
+            egress_m = self._snap(row['latitude'], row['longitude'])[1] * 1000
+            seconds = hit[0] + (access_m + egress_m) / self.access_speed
+            results[row['id']] = (seconds, hit[1] + access_m + egress_m)
+        return results
+
+    def rank(self, facility_key, rows, lat, lon):
+        """``rows`` (dicts with id/latitude/longitude/distance) sorted by travel time.
+
+        Each row gains ``travel_time_min`` and ``road_distance_km``; facilities that cannot
+        be reached within the time limit get None and follow in straight-line order.
+        """
+        times = self.travel_times(facility_key, rows, lat, lon)
+        ranked = []
+        for row in rows:
+            hit = times.get(row['id'])
+            ranked.append(dict(
+                row,
+                travel_time_min=hit[0] / 60 if hit else None,
+                road_distance_km=hit[1] / 1000 if hit else None
+            ))
+        ranked.sort(key=lambda r: (r['travel_time_min'] is None, r['travel_time_min'] or 0.0, r.get('distance', 0.0)))
+        return ranked
+
+    def stats(self):
+        with self._lock:
+            return {
+                'nodes': len(self.graph),
+                'cached_trees': len(self._trees),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,102 @@
+"""Database connection settings and data migration between storage backends.
+
+SQLite (the default) suits a single app process. PostgreSQL, through a pooled engine,
+lets several gunicorn workers or hosts share one store.
+"""
+import logging
+
+from sqlalchemy import create_engine, func, select, text
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_database_url(url):
+    # Hosting providers still hand out postgres:// URLs, which SQLAlchemy 1.4+ rejects
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured backend."""
+    url = config['SQLALCHEMY_DATABASE_URI']
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if url.startswith('sqlite'):
+        # Connections to a local file are cheap; SQLAlchemy's default pool is kept
+        return options
+    options.update(
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+        pool_recycle=config['DB_POOL_RECYCLE']
+    )
+    if url.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def copy_tables(metadata, source_url, target_engine, batch_size=1000, exclude=()):
+    """Copy every table in ``metadata`` from ``source_url`` into ``target_engine``, keeping ids.
+
+    Tables are copied parent-first in a single target transaction, so a failure leaves the
+    target untouched. The target tables must be empty. Tables named in ``exclude`` (e.g.
+    derived aggregates) are skipped. Returns ``{table_name: rows_copied}``.
+    """
+    source_engine = create_engine(source_url)
+    counts = {}
+    try:
+        with source_engine.connect() as source, target_engine.begin() as target:
+            for table in metadata.sorted_tables:
+                if table.name in exclude:
+                    continue
+                if target.execute(select(func.count()).select_from(table)).scalar():
+                    raise ValueError(f"Target table '{table.name}' is not empty")
+                result = source.execution_options(yield_per=batch_size).execute(select(table))
+                copied = 0
+                for rows in result.mappings().partitions():
+                    target.execute(table.insert(), [dict(row) for row in rows])
+                    copied += len(rows)
+                counts[table.name] = copied
+                if target_engine.dialect.name == 'postgresql':
+                    _reset_sequence(target, table)
+                logger.info(f"Copied {copied} rows into '{table.name}'")
+    finally:
+        source_engine.dispose()
+    return counts
+
+
+def _reset_sequence(connection, table):
+    # Explicit ids were inserted, so move the serial sequence past them
+    if 'id' not in table.c:
+        return
+    quoted = connection.dialect.identifier_preparer.quote(table.name)
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {quoted}"
+    ), {'table': quoted})
+
+
+def add_counts(connection, table, key_columns, increments):
+    """Add ``{key tuple: delta}`` to the ``count`` column of ``table``, inserting missing keys.
+
+    One INSERT ... ON CONFLICT DO UPDATE per batch on SQLite and PostgreSQL; other
+    backends fall back to an UPDATE, then an INSERT when no row matched.
+    """
+    rows = [dict(zip(key_columns, key), count=delta) for key, delta in increments.items() if delta]
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=list(key_columns),
+                                          set_={'count': table.c['count'] + stmt.excluded['count']})
+        connection.execute(stmt, rows)
+        return
+    for row in rows:
+        match = [table.c[column] == row[column] for column in key_columns]
+        updated = connection.execute(table.update().where(*match).values(count=table.c['count'] + row['count']))
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
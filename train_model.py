@@ -0,0 +1,314 @@
+"""Train the snake classifier from a folder-per-species dataset, without the notebook.
+
+    python train_model.py /data/Snake_Dataset
+    python train_model.py /data/Snake_Dataset --init models/efficientv2sv2.pth --epochs 5 --lr 1e-4 \
+        --output models/efficientv2s_finetuned.pth
+
+Folders must be named after the species in app.SNAKE_INFO; labels follow app.snake_classes,
+so the checkpoint loads straight into app.py (point MODEL_PATH at it). An existing
+--output, such as the served weights, is only overwritten with --force. The architecture
+is the one app.py builds (efficientnetv2_s). By default it starts from timm's ImageNet-21k
+weights for tf_efficientnetv2_s, as the notebook did; --init continues from a saved
+checkpoint instead.
+
+The train/val split is a per-species index (split.json in --cache-dir) over the original
+files, so nothing is copied. Every image is decoded and resized once into one uint8
+shard per split (memory-mapped .npy). Epochs read from the shards, so no JPEG is decoded
+again until the dataset or --img-size changes. Augmentation (flips, rotation, colour
+jitter) runs on uint8 tensors in persistent DataLoader workers. Normalization happens
+per batch. Validation uses no augmentation.
+
+Each epoch logs images/sec and the share of time spent waiting for data; if that share
+is high, raise --workers or --prefetch.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+from app import snake_classes
+from ml import ARCH, IMAGE_SIZE, list_images
+from preprocess import IMAGENET_MEAN, IMAGENET_STD, Preprocessor
+
+DEFAULT_PRETRAINED = 'tf_efficientnetv2_s.in21k'
+
+
+def build_split(data_dir, val_ratio, seed):
+    """``{'train': [(relpath, label), ...], 'val': [...]}``, stratified by species."""
+    by_label = {}
+    unknown = set()
+    for path in list_images(data_dir):
+        relpath = os.path.relpath(path, data_dir)
+        species = relpath.split(os.sep)[0]
+        if species not in snake_classes:
+            unknown.add(species)
+            continue
+        by_label.setdefault(snake_classes.index(species), []).append(relpath)
+    if unknown:
+        raise ValueError(f"Folders not in SNAKE_INFO: {', '.join(sorted(unknown))}")
+    missing = [species for i, species in enumerate(snake_classes) if i not in by_label]
+    if missing:
+        print(f"Warning: no images for {', '.join(missing)}", flush=True)
+
+    rng = random.Random(seed)
+    split = {'train': [], 'val': []}
+    for label, relpaths in sorted(by_label.items()):
+        rng.shuffle(relpaths)
+        n_val = max(1, round(len(relpaths) * val_ratio)) if len(relpaths) > 1 else 0
+        split['val'] += [(p, label) for p in sorted(relpaths[:n_val])]
+        split['train'] += [(p, label) for p in sorted(relpaths[n_val:])]
+    return split
+
+
+def _fingerprint(data_dir, entries, img_size):
+    # Changes when a file is added, removed, replaced or the cache resolution changes
+    digest = hashlib.sha256(str(img_size).encode())
+    for relpath, label in entries:
+        stat = os.stat(os.path.join(data_dir, relpath))
+        digest.update(f'{relpath}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def _decode(job):
+    path, img_size = job
+    try:
+        return np.asarray(Preprocessor(size=img_size).decode(path), dtype=np.uint8), None
+    except Exception as e:
+        return np.zeros((img_size, img_size, 3), dtype=np.uint8), f'{path}: {e}'
+
+
+def build_shard(data_dir, entries, img_size, cache_dir, name, workers):
+    """Decode ``entries`` once into ``<name>.npy`` (N, S, S, 3) uint8; reused while the fingerprint matches."""
+    images_path = os.path.join(cache_dir, f'{name}.npy')
+    meta_path = os.path.join(cache_dir, f'{name}.json')
+    fingerprint = _fingerprint(data_dir, entries, img_size)
+    if os.path.exists(meta_path) and os.path.exists(images_path):
+        with open(meta_path) as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                return images_path, np.array([label for _, label in entries], dtype=np.int64)
+
+    started = time.perf_counter()
+    images = np.lib.format.open_memmap(images_path + '.tmp', mode='w+', dtype=np.uint8,
+                                       shape=(len(entries), img_size, img_size, 3))
+    jobs = [(os.path.join(data_dir, relpath), img_size) for relpath, _ in entries]
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers or 1) as pool:
+        for i, (pixels, error) in enumerate(pool.map(_decode, jobs, chunksize=16)):
+            images[i] = pixels
+            if error:
+                errors.append(error)
+    images.flush()
+    del images
+    os.replace(images_path + '.tmp', images_path)
+    with open(meta_path, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'count': len(entries), 'img_size': img_size, 'errors': errors}, f)
+    for error in errors:
+        print(f"Warning: could not decode {error}", flush=True)
+    print(f"Cached {len(entries)} {name} images in {time.perf_counter() - started:.1f}s", flush=True)
+    return images_path, np.array([label for _, label in entries], dtype=np.int64)
+
+
+class ShardDataset(Dataset):
+    """uint8 CHW images from a shard; the memmap is opened lazily so each worker maps it itself."""
+
+    def __init__(self, images_path, labels, augment):
+        self.images_path = images_path
+        self.labels = labels
+        self.augment = augment
+        self._images = None
+        self._transform = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+            if self.augment:
+                from torchvision.transforms import v2
+
+                # The notebook's train_transform, minus Resize (done once in the shard)
+                self._transform = v2.Compose([
+                    v2.RandomHorizontalFlip(),
+                    v2.RandomVerticalFlip(),
+                    v2.RandomRotation(15),
+                    v2.ColorJitter(brightness=0.3, contrast=0.3, saturation=0.3)
+                ])
+        image = torch.from_numpy(np.array(self._images[index])).permute(2, 0, 1)
+        if self._transform is not None:
+            image = self._transform(image)
+        return image, self.labels[index]
+
+
+def make_loader(dataset, args, shuffle):
+    return DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        shuffle=shuffle,
+        drop_last=shuffle and len(dataset) > args.batch_size,
+        num_workers=args.workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=args.workers > 0,
+        prefetch_factor=args.prefetch if args.workers > 0 else None
+    )
+
+
+def build_model(init, num_classes, arch=ARCH):
+    import timm
+
+    model = timm.create_model(arch, pretrained=False, num_classes=num_classes)
+    if init and os.path.exists(init):
+        model.load_state_dict(torch.load(init, map_location='cpu', weights_only=True), strict=True)
+        print(f"Initialized from checkpoint {init}", flush=True)
+    elif init:
+        # Backbone weights from a pretrained timm model; the classifier head starts fresh
+        source = timm.create_model(init, pretrained=True).state_dict()
+        target = model.state_dict()
+        matched = {k: v for k, v in source.items() if k in target and v.shape == target[k].shape}
+        model.load_state_dict(matched, strict=False)
+        print(f"Initialized {len(matched)}/{len(target)} tensors from timm '{init}'", flush=True)
+    return model
+
+
+def amp_dtype(device, mode):
+    if mode == 'off':
+        return None
+    if device.type == 'cuda':
+        return torch.float16
+    # bfloat16 on CPU only pays off with native support (AVX-512 BF16 / AMX)
+    if mode == 'on' or torch.backends.cpu.get_cpu_capability() in ('AVX512', 'AMX'):
+        return torch.bfloat16
+    return None
+
+
+def run_epoch(model, loader, device, normalize, args, dtype, optimizer=None, scheduler=None, scaler=None,
+              epoch=0):
+    training = optimizer is not None
+    model.train(training)
+    memory_format = torch.channels_last if args.channels_last else torch.contiguous_format
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.1 if training else 0.0)
+    total_loss = correct = seen = 0
+    wait = 0.0
+    started = fetched = time.perf_counter()
+    steps = len(loader)
+    with torch.set_grad_enabled(training):
+        for step, (images, labels) in enumerate(loader):
+            wait += time.perf_counter() - fetched
+            images = images.to(device, non_blocking=True).float()
+            images = normalize(images).contiguous(memory_format=memory_format)
+            labels = labels.to(device, non_blocking=True)
+            with torch.autocast(device.type, dtype=dtype, enabled=dtype is not None):
+                outputs = model(images)
+                loss = criterion(outputs.float(), labels)
+            if training:
+                optimizer.zero_grad(set_to_none=True)
+                scaler.scale(loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
+                scheduler.step(epoch + (step + 1) / steps)
+            total_loss += loss.item() * len(labels)
+            correct += (outputs.argmax(dim=1) == labels).sum().item()
+            seen += len(labels)
+            if args.limit_batches and step + 1 >= args.limit_batches:
+                break
+            fetched = time.perf_counter()
+    elapsed = time.perf_counter() - started
+    return {
+        'loss': total_loss / seen if seen else 0.0,
+        'accuracy': correct / seen if seen else 0.0,
+        'images_per_second': seen / elapsed if elapsed else 0.0,
+        'data_wait': wait / elapsed if elapsed else 0.0
+    }
+
+
+def save_checkpoint(model, path, summary):
+    # Plain contiguous FP32 state_dict, as ml.load_model (and its mmap path) expects
+    state = {k: v.detach().to('cpu', torch.float32 if v.is_floating_point() else v.dtype).contiguous()
+             for k, v in model.state_dict().items()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('data_dir', help='One sub-folder of images per species')
+    parser.add_argument('--output', default='models/efficientv2s_trained.pth')
+    parser.add_argument('--force', action='store_true', help='Overwrite --output if it already exists')
+    parser.add_argument('--cache-dir', default='instance/train_cache')
+    parser.add_argument('--init', default=DEFAULT_PRETRAINED, help='Checkpoint path or timm pretrained model name')
+    parser.add_argument('--img-size', type=int, default=IMAGE_SIZE)
+    parser.add_argument('--val-ratio', type=float, default=0.15)
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=3e-4)
+    parser.add_argument('--weight-decay', type=float, default=1e-4)
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument('--prefetch', type=int, default=4, help='Batches each worker prepares ahead')
+    parser.add_argument('--channels-last', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--amp', choices=['auto', 'on', 'off'], default='auto',
+                        help='auto: FP16 on CUDA, BF16 on CPUs with native support')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--limit-batches', type=int, default=0, help='Stop each epoch after this many batches')
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        parser.error(f'{args.output} already exists (it may be the weights the app serves); '
+                     'choose another --output or pass --force')
+
+    torch.manual_seed(args.seed)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    os.makedirs(args.cache_dir, exist_ok=True)
+    split = build_split(args.data_dir, args.val_ratio, args.seed)
+    with open(os.path.join(args.cache_dir, 'split.json'), 'w') as f:
+        json.dump({'data_dir': os.path.abspath(args.data_dir), 'classes': snake_classes, **split}, f)
+    print(f"{len(split['train'])} training and {len(split['val'])} validation images", flush=True)
+
+    train_shard = build_shard(args.data_dir, split['train'], args.img_size, args.cache_dir, 'train', args.workers)
+    val_shard = build_shard(args.data_dir, split['val'], args.img_size, args.cache_dir, 'val', args.workers)
+    train_loader = make_loader(ShardDataset(*train_shard, augment=True), args, shuffle=True)
+    val_loader = make_loader(ShardDataset(*val_shard, augment=False), args, shuffle=False)
+
+    model = build_model(args.init, len(snake_classes)).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    dtype = amp_dtype(device, args.amp)
+    mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1) * 255
+    std = torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1) * 255
+    normalize = lambda images: images.sub_(mean).div_(std)  # noqa: E731
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingWarmRestarts(optimizer, T_0=5, T_mult=2)
+    # Loss scaling is only needed for FP16
+    scaler = torch.amp.GradScaler(device.type, enabled=dtype == torch.float16)
+    print(f"Training on {device} (amp={dtype}, channels_last={args.channels_last}, workers={args.workers})", flush=True)
+
+    best = None
+    history = []
+    for epoch in range(args.epochs):
+        train = run_epoch(model, train_loader, device, normalize, args, dtype, optimizer, scheduler, scaler, epoch)
+        val = run_epoch(model, val_loader, device, normalize, args, dtype) if len(val_loader.dataset) else None
+        history.append({'epoch': epoch + 1, 'train': train, 'val': val})
+        val_text = f", val acc {val['accuracy']:.2%}" if val else ''
+        print(f"Epoch {epoch + 1}/{args.epochs}: loss {train['loss']:.4f}, train acc {train['accuracy']:.2%}{val_text}, "
+              f"{train['images_per_second']:.1f} images/sec ({train['data_wait']:.0%} waiting for data)", flush=True)
+        score = val['accuracy'] if val else train['accuracy']
+        if best is None or score > best:
+            best = score
+            save_checkpoint(model, args.output, {
+                'arch': ARCH, 'classes': snake_classes, 'img_size': args.img_size, 'epoch': epoch + 1,
+                'val_accuracy': val['accuracy'] if val else None, 'history': history
+            })
+            print(f"Saved {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
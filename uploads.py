@@ -0,0 +1,55 @@
+"""Size-bounded handling of image uploads.
+
+A request body over its endpoint's byte cap is refused before it is read, or as soon as
+the cap is crossed when no Content-Length is sent (413). Multipart file parts are kept in
+memory up to UPLOAD_SPOOL_BYTES and spooled to a temporary file beyond that. Images are
+checked from their header, before any pixel is decoded: the format must be one of the
+accepted ones and the decode must fit the pixel budget. JPEGs are decoded at reduced
+scale, so a large JPEG only counts at the size it is actually decoded to.
+"""
+import io
+from tempfile import SpooledTemporaryFile
+
+from flask import Request, current_app
+
+
+class ImageRejected(ValueError):
+    """An image that is not decoded; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        # <ENDPOINT>_MAX_UPLOAD_BYTES caps that endpoint's body (0: no cap); others use MAX_CONTENT_LENGTH
+        if current_app and self.endpoint:
+            key = f'{self.endpoint.upper()}_MAX_UPLOAD_BYTES'
+            if key in current_app.config:
+                return current_app.config[key] or None
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_BYTES'], mode='rb+')
+
+
+def check_image(img, max_pixels):
+    """Raise ImageRejected if opened-but-not-loaded ``img`` would decode to more than ``max_pixels``."""
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageRejected(f'Image is too large to process ({width}x{height} pixels)', 413)
+
+
+def reopen(source):
+    # A readable file at the start of the upload: bytes are wrapped, seekable files rewound
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def parse_formats(value):
+    # 'JPEG, png' -> ['JPEG', 'PNG']; empty means any format Pillow can read
+    return [name.strip().upper() for name in value.split(',') if name.strip()] or None